@@ -1,39 +1,55 @@
-from guardrails.hub import ProfanityFree
+import os
+import time
+import asyncio
+from typing import Optional
+from core.profanity import PROFANITY_SCREEN
 from core.states import FullState
-from .utils import BaseAgent
+from .utils import BaseAgent, get_thread_id
 from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.runnables import RunnableConfig
 from pprint import pprint
 
-# Set up the ProfanityFree validator
-profanity_validator = ProfanityFree(on_fail="exception")
+# Per-thread debug dumps of the state
+STATE_DUMP_DIR = "src/agents/outputs/states/"
 
 class AlignmentAgent(BaseAgent):
     def __init__(self):
         super().__init__(name='Alignment Agent')
-        self.validator = profanity_validator
+        # Fast local screen; the Guardrails ProfanityFree validator is only loaded and run when it is unsure
+        self.screen = PROFANITY_SCREEN
 
-    def __call__(self, state: FullState) -> FullState:
+    def __call__(self, state: FullState, config: Optional[RunnableConfig] = None) -> FullState:
         """
-        Validates the latest user message in state.full_history using Guardrails AI.
+        Validates the latest user message in state.full_history (local profanity screen, then Guardrails AI if unsure).
         Accepts and returns the global FullState, updating only the relevant namespaces.
         """
         print("\n--- Running Alignment Agent ---")
 
         if state.full_history and isinstance(state.full_history[-1], HumanMessage):
             user_message = state.full_history[-1].content
-            try:
-                result = self.validator(user_message)
-                print(f"Input: {user_message!r} | Valid: True")
+            started = time.perf_counter()
+            valid = self.screen.is_clean(user_message)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if valid:
+                print(f"Input: {user_message!r} | Valid: True | {elapsed_ms:.1f} ms")
                 state.input_status = "valid_input"
                 # Also append to story if valid
                 state.narrative.story.append(state.full_history[-1])
-            except Exception as e:
-                print(f"Input: {user_message!r} | Valid: False | Exception: {e}")
+            else:
+                print(f"Input: {user_message!r} | Valid: False | {elapsed_ms:.1f} ms")
                 state.full_history.append(AIMessage(content="Sorry, your input was not appropriate. Please try again."))
                 state.input_status = "invalid_input"
         else:
             state.input_status = "valid_input"
 
-        # Save the state to a file for debugging purposes
-        state.save_to_file("state.json")
+        # Save the state to a file for debugging purposes, one file per thread so sessions don't overwrite each other
+        os.makedirs(STATE_DUMP_DIR, exist_ok=True)
+        state.save_to_file(os.path.join(STATE_DUMP_DIR, f"{get_thread_id(config) or 'state'}.json"))
         return state
+
+    async def acall(self, state: FullState, config: Optional[RunnableConfig] = None) -> FullState:
+        """
+        Async variant of __call__. Validation is local CPU work, so it runs in a worker thread
+        to keep the event loop free.
+        """
+        return await asyncio.to_thread(self.__call__, state, config)
@@ -1,13 +1,21 @@
 import os
-import json
+import sys
 
 from langchain_ollama import ChatOllama
 from langchain_google_genai import ChatGoogleGenerativeAI
 
+from typing import Optional
+
 from pydantic import BaseModel
-from .utils import BaseAgent
+from langchain_core.runnables import RunnableConfig
+from .utils import BaseAgent, get_thread_id
 from .prompts import ASSESSMENT_PROMPTS
+from core.config import Config
+from core.assessment_export import ASSESSMENT_EXPORTS
 from core.states import FullState, AssessmentState
+from core.usage import usage_label
+from core.runnables import schema_json, structured_output
+from core.prescoring import PRESCORE_STATS
 from core.challenges import BaseChallenge, Pairing, ChallengeTriplet
 from core.assessments import BaseAssessmentSubtask, BaseAssessmentExtractSchema, BaseAssessmentEvalSchema
 
@@ -16,20 +24,12 @@ from core.assessments import BaseAssessmentSubtask, BaseAssessmentExtractSchema,
 
 class AssessmentAgent(BaseAgent):
 
-    def __init__(self, model):
+    def __init__(self, model, mode: str = Config.ASSESSMENT_MODE):
         super().__init__(name="Assessment Agent")
 
         self.model = model
-        self.item_total_scores = []
-        self.basal_move_backwards = False
-        self.ceiling_stop_subtask = False
-
-        self.state: AssessmentState = {
-            "basal": False,
-            "ceiling": False,
-            "score_summary": {},
-            "assessment_history": []
-        }
+        # "two_pass" (extraction, then evaluation) or "single_pass" (both in one model call)
+        self.mode = mode
 
         self.prompt_template = """
             You are an expert educational evaluator in an interactive storytelling game.
@@ -52,7 +52,7 @@ class AssessmentAgent(BaseAgent):
 
 
     
-    def __call__(self, fullstate: FullState) -> FullState:
+    def __call__(self, fullstate: FullState, config: Optional[RunnableConfig] = None) -> FullState:
         """
         Main callable interface for the Assessment Agent.
         Evaluates student response to a subtask challenge.
@@ -60,12 +60,65 @@ class AssessmentAgent(BaseAgent):
         Args:
             state (FullState): The current state dictionary containing student response, expected answer, scoring history,
                                 and other agent context.
+            config (RunnableConfig): The run's config; its thread id selects the session's export directory.
 
         Returns:
             fullstate (FullState): The updated state including evaluation results, score for the
                                     current item, and updated flags (e.g., basal, response mode).
         """
 
+        subtask_handler, raw_student_response, challenge_item = self.get_assessment_inputs(fullstate)
+
+        print("\n--- Running Assessment Agent ---")
+
+        # todo: handle exception case if these don't exist
+        if self.mode == "single_pass":
+            evaluated_student_answer = self.assess_student_answers(subtask_handler, raw_student_response, challenge_item)
+        else:
+            extracted_student_answer = self.extract_student_answers(subtask_handler, raw_student_response)
+            evaluated_student_answer = self.evaluate_student_answers(subtask_handler, extracted_student_answer, challenge_item)
+
+        return self.record_item(fullstate, subtask_handler, evaluated_student_answer, get_thread_id(config), challenge_item)
+
+
+
+    async def acall(self, fullstate: FullState, config: Optional[RunnableConfig] = None) -> FullState:
+        """
+        Async variant of __call__: the model calls are awaited.
+
+        Args:
+            fullstate (FullState): The current state.
+            config (RunnableConfig): The run's config.
+
+        Returns:
+            fullstate (FullState): The updated state.
+        """
+
+        subtask_handler, raw_student_response, challenge_item = self.get_assessment_inputs(fullstate)
+
+        print("\n--- Running Assessment Agent (async) ---")
+
+        if self.mode == "single_pass":
+            evaluated_student_answer = await self.aassess_student_answers(subtask_handler, raw_student_response, challenge_item)
+        else:
+            extracted_student_answer = await self.aextract_student_answers(subtask_handler, raw_student_response)
+            evaluated_student_answer = await self.aevaluate_student_answers(subtask_handler, extracted_student_answer, challenge_item)
+
+        return self.record_item(fullstate, subtask_handler, evaluated_student_answer, get_thread_id(config), challenge_item)
+
+
+
+    def get_assessment_inputs(self, fullstate: FullState):
+        """
+        Collects the subtask handler, the student's raw response and the current challenge item from the state.
+
+        Args:
+            fullstate (FullState): The current state.
+
+        Returns:
+            tuple: (subtask_handler, raw_student_response, challenge_item)
+        """
+
         challenge_index = fullstate.narrative.challenge_index
 
         subtask_key = fullstate.challenge.challenge_type 
@@ -74,19 +127,120 @@ class AssessmentAgent(BaseAgent):
         raw_student_response = fullstate.student_response
         challenge_item = fullstate.challenge.challenge_history[challenge_index]
 
-        print("\n--- Running Assessment Agent ---")
+        return subtask_handler, raw_student_response, challenge_item
 
-        # todo: handle exception case if these don't exist
-        extracted_student_answer = self.extract_student_answers(subtask_handler, raw_student_response)
-        evaluated_student_answer = self.evaluate_student_answers(subtask_handler, extracted_student_answer, challenge_item)
 
-        self.basal_move_backwards = self.check_basal_rule(subtask_handler)
-        self.ceiling_stop_subtask = self.check_ceiling_rule(subtask_handler)
 
-        self.store_assessment(subtask_handler, evaluated_student_answer)
-        fullstate.assessment = self.state
+    @usage_label("assessment")
+    def assess_student_answers(self, subtask_handler: BaseAssessmentSubtask, raw_student_response: str, challenge_item: BaseChallenge) -> BaseAssessmentEvalSchema:
+        """
+        Single-pass assessment: extracts and evaluates the student's answers in one model call, then applies
+        the subtask's answer filtering locally.
+
+        Args:
+            subtask_handler (BaseAssessmentSubtask): The handler for the current subtask.
+            raw_student_response (str): Transcription of the student's raw response to the given challenge.
+            challenge_item (BaseChallenge): The ground-truth challenge data for the current subtask item
+
+        Returns:
+            evaluated_student_answers (BaseAssessmentEvalSchema): Evaluations of the student's (filtered) answers
+        """
+
+        assessment_prompt_str = self.build_assessment_prompt(subtask_handler, raw_student_response, challenge_item)
+
+        assessment_structured_llm = structured_output(self.model, subtask_handler.assessment_schema)
+        assessed_student_answers = assessment_structured_llm.invoke(assessment_prompt_str)
+
+        return subtask_handler.filter_assessed_answers(assessed_student_answers, raw_student_response)
+
 
-        fullstate.assessment_feedback = self.generate_feedback()
+
+    @usage_label("assessment")
+    async def aassess_student_answers(self, subtask_handler: BaseAssessmentSubtask, raw_student_response: str, challenge_item: BaseChallenge) -> BaseAssessmentEvalSchema:
+        """
+        Async variant of assess_student_answers.
+        """
+
+        assessment_prompt_str = self.build_assessment_prompt(subtask_handler, raw_student_response, challenge_item)
+
+        assessment_structured_llm = structured_output(self.model, subtask_handler.assessment_schema)
+        assessed_student_answers = await assessment_structured_llm.ainvoke(assessment_prompt_str)
+
+        return subtask_handler.filter_assessed_answers(assessed_student_answers, raw_student_response)
+
+
+
+    def build_assessment_prompt(self, subtask_handler: BaseAssessmentSubtask, raw_student_response: str, challenge_item: BaseChallenge) -> str:
+        """
+        Formats the single-pass assessment prompt for the student's raw response and the expected challenge answers.
+        """
+
+        formatted_input = subtask_handler.format_assessment_input(raw_student_response, challenge_item)
+
+        return self.prompt_template.format(
+            subtask_description = ASSESSMENT_PROMPTS[subtask_handler.type_key]["description"],
+            subtask_instructions = ASSESSMENT_PROMPTS[subtask_handler.type_key]["assessment"],
+            input = formatted_input,
+            schema = self.get_schema_block(subtask_handler, "assessment")
+        )
+
+
+
+    def compare_modes(self, subtask_key: str, items: list) -> dict:
+        """
+        Assesses the same answers in both modes and measures how well single-pass agrees with two-pass.
+
+        Args:
+            subtask_key (str): Unique identifier of the subtask
+            items (list): (challenge_item, raw_student_response) pairs
+
+        Returns:
+            dict: Per-item agreement figures ("items") and their aggregate rates
+        """
+
+        subtask_handler = self.get_subtask(subtask_key)
+        results = []
+
+        for challenge_item, raw_student_response in items:
+            extracted = self.extract_student_answers(subtask_handler, raw_student_response)
+            two_pass = self.evaluate_student_answers(subtask_handler, extracted, challenge_item)
+            single_pass = self.assess_student_answers(subtask_handler, raw_student_response, challenge_item)
+            results.append(subtask_handler.compare_evaluations(two_pass, single_pass))
+
+        n = len(results) or 1
+        return {
+            "items": results,
+            "item_score_agreement": sum(r["item_score_match"] for r in results) / n,
+            "pair_set_agreement": sum(r["same_pairs"] for r in results) / n,
+            "mean_pair_agreement": sum(r["pair_agreement"] for r in results) / n,
+        }
+
+
+
+    def record_item(self, fullstate: FullState, subtask_handler: BaseAssessmentSubtask, evaluated_student_answer: BaseAssessmentEvalSchema, thread_id: Optional[str] = None, challenge_item: Optional[BaseChallenge] = None) -> FullState:
+        """
+        Scores the evaluated item, applies the basal and ceiling rules and stores the results in the session's state.
+
+        Args:
+            fullstate (FullState): The current state.
+            subtask_handler (BaseAssessmentSubtask): The handler for the current subtask.
+            evaluated_student_answer (BaseAssessmentEvalSchema): The evaluated answers for the current item.
+            thread_id (str): The session's thread id, under which the results are exported.
+            challenge_item (BaseChallenge): The assessed challenge item, stored with the results.
+
+        Returns:
+            fullstate (FullState): The updated state.
+        """
+
+        assessment = fullstate.assessment
+        assessment.item_total_scores.append(subtask_handler.update_score(evaluated_student_answer))
+
+        assessment.basal = self.check_basal_rule(subtask_handler, assessment.item_total_scores)
+        assessment.ceiling = self.check_ceiling_rule(subtask_handler, assessment.item_total_scores)
+
+        self.store_assessment(subtask_handler, assessment, evaluated_student_answer, thread_id, challenge_item)
+
+        fullstate.assessment_feedback = self.generate_feedback(assessment)
 
         return fullstate
 
@@ -110,6 +264,7 @@ class AssessmentAgent(BaseAgent):
 
 
 
+    @usage_label("extraction")
     def extract_student_answers(self, subtask_handler: BaseAssessmentSubtask, raw_student_response: str) -> BaseAssessmentExtractSchema:
         """
         Extracts the subtask answers from the student's raw response.
@@ -123,24 +278,49 @@ class AssessmentAgent(BaseAgent):
 
         """
 
+        extraction_prompt_str = self.build_extraction_prompt(subtask_handler, raw_student_response)
+
+        extraction_structured_llm = structured_output(self.model, subtask_handler.extraction_schema)
+        extracted_student_answer = extraction_structured_llm.invoke(extraction_prompt_str)
+
+        extracted_student_answer = subtask_handler.filter_extracted_answers(extracted_student_answer, raw_student_response)
+
+        return extracted_student_answer
+
+
+
+    @usage_label("extraction")
+    async def aextract_student_answers(self, subtask_handler: BaseAssessmentSubtask, raw_student_response: str) -> BaseAssessmentExtractSchema:
+        """
+        Async variant of extract_student_answers.
+        """
+
+        extraction_prompt_str = self.build_extraction_prompt(subtask_handler, raw_student_response)
+
+        extraction_structured_llm = structured_output(self.model, subtask_handler.extraction_schema)
+        extracted_student_answer = await extraction_structured_llm.ainvoke(extraction_prompt_str)
+
+        return subtask_handler.filter_extracted_answers(extracted_student_answer, raw_student_response)
+
+
+
+    def build_extraction_prompt(self, subtask_handler: BaseAssessmentSubtask, raw_student_response: str) -> str:
+        """
+        Formats the extraction prompt for the student's raw response.
+        """
+
         formatted_input = subtask_handler.format_extraction_input(raw_student_response)
 
-        extraction_prompt_str = self.prompt_template.format(
+        return self.prompt_template.format(
             subtask_description = ASSESSMENT_PROMPTS[subtask_handler.type_key]["description"],
             subtask_instructions = ASSESSMENT_PROMPTS[subtask_handler.type_key]["extraction"],
             input = formatted_input,
             schema = self.get_schema_block(subtask_handler, "extraction")
         )
 
-        extraction_structured_llm = self.model.with_structured_output(subtask_handler.extraction_schema)
-        extracted_student_answer = extraction_structured_llm.invoke(extraction_prompt_str)
-
-        extracted_student_answer = subtask_handler.filter_extracted_answers(extracted_student_answer, raw_student_response)
-
-        return extracted_student_answer
-
 
 
+    @usage_label("evaluation")
     def evaluate_student_answers(self, subtask_handler: BaseAssessmentSubtask, extracted_student_answers: BaseAssessmentExtractSchema, challenge_item: BaseChallenge) -> BaseAssessmentEvalSchema:
         """
         Evaluates student's answers to the given subtask challenge.
@@ -154,127 +334,197 @@ class AssessmentAgent(BaseAgent):
             evaluated_student_answers (BaseAssessmentEvalSchema): List of evaluations for each challenge item
         """
 
+        settled, pending_answers = self.prescore_answers(subtask_handler, extracted_student_answers, challenge_item)
+        if not settled:
+            pending_answers = extracted_student_answers
+
+        eval_structured_llm = structured_output(self.model, subtask_handler.evaluation_schema)
+
+        model_evaluations = None
+        if pending_answers is not None:
+            eval_prompt_str = self.build_evaluation_prompt(subtask_handler, pending_answers, challenge_item)
+            model_evaluations = eval_structured_llm.invoke(eval_prompt_str)
+
+        if not settled:
+            return model_evaluations
+
+        evaluated_student_answers = subtask_handler.merge_evaluations(extracted_student_answers, settled, model_evaluations)
+        if evaluated_student_answers is None:
+            # The model's answers could not be matched to the pending ones: evaluate the whole item instead
+            print("[AssessmentAgent] Could not merge the pre-scored and model evaluations, evaluating the whole item")
+            evaluated_student_answers = eval_structured_llm.invoke(self.build_evaluation_prompt(subtask_handler, extracted_student_answers, challenge_item))
+
+        return evaluated_student_answers
+
+
+
+    @usage_label("evaluation")
+    async def aevaluate_student_answers(self, subtask_handler: BaseAssessmentSubtask, extracted_student_answers: BaseAssessmentExtractSchema, challenge_item: BaseChallenge) -> BaseAssessmentEvalSchema:
+        """
+        Async variant of evaluate_student_answers.
+        """
+
+        settled, pending_answers = self.prescore_answers(subtask_handler, extracted_student_answers, challenge_item)
+        if not settled:
+            pending_answers = extracted_student_answers
+
+        eval_structured_llm = structured_output(self.model, subtask_handler.evaluation_schema)
+
+        model_evaluations = None
+        if pending_answers is not None:
+            eval_prompt_str = self.build_evaluation_prompt(subtask_handler, pending_answers, challenge_item)
+            model_evaluations = await eval_structured_llm.ainvoke(eval_prompt_str)
+
+        if not settled:
+            return model_evaluations
+
+        evaluated_student_answers = subtask_handler.merge_evaluations(extracted_student_answers, settled, model_evaluations)
+        if evaluated_student_answers is None:
+            # The model's answers could not be matched to the pending ones: evaluate the whole item instead
+            print("[AssessmentAgent] Could not merge the pre-scored and model evaluations, evaluating the whole item")
+            evaluated_student_answers = await eval_structured_llm.ainvoke(self.build_evaluation_prompt(subtask_handler, extracted_student_answers, challenge_item))
+
+        return evaluated_student_answers
+
+
+
+    def prescore_answers(self, subtask_handler: BaseAssessmentSubtask, extracted_student_answers: BaseAssessmentExtractSchema, challenge_item: BaseChallenge):
+        """
+        Runs the subtask's local pre-scorer on the extracted answers, so only the ambiguous ones go to the model.
+
+        Args:
+            subtask_handler (BaseAssessmentSubtask): The handler for the current subtask.
+            extracted_student_answers (BaseAssessmentExtractSchema): Student's answers to the current challenge
+            challenge_item (BaseChallenge): The ground-truth challenge data for the current subtask item
+
+        Returns:
+            tuple: (settled evaluations by answer index, answers left for the model or None if all were settled)
+        """
+
+        settled = subtask_handler.prescore(extracted_student_answers, challenge_item) if Config.ASSESSMENT_PRESCORE else {}
+        answers = subtask_handler.answer_count(extracted_student_answers)
+
+        PRESCORE_STATS.record(answers, len(settled))
+        if settled:
+            print(f"[AssessmentAgent] Pre-scorer settled {len(settled)} of {answers} answer(s) locally")
+
+        if len(settled) == answers:
+            return settled, None
+
+        return settled, subtask_handler.pending_answers(extracted_student_answers, settled)
+
+
+
+    def build_evaluation_prompt(self, subtask_handler: BaseAssessmentSubtask, extracted_student_answers: BaseAssessmentExtractSchema, challenge_item: BaseChallenge) -> str:
+        """
+        Formats the evaluation prompt for the extracted answers and the expected challenge answers.
+        """
+
         formatted_input = subtask_handler.format_evaluation_input(extracted_student_answers, challenge_item)
 
-        eval_prompt_str = self.prompt_template.format(
+        return self.prompt_template.format(
             subtask_description = ASSESSMENT_PROMPTS[subtask_handler.type_key]["description"],
             subtask_instructions = ASSESSMENT_PROMPTS[subtask_handler.type_key]["evaluation"],
             input = formatted_input,
-            schema = self.get_schema_block(subtask_handler, "extraction")
+            schema = self.get_schema_block(subtask_handler, "evaluation")
         )
 
-        eval_structured_llm = self.model.with_structured_output(subtask_handler.evaluation_schema)
-        evaluated_student_answers = eval_structured_llm.invoke(eval_prompt_str)
-
-        eval_ans_total_score = subtask_handler.update_score(evaluated_student_answers)
-        self.item_total_scores.append(eval_ans_total_score)
-
-        return evaluated_student_answers
-
     
 
-    def check_basal_rule(self, subtask_handler: BaseAssessmentSubtask):
+    def check_basal_rule(self, subtask_handler: BaseAssessmentSubtask, item_total_scores: list[int]):
         """
         Determines whether the starting point of the subtask needs to be moved backwards,
         based on the subtask-specific basal rule.
 
         Args:
             subtask_handler (BaseAssessmentSubtask): The handler for the current subtask.
+            item_total_scores (list): The session's total score for each item so far.
 
         Returns:
             True if starting point needs to be moved back, otherwise False
         """
 
-        return subtask_handler.check_basal_rule(self.item_total_scores)
+        return subtask_handler.check_basal_rule(item_total_scores)
 
 
 
-    def check_ceiling_rule(self, subtask_handler: BaseAssessmentSubtask):
+    def check_ceiling_rule(self, subtask_handler: BaseAssessmentSubtask, item_total_scores: list[int]):
         """
         Determines the stopping point of the subtask, based on the subtask-specific ceiling rule.
 
         Args:
             subtask_handler (BaseAssessmentSubtask): The handler for the current subtask.
+            item_total_scores (list): The session's total score for each item so far.
 
         Returns:
             True if stopping point has been reached, otherwise False
         """
 
-        return subtask_handler.check_ceiling_rule(self.item_total_scores)
+        return subtask_handler.check_ceiling_rule(item_total_scores)
 
 
 
-    def store_assessment(self, subtask_handler: BaseAssessmentSubtask, evaluated_student_answers: BaseAssessmentEvalSchema):
+    def store_assessment(self, subtask_handler: BaseAssessmentSubtask, assessment: AssessmentState, evaluated_student_answers: BaseAssessmentEvalSchema, thread_id: Optional[str] = None, challenge_item: Optional[BaseChallenge] = None):
         """
         Stores the assessment results of the current subtask challenge item.
 
         Args:
-            evaluated_student_answers (BaseAssessmentEvalSchema): List of challenge item evaluations.
             subtask_handler (BaseAssessmentSubtask): The handler for the current subtask.
+            assessment (AssessmentState): The session's assessment namespace, updated in place.
+            evaluated_student_answers (BaseAssessmentEvalSchema): List of challenge item evaluations.
+            thread_id (str): The session's thread id; each session exports to a directory of its own.
+            challenge_item (BaseChallenge): The assessed challenge item.
         """
 
-        if subtask_handler.type_key not in self.state["score_summary"]:
-            self.state["score_summary"] = {
+        if not assessment.score_summary:
+            assessment.score_summary = {
                 "total_items": 0,
                 "total_score": 0,
                 "average_score": 0.0
             }
 
-        summary = self.state["score_summary"]
+        summary = assessment.score_summary
 
         summary["total_items"] += 1
-        summary["total_score"] += self.item_total_scores[-1]
+        summary["total_score"] += assessment.item_total_scores[-1]
         summary["normalized_average"] = round(
             summary["total_score"] / (summary["total_items"] * subtask_handler.max_item_score), 2
         )
 
-        self.state.update({
-            "basal": self.basal_move_backwards,
-            "ceiling": self.ceiling_stop_subtask,
-            "score_summary": summary,
-            "assessment_history": self.state["assessment_history"] + [evaluated_student_answers]
-        })
+        assessment.assessment_history = assessment.assessment_history + [evaluated_student_answers]
 
 
-        # TODO: save for each user, prevent file overwrite
-        subtask_handler.export_to_csv_and_plots(self.state["assessment_history"], self.state["score_summary"])
+        # Appended to the session's CSVs and the cross-session store in the background;
+        # plots are rendered when the session ends
+        ASSESSMENT_EXPORTS.record_item(thread_id, subtask_handler, assessment, challenge_item)
 
        
         # Todo: store in memory
 
 
 
-    def reset(self):
+    def reset(self, fullstate: FullState) -> FullState:
         """
-        Method to reset agent state.
+        Method to reset the session's assessment state.
         """
 
-        self.subtask = ""
-        self.item_total_scores = []
-        self.basal_move_backwards = False
-        self.ceiling_stop_subtask = False
-
-        self.state: AssessmentState = {
-            "basal": False,
-            "ceiling": False,
-            "score_summary": {},
-            "assessment_history": []
-        }
+        fullstate.assessment = AssessmentState()
+        return fullstate
 
 
 
-    def generate_feedback(self):
+    def generate_feedback(self, assessment: AssessmentState):
         """
         Sends feedback back to the manager agent.
         """
 
-        if self.basal_move_backwards and self.ceiling_stop_subtask:
+        if assessment.basal and assessment.ceiling:
             return "Student showed signs of struggle with inital items and also reached the ceiling criterion."
 
-        elif self.basal_move_backwards:
+        elif assessment.basal:
             return "Student did not meet the basal criterion and struggled with initial items."
 
-        elif self.ceiling_stop_subtask:
+        elif assessment.ceiling:
             return "Student reached the ceiling criterion; subtask was appropriately concluded."
 
         else:
@@ -284,22 +534,26 @@ class AssessmentAgent(BaseAgent):
 
     def get_schema_block(self, subtask_handler: BaseAssessmentSubtask, task: str):
         """
-        Retrieves the required Pydantic schema and converts to json.
+        Retrieves the required Pydantic schema in json format (serialized once per process).
 
         Args:
             subtask_handler (BaseAssessmentSubtask): The handler for the current subtask.
+            task (str): "extraction", "evaluation" or "assessment"
 
         Returns:
             schema (json): The Pydantic schema in json format.
         """
 
         if task == "extraction":
-            schema = subtask_handler.extraction_schema.model_json_schema()
+            schema = subtask_handler.extraction_schema
 
         elif task == "evaluation":
-            schema = subtask_handler.evaluation_schema.model_json_schema()
+            schema = subtask_handler.evaluation_schema
 
-        return json.dumps(schema, separators=(",", ":"))
+        elif task == "assessment":
+            schema = subtask_handler.assessment_schema
+
+        return schema_json(schema)
 
 
 
@@ -332,7 +586,7 @@ def pretty_print_assessment_state(assessment_state):
 
     print("\n\U0001F9E0 Assessment Summary\n" + "=" * 30)
 
-    for i, response in enumerate(assessment_state['assessment_history']):
+    for i, response in enumerate(assessment_state.assessment_history):
         print(f"\n\U0001F4D8 Item {i + 1}")
         print("-" * 20)
         for j, eval in enumerate(response.evaluations):
@@ -349,12 +603,7 @@ def pretty_print_assessment_state(assessment_state):
             print(f"    Error Category Reasoning: {error_reason}")
         print(f"  Total Score: {response.total_score.value}")
 
-def test_assessment_agent():
-    llm = ChatOllama(model="gemma3", temperature=0.8)
-    # api_key = os.getenv("GOOGLE_API_KEY")
-    # llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", google_api_key=api_key, temperature=0.8)
-    agent = AssessmentAgent(model=llm)
-
+def sample_va_items():
     challenges = [
         ChallengeTriplet(
             triplet=("pen", "paper", "pig"),
@@ -386,18 +635,24 @@ def test_assessment_agent():
         "cat and bone because cats chew bones, and cat and dog because they are animals.",
     ]
 
+    return list(zip(challenges, responses))
+
+def test_assessment_agent():
+    llm = ChatOllama(model="gemma3", temperature=0.8)
+    # api_key = os.getenv("GOOGLE_API_KEY")
+    # llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", google_api_key=api_key, temperature=0.8)
+    agent = AssessmentAgent(model=llm)
+
     full_state = FullState()
     full_state.challenge.challenge_type = "Vocabulary Awareness"
 
-    for challenge, response in zip(challenges, responses):
+    for challenge, response in sample_va_items():
         full_state.challenge.challenge_history.append(challenge)
         full_state.student_response = response
         full_state.narrative.challenge_index = len(full_state.challenge.challenge_history) - 1
         full_state = agent(fullstate=full_state)
 
-    pretty_print_assessment_state({
-        "assessment_history": full_state.assessment["assessment_history"]
-    })
+    pretty_print_assessment_state(full_state.assessment)
 
     print("\n\nFeedback Summary:")
     print(full_state.assessment_feedback)
@@ -405,7 +660,26 @@ def test_assessment_agent():
     print('\n\nFull Assessment State Summary:\n')
     print(full_state.assessment)
 
+    print('\n\nLocal Pre-scoring:\n')
+    print(PRESCORE_STATS.summary())
+
+def test_mode_agreement():
+    llm = ChatOllama(model="gemma3", temperature=0.8)
+    agent = AssessmentAgent(model=llm)
+
+    agreement = agent.compare_modes("Vocabulary Awareness", sample_va_items())
+
+    for i, item in enumerate(agreement["items"], 1):
+        print(f"Item {i}: two-pass score {item['reference_score']}, single-pass score {item['candidate_score']}, "
+              f"same pairs: {item['same_pairs']}, pair agreement: {item['pair_agreement']:.0%}")
+    print(f"\nItem score agreement: {agreement['item_score_agreement']:.0%}")
+    print(f"Pair set agreement: {agreement['pair_set_agreement']:.0%}")
+    print(f"Mean pair agreement: {agreement['mean_pair_agreement']:.0%}")
+
 
 if __name__ == "__main__":
-    test_assessment_agent()
+    if "--compare-modes" in sys.argv:
+        test_mode_agreement()
+    else:
+        test_assessment_agent()
 
@@ -1,11 +1,17 @@
 import pprint
+import asyncio
 from phonemizer import phonemize
-from langchain_core.prompts import ChatPromptTemplate
-from typing import TypedDict, List, Any, Mapping
-from abc import ABC, abstractmethod
-from core.states import ChallengeState, FullState
-from core.challenges import BaseChallenge
+from typing import TypedDict, List, Mapping, Optional
+from core.config import Config
+from core.states import FullState
+from core.challenges import BaseChallenge, ChallengeTriplet, PhonemicAwareness
+from core.challenge_bank import ChallengeBankRefiller, get_challenge_bank, profile_from_survey
+from core.prefetch import PREFETCH
+from core.usage import usage_label
+from core.runnables import chat_template, escape_template, structured_output
 from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableConfig
+from .utils import BaseAgent, get_thread_id
 
 SUBTASK1_INSTRUCTION_PROMPT = """
 Subtest 1 evaluates a student’s Vocabulary Awareness (VA). The task is to present a student with a triplet of three words, where two different pairs of words in the triplet can be logically or semantically connected. The words must be contextually relevant to the preceding story or content, and the semantic relationships should be meaningful and justifiable.
@@ -71,21 +77,14 @@ CHALLENGE_MAPPER = {
     )
 }
 
-
-class BaseAgent(ABC):
-    def __init__(self, name: str):
-        self.name = name
-        self.state: dict[str, Any] = {}
-
-    @abstractmethod
-    def __call__(self, inputs: Mapping[str, Any]) -> Mapping[str, Any]:
-        pass
-
-    def update_state(self, key: str, value: Any):
-        self.state[key] = value
-
-    def get_state(self) -> Mapping[str, Any]:
-        return self.state
+# Parts of the story that concurrent challenge calls are steered towards, so their outputs differ
+DIVERSITY_SEEDS = [
+    "a character",
+    "an object or place",
+    "an action or event",
+    "a feeling or the mood",
+    "something from the setting",
+]
 
 
 class NarrativeConstraint(TypedDict):
@@ -141,29 +140,122 @@ class ChallengeAgent(BaseAgent):
         ```
         """
 
-        self.state: ChallengeState = ChallengeState(
-            messages=[],
-            current_narrative_segment=[],
-            narrative_beat_info={},
-            challenge_type="",
-            modality="",
-            story_history=[],
-            challenge_history=[]
-        )
+        # System prompt templates by (challenge index, batched), see system_template
+        self._system_templates = {}
+
         self.narrative_constraints = NarrativeConstraint
         self.modality_constraint = {}
         self.current_challenge = 0
 
-    def __call__(self, inputs: FullState) -> FullState:
+        # Validated challenges are banked and reused; the LLM is only asked on a miss
+        self.bank = get_challenge_bank()
+        self.refiller = ChallengeBankRefiller(self.bank, self.generate_for_profile) if self.bank else None
+
+    def __call__(self, inputs: FullState, config: Optional[RunnableConfig] = None) -> FullState:
         print("[challenge_agent] Input state:", inputs)
         if len(inputs.full_history) == 0:
-            # Store the error in the state instead of returning a dict
-            inputs.full_history.append(AIMessage(content="Error: No narrative to base challenge on."))
-            print("[challenge_agent] Output state:", inputs)
-            print("[challenge_agent] Output type:", type(inputs))
-            print("\n--- Exiting Challenge Agent ---")
-            return inputs
-        challenge_output = self.generate_challenge(inputs)
+            return self.store_missing_narrative(inputs)
+        challenge_output = self.prefetched_challenges(get_thread_id(config)) \
+            or self.challenges_from_bank(inputs, get_thread_id(config))
+        if not challenge_output:
+            challenge_output = self.generate_challenge(inputs)
+            self.bank_challenges(inputs, challenge_output)
+        return self.store_challenge_output(inputs, challenge_output)
+
+    async def acall(self, inputs: FullState, config: Optional[RunnableConfig] = None) -> FullState:
+        """
+        Async variant of __call__, awaiting the model instead of blocking on it.
+        """
+        print("[challenge_agent] Input state (async):", inputs)
+        if len(inputs.full_history) == 0:
+            return self.store_missing_narrative(inputs)
+        challenge_output = await asyncio.to_thread(self.prefetched_challenges, get_thread_id(config)) \
+            or self.challenges_from_bank(inputs, get_thread_id(config))
+        if not challenge_output:
+            challenge_output = await self.agenerate_challenge(inputs)
+            self.bank_challenges(inputs, challenge_output)
+        return self.store_challenge_output(inputs, challenge_output)
+
+    @staticmethod
+    def prefetched_challenges(thread_id: Optional[str]) -> list:
+        """
+        Returns the challenge batch prepared in the background during the survey if it is ready (served once).
+        A batch still being generated is not waited for: the bank or a live call serves this turn instead.
+        """
+        challenges = PREFETCH.pop(thread_id, "challenges", timeout=0)
+        if challenges:
+            print(f"[challenge_agent] Using {len(challenges)} challenge(s) prepared during the survey")
+        return challenges or []
+
+    def prefetch_challenges(self, survey_data: str) -> list:
+        """
+        Generates the first challenge batch for a child from their survey data alone, before the story starts.
+        :param survey_data: The survey data extracted by the narrative agent
+        :return list: Valid challenges
+        """
+        band, themes = profile_from_survey(survey_data)
+        return self.generate_for_profile(CHALLENGE_MAPPER[self.current_challenge][4], band, themes)
+
+    def challenges_from_bank(self, inputs: FullState, thread_id: Optional[str] = None) -> list:
+        """
+        Returns banked challenges matching the child's age band and interests that they have not seen yet,
+        or an empty list (and wakes the refill job) on a miss.
+        :param inputs: Current state passed to the challenge agent (FullState object)
+        :param thread_id: The child's thread, which a refill caused by a miss is charged to
+        :return list: Challenges to use for this turn
+        """
+        if self.bank is None:
+            return []
+        type_key = CHALLENGE_MAPPER[self.current_challenge][4]
+        band, themes = profile_from_survey(inputs.narrative.survey_data)
+        seen = [c for c in inputs.challenge.challenge_history if isinstance(c, BaseChallenge)]
+
+        challenges = self.bank.take(type_key, band, themes, Config.CHALLENGE_BATCH_SIZE, exclude=seen,
+                                     thread_id=thread_id)
+        if challenges:
+            print(f"[challenge_agent] Served {len(challenges)} {type_key} challenge(s) from the bank")
+        else:
+            print(f"[challenge_agent] Challenge bank miss for {type_key}/{band}, generating live")
+            self.refiller.wake()
+        return challenges
+
+    def bank_challenges(self, inputs: FullState, challenges: list):
+        """
+        Banks the valid challenges that were generated live, under the child's profile.
+        """
+        if self.bank is None:
+            return
+        band, themes = profile_from_survey(inputs.narrative.survey_data)
+        self.bank.add([c for c in challenges if self.validate_challenge(c)], band, themes)
+
+    @usage_label("challenge_bank")
+    def generate_for_profile(self, type_key: str, band: str, themes: List[str]) -> list:
+        """
+        Generates a batch of validated challenges for a child profile rather than a specific story, used to
+        refill the bank in the background.
+        :param type_key: Challenge type to generate
+        :param band: Age band of the children the challenges are for
+        :param themes: Interest keywords the challenges should relate to
+        :return list: Valid challenges
+        """
+        challenge_index = next(i for i, entry in CHALLENGE_MAPPER.items() if entry[4] == type_key)
+        narrative_context = f"A new adventure for a child in the age band {band}, " \
+                            f"interested in: {', '.join(themes[:10]) or 'anything'}."
+        n = Config.CHALLENGE_BATCH_SIZE
+
+        chain, _ = self.build_chain(narrative_context, "", batch_size=n, challenge_index=challenge_index)
+        challenges = chain.invoke({"query": self.batch_query(n)}).challenges
+        return [c for c in self.finalize_batch(challenges, n) if self.validate_challenge(c)]
+
+    def store_missing_narrative(self, inputs: FullState) -> FullState:
+        # Store the error in the state instead of returning a dict
+        inputs.record_event(self.name, "error", "challenge_agent: no narrative to base challenge on")
+        print("[challenge_agent] Output state:", inputs)
+        print("[challenge_agent] Output type:", type(inputs))
+        print("\n--- Exiting Challenge Agent ---")
+        return inputs
+
+    def store_challenge_output(self, inputs: FullState, challenge_output: list) -> FullState:
         current_challenge = challenge_output[self.current_challenge]
         print("--- Completed Challenge Query ---")
         print(current_challenge)
@@ -175,44 +267,109 @@ class ChallengeAgent(BaseAgent):
         print("\n--- Exiting Challenge Agent ---")
         return inputs
 
+    @usage_label("challenge")
     def generate_challenge(self, inputs: FullState) -> list:
         """
         Generates a Challenges object which will contain question information such as the question, the answer, and the
-        justification for the answer if necessary.
+        justification for the answer if necessary. The batch is generated according to Config.CHALLENGE_BATCH_MODE.
         :param inputs: Current state passed to the challenge agent (FullState object)
         :return list: A challenge plan with a list of challenges
         """
+        n = Config.CHALLENGE_BATCH_SIZE
+        mode = Config.CHALLENGE_BATCH_MODE
+
+        if mode == "list":
+            chain, query = self.build_challenge_chain(inputs, batch_size=n)
+            challenges = chain.invoke({"query": self.batch_query(n)}).challenges
+        elif mode == "concurrent":
+            chain, query = self.build_challenge_chain(inputs)
+            challenges = chain.batch([{"query": q} for q in self.seeded_queries(query, n)])
+        else:
+            chain, query = self.build_challenge_chain(inputs)
+            challenges = []
+            for i in range(n):
+                challenges.append(self.postprocess_challenge(chain.invoke({"query": query})))
+                query = self.next_query(query, i, challenges)
+
+        if not challenges:
+            # The model returned an empty list: fall back to a single challenge
+            chain, query = self.build_challenge_chain(inputs)
+            challenges = [chain.invoke({"query": query})]
+
+        return self.finalize_batch(challenges, n)  # Assuming nothing went wrong should return a list of BaseChallenge object
+
+    @usage_label("challenge")
+    async def agenerate_challenge(self, inputs: FullState) -> list:
+        """
+        Async variant of generate_challenge.
+        :param inputs: Current state passed to the challenge agent (FullState object)
+        :return list: A challenge plan with a list of challenges
+        """
+        n = Config.CHALLENGE_BATCH_SIZE
+        mode = Config.CHALLENGE_BATCH_MODE
+
+        if mode == "list":
+            chain, query = self.build_challenge_chain(inputs, batch_size=n)
+            challenges = (await chain.ainvoke({"query": self.batch_query(n)})).challenges
+        elif mode == "concurrent":
+            chain, query = self.build_challenge_chain(inputs)
+            challenges = await chain.abatch([{"query": q} for q in self.seeded_queries(query, n)])
+        else:
+            chain, query = self.build_challenge_chain(inputs)
+            challenges = []
+            for i in range(n):
+                challenges.append(self.postprocess_challenge(await chain.ainvoke({"query": query})))
+                query = self.next_query(query, i, challenges)
+
+        if not challenges:
+            chain, query = self.build_challenge_chain(inputs)
+            challenges = [await chain.ainvoke({"query": query})]
+
+        return self.finalize_batch(challenges, n)
+
+    def build_challenge_chain(self, inputs: FullState, batch_size: Optional[int] = None):
+        """
+        Builds the prompt | structured model chain for the current subtask.
+        :param inputs: Current state passed to the challenge agent (FullState object)
+        :param batch_size: If given, the chain returns a batch (with a `challenges` list) instead of a single challenge
+        :return tuple: The chain and the initial query
+        """
+        return self.build_chain(
+            inputs.narrative.story[-1].content,
+            str(inputs.full_history[-1].content),
+            batch_size,
+        )
 
-        prompt_var, constraint_var, challenge_type, modality, example_var = CHALLENGE_MAPPER[self.current_challenge]
-
-        context_input = {
-            "current_narrative_context": inputs.narrative.story[-1].content,
-            "story_history": str(inputs.full_history[-1].content).replace('{', '{{').replace('}', '}}').replace("'", '"'),
-            "subtask_instruction": prompt_var,
-            "subtask_constraints": constraint_var,
-            "challenge_type": challenge_type,
-            "modality": modality,
-        }
+    def build_chain(self, narrative_context: str, story_history: str, batch_size: Optional[int] = None,
+                    challenge_index: Optional[int] = None):
+        """
+        Builds the prompt | structured model chain for a subtask from an explicit narrative context.
+        The prompt template and the structured model are shared across calls (see core/runnables.py); only the
+        story changes, and it is passed in as template variables.
+        :param narrative_context: The current narrative situation the challenges should fit
+        :param story_history: The story so far
+        :param batch_size: If given, the chain returns a batch (with a `challenges` list) instead of a single challenge
+        :param challenge_index: Key of CHALLENGE_MAPPER to generate for, defaults to the current challenge
+        :return tuple: The chain and the initial query
+        """
+        if challenge_index is None:
+            challenge_index = self.current_challenge
+        example_var = CHALLENGE_MAPPER[challenge_index][4]
         # Todo setup better logic for switching between challenge types
 
-        current_challenge_schema = BaseChallenge.get_example_for(example_var)
-        structured_output_parser = BaseChallenge.get_class_by_type(example_var)
-
-        current_challenge_schema_str = str(pprint.pformat(current_challenge_schema))\
-            .replace('{', '{{').replace('}', '}}').replace("'", '"')
-        self.output_schema = self.output_schema.format(challenge_schema=current_challenge_schema_str).strip()
+        if batch_size:
+            output_class = BaseChallenge.batch_class_for(example_var)
+        else:
+            output_class = BaseChallenge.get_class_by_type(example_var).example().class_type()
 
-        # Format the current challenge
-        challenge_prompt = self.challenge_prompt_template.format(**context_input).strip() + "\n" + self.output_schema
-
-        prompt = ChatPromptTemplate([
-            ("system", challenge_prompt),
+        prompt = chat_template((
+            ("system", self.system_template(challenge_index, bool(batch_size))),
             # ("system", "Previous challenges:\n{chat_history}"),
             ("human", "{query}")
-        ])
+        )).partial(current_narrative_context=str(narrative_context), story_history=story_history)
 
         # Force the model to provide structure output for ease of use and consistency
-        model = self.model.with_structured_output(structured_output_parser.example().class_type())
+        model = structured_output(self.model, output_class)
 
         # Todo not sure if this is the best initial query-system_prompt combination
         query = "Generate a challenge based on the current current narrative context and subtask." \
@@ -222,42 +379,119 @@ class ChallengeAgent(BaseAgent):
         print(f'--- Input Prompt: {prompt} ---')
 
         # Create query chain to get output from the model
-        chain = prompt | model
-        challenge_history = []
-        for i in range(5):
-            challenge = chain.invoke({"query": query})
-
-            if self.current_challenge == 1:
-                (word, change) = challenge.non_word_pair
-                # Todo figure out a better way to get phonemes
-                # changes = phonemize([word, change], language='en-us', backend='espeak', strip=True)
-                # new_word = changes[0]
-                # new_change = changes[1]
-
-                challenge.phonemic_pair = (word, change)
-
-            challenge_history.append(challenge)
+        return prompt | model, query
 
-            prev_challenges = "\n".join([
-                str(x).replace('{', '{{').replace('}', '}}').replace("'", '"')
-                for x in challenge_history
-            ])
-            query = query + "\n\nPrevious Challenges:" if i == 0 else "\n\n" + prev_challenges
-
-        return challenge_history  # Assuming nothing went wrong should return a list of BaseChallenge object
+    def system_template(self, challenge_index: int, batched: bool) -> str:
+        """
+        The system prompt template of a subtask: instructions, constraints and output schema filled in and
+        escaped once, the story left as the {current_narrative_context} and {story_history} variables.
+        :param challenge_index: Key of CHALLENGE_MAPPER
+        :param batched: Whether the output schema is a batch (a `challenges` list)
+        """
+        key = (challenge_index, batched)
+        if key not in self._system_templates:
+            prompt_var, constraint_var, challenge_type, modality, example_var = CHALLENGE_MAPPER[challenge_index]
+
+            current_challenge_schema = BaseChallenge.get_example_for(example_var)
+            if batched:
+                current_challenge_schema = {"challenges": [current_challenge_schema]}
+            current_challenge_schema_str = escape_template(pprint.pformat(current_challenge_schema).replace("'", '"'))
+            output_schema = self.output_schema.format(challenge_schema=current_challenge_schema_str).strip()
+
+            context_input = {
+                "current_narrative_context": "{current_narrative_context}",
+                "story_history": "{story_history}",
+                "subtask_instruction": escape_template(prompt_var),
+                "subtask_constraints": escape_template(constraint_var),
+                "challenge_type": challenge_type,
+                "modality": modality,
+            }
+            self._system_templates[key] = self.challenge_prompt_template.format(**context_input).strip() \
+                + "\n" + output_schema
+        return self._system_templates[key]
+
+    @staticmethod
+    def batch_query(n: int) -> str:
+        return f"Generate {n} challenges based on the current narrative context and subtask and return them in " \
+               f"the `challenges` list. Do not create duplicate challenges: every challenge must use different words."
+
+    @staticmethod
+    def seeded_queries(query: str, n: int) -> list:
+        """
+        One query per concurrent call, each steering the model to a different part of the story so the
+        independent calls do not all produce the same challenge.
+        """
+        return [
+            f"{query}\n\nFor variety, base this challenge on {DIVERSITY_SEEDS[i % len(DIVERSITY_SEEDS)]} "
+            f"from the story (variation {i + 1} of {n})."
+            for i in range(n)
+        ]
 
-    def validate_challenge(self):
+    def finalize_batch(self, challenges: list, n: int) -> list:
         """
-        Placeholder function to validate whether questions within a challenge make sense in the context of the narrative
-        and subtask
-        :return:
+        Post-processes the generated challenges, drops duplicates and keeps at most `n`.
         """
-        pass
+        unique, seen = [], set()
+        for challenge in challenges:
+            challenge = self.postprocess_challenge(challenge)
+            key = challenge.dedupe_key()
+            if key in seen:
+                continue
+            seen.add(key)
+            unique.append(challenge)
+
+        if len(unique) < len(challenges):
+            print(f"[challenge_agent] Dropped {len(challenges) - len(unique)} duplicate challenge(s)")
+        return unique[:n]
+
+    def postprocess_challenge(self, challenge: BaseChallenge) -> BaseChallenge:
+        if isinstance(challenge, PhonemicAwareness):
+            (word, change) = challenge.non_word_pair
+            # Todo figure out a better way to get phonemes
+            # changes = phonemize([word, change], language='en-us', backend='espeak', strip=True)
+            # new_word = changes[0]
+            # new_change = changes[1]
+
+            challenge.phonemic_pair = (word, change)
+        return challenge
+
+    @staticmethod
+    def next_query(query: str, i: int, challenge_history: list) -> str:
+        # The query is a template variable, so its braces need no escaping
+        prev_challenges = "\n".join([str(x) for x in challenge_history])
+        return query + "\n\nPrevious Challenges:" if i == 0 else "\n\n" + prev_challenges
+
+    @staticmethod
+    def validate_challenge(challenge: BaseChallenge) -> bool:
+        """
+        Checks that a generated challenge follows the structural rules of its subtask, so it can be banked and
+        reused without a human looking at it. Whether it fits the narrative is not checked here.
+        :param challenge: The challenge to validate
+        :return bool: True if the challenge is well-formed
+        """
+        if isinstance(challenge, ChallengeTriplet):
+            words = [w.strip().lower() for w in challenge.triplet]
+            if len(words) != 3 or len(set(words)) != 3 or not all(words):
+                return False
+            if len(challenge.pairings) != 2:
+                return False
+            pairs = []
+            for pairing in challenge.pairings:
+                pair = frozenset(w.strip().lower() for w in pairing.words)
+                if len(pair) != 2 or not pair <= set(words) or not pairing.justification.strip():
+                    return False
+                pairs.append(pair)
+            # Two different pairings, and they must not cover a single interchangeable group
+            return pairs[0] != pairs[1]
+        if isinstance(challenge, PhonemicAwareness):
+            word, without_first = (w.strip().lower() for w in challenge.non_word_pair)
+            return bool(without_first) and len(without_first) < len(word) and word.endswith(without_first)
+        return True
 
     def store_challenge(self, inputs: FullState, challenge_output: list,
                         current_challenge: BaseChallenge):
         """
-        Method to store challenges outputs and update the ChallengeAgentState
+        Method to store challenges outputs and update the challenge namespace of the FullState
         :param inputs: Current state passed to the challenge agent (TypedDict, dict)
         :param challenge_output: Challenges object containing the collection of challenge information
         :param current_challenge: The current challenge object (i.e. the current question being asked)
@@ -271,15 +505,17 @@ class ChallengeAgent(BaseAgent):
             "story_history": inputs.full_history + [AIMessage(content=f"Challenge Master: {current_challenge}")],
             "challenge_type": "Vocabulary Awareness",
             "modality": "Text/Audio",
-            "challenge_history":  self.state.challenge_history + challenge_output
+            "challenge_history":  inputs.challenge.challenge_history + challenge_output
         }
 
-        # update the ChallengeAgentState with the new information
+        # update the session's ChallengeState with the new information
         for k, v in updated_state.items():
-            setattr(self.state, k, v)
-        setattr(inputs, "challenge", self.state)
-        setattr(inputs, "full_history",
-                inputs.full_history + [AIMessage(content=f"Challenge Master: {challenge_output}")])
+            setattr(inputs.challenge, k, v)
+        inputs.record_event(
+            self.name, "challenges_generated",
+            f"challenge_agent generated {len(challenge_output)} {updated_state['challenge_type']} challenge(s)",
+            challenges=[challenge.model_dump() for challenge in challenge_output],
+        )
 
         # Todo add logic to store challenges in a challenge database or in memory
 
@@ -1,7 +1,11 @@
 from langchain_core.messages import SystemMessage, AIMessage, HumanMessage
 from pydantic import BaseModel
 from .utils import BaseAgent
+from .routing import RoutingPolicy
+from core.config import Config
 from core.states import FullState
+from core.usage import usage_label
+from core.runnables import structured_output
 from pprint import pprint
 from .prompts import MANAGER_PROMPT
 
@@ -18,10 +22,11 @@ class ManagerAgent(BaseAgent):
         """
         Initialize ManagerAgent with structured output enforcement and prompt.
         """
-        structured_model = model.with_structured_output(ManagerDecision)
+        structured_model = structured_output(model, ManagerDecision)
         super().__init__(name='Manager Agent')
         self.model = structured_model
         self.prompt = MANAGER_PROMPT
+        self.routing = RoutingPolicy()
 
     def __call__(self, state: FullState) -> FullState:
         """
@@ -32,12 +37,30 @@ class ManagerAgent(BaseAgent):
         decision, state = self.handle_challenge_flow(state)
         print(f"\n\nChallenge flow decision: {decision}\n")
         if decision is None:
-            # Default: use model to decide
-            decision = self.generate_task(state)
-            print("Manager decision:")
-            pprint(decision)
-            print()
+            # Routine turns are decided by the routing rules; the model is only asked when they cannot decide
+            decision = self.routing.decide(state) or self.generate_task(state)
+            self.routing.record(state, decision)
 
+        return self.store_decision(state, decision)
+
+    async def acall(self, state: FullState) -> FullState:
+        """
+        Async variant of __call__: the model is only awaited when neither the challenge flow nor the routing rules decide.
+        """
+        print("\n--- Running Manager Agent (async) ---")
+
+        decision, state = self.handle_challenge_flow(state)
+        print(f"\n\nChallenge flow decision: {decision}\n")
+        if decision is None:
+            decision = self.routing.decide(state) or await self.agenerate_task(state)
+            self.routing.record(state, decision)
+
+        return self.store_decision(state, decision)
+
+    def store_decision(self, state: FullState, decision) -> FullState:
+        """
+        Records the routing decision in the state for the router node.
+        """
         # Add agent metadata before appending
         if isinstance(decision, AIMessage):
             if getattr(decision, 'metadata', None) is None:
@@ -46,8 +69,12 @@ class ManagerAgent(BaseAgent):
 
         # Store the decision in the state for the router node to use
         state.last_agent = self.name
-        # Wrap the manager decision as an AIMessage for full_history
-        state.full_history.append(AIMessage(content=f"Manager decision: {decision}", metadata={"agent": self.name}))
+        # Record the decision as a control event rather than a message, so it is not sent back to the LLMs
+        if isinstance(decision, dict):
+            summary = f"manager -> {decision.get('next_agent')}: {decision.get('task')}"
+        else:
+            summary = f"manager decision: {decision}"
+        state.record_event(self.name, "manager_decision", summary, decision=decision)
 
         # Attach the decision to the state for the router node
         state.manager_decision = decision
@@ -113,6 +140,7 @@ class ManagerAgent(BaseAgent):
 
 
 
+    @usage_label("routing")
     def generate_task(self, state: FullState) -> dict:
         """
         Use the model to decide the next agent and task.
@@ -121,7 +149,32 @@ class ManagerAgent(BaseAgent):
         # narrative_summary = "\n".join([msg.content for msg in state.narrative.story[-3:]])
         # user_message = state.narrative.story[-1].content if state.narrative.story else "Let's start!"
 
-        response = self.model.invoke([SystemMessage(content=self.prompt)] + state.full_history)
+        response = self.model.invoke(self.context_messages(state))
+        return self.parse_decision(response)
+
+    @usage_label("routing")
+    async def agenerate_task(self, state: FullState) -> dict:
+        """
+        Async variant of generate_task.
+        """
+        response = await self.model.ainvoke(self.context_messages(state))
+        return self.parse_decision(response)
+
+    def context_messages(self, state: FullState) -> list:
+        """
+        Compact projection of the state used as the manager's LLM context: the recent conversation plus
+        one line per recent control event, instead of the whole full_history.
+        """
+        messages = [SystemMessage(content=self.prompt)]
+        events = state.recent_events(Config.MANAGER_CONTEXT_EVENTS)
+        if events:
+            messages.append(SystemMessage(content="Recent control events (oldest first):\n- " + "\n- ".join(events)))
+        return messages + state.full_history[-Config.MANAGER_CONTEXT_MESSAGES:]
+
+    def parse_decision(self, response) -> dict:
+        """
+        Converts the structured model response into a decision dict, defaulting to the narrative agent.
+        """
         print(f"\n[Manager] Raw manager response:\n{response}\n")
 
         # response is now a ManagerDecision object, convert to dict
@@ -130,4 +183,8 @@ class ManagerAgent(BaseAgent):
         except Exception:
             print("Invalid response from model, defaulting to narrative_agent.")
             decision = {"next_agent": "narrative_agent", "task": "Continue the story"}
+
+        print("Manager decision:")
+        pprint(decision)
+        print()
         return decision
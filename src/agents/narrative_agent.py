@@ -1,20 +1,39 @@
+import asyncio
+from typing import Callable, Optional
 from langchain_core.messages import  AIMessage, SystemMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig
 from core.states import FullState
-from .utils import BaseAgent
-from core.config import survey_results as default_survey_results
+from .utils import BaseAgent, get_thread_id
+from core.config import Config, survey_results as default_survey_results
+from core.prefetch import PREFETCH
+from core.usage import usage_label
 from .prompts import NARRATIVE_PROMPTS
+from .story_context import StoryContext
+
+# First message of the story once the survey is done (set by the graph's finish_survey_node)
+OPENING_CUE = "--- START NOW ---"
+
 
 class NarrativeAgent(BaseAgent):
-    def __init__(self, model, survey_results):
+    def __init__(self, model, survey_results, challenge_generator: Optional[Callable[[str], list]] = None):
+        """
+        :param model: Chat model used for the survey and the story
+        :param survey_results: Default survey results (used when the survey is skipped)
+        :param challenge_generator: Optional function generating a challenge batch from survey data, used to
+                                    prepare the first challenges in the background while the survey runs
+        """
         super().__init__(name='Narrative Agent')
 
         self.model = model
+        self.challenge_generator = challenge_generator
         self.survey_prompt = NARRATIVE_PROMPTS['main_prompts']['survey_prompt']
         self.survey_format_prompt = NARRATIVE_PROMPTS['main_prompts']['survey_extract_data']
         self.prompt = NARRATIVE_PROMPTS['main_prompts']['narrative_prompt_template']
         self.challenge_prompts = NARRATIVE_PROMPTS['challenge_prompts']
+        # Bounds the story prompt: recent turns verbatim, older ones as a running summary
+        self.context = StoryContext(model)
 
-    def __call__(self, state: FullState) -> FullState:
+    def __call__(self, state: FullState, config: Optional[RunnableConfig] = None) -> FullState:
         """
         Generate a child-friendly story segment based on ongoing narrative and latest user input.
 
@@ -24,37 +43,76 @@ class NarrativeAgent(BaseAgent):
 
         print(f"\nfinished_survey: {state.narrative.finished_survey!r}", end="\n\n")
 
+        thread_id = get_thread_id(config)
+
         # If the survey is not finished, handle the survey logic
         if not state.narrative.finished_survey:
-            return self.handle_survey(state)
+            return self.handle_survey(state, thread_id)
+
+        segment_inputs = self.prepare_story_segment(state, thread_id)
+        story_segment = self.prefetched_opening(thread_id, segment_inputs) \
+            or self.generate_story_segment(**segment_inputs)
+        return self.store_story_segment(state, story_segment, thread_id)
+
+    async def acall(self, state: FullState, config: Optional[RunnableConfig] = None) -> FullState:
+        """
+        Async variant of __call__, awaiting the model instead of blocking on it.
+        """
+        print("\n--- Running Narrative Agent (async) ---")
+
+        print(f"\nfinished_survey: {state.narrative.finished_survey!r}", end="\n\n")
+
+        thread_id = get_thread_id(config)
+
+        if not state.narrative.finished_survey:
+            return await self.ahandle_survey(state, thread_id)
 
-        # Get current narrative history from the global state
-        current_narrative = state.narrative.story
+        segment_inputs = self.prepare_story_segment(state, thread_id)
+        story_segment = self.prefetched_opening(thread_id, segment_inputs) \
+            or await self.agenerate_story_segment(**segment_inputs)
+        return self.store_story_segment(state, story_segment, thread_id)
+
+    def prepare_story_segment(self, state: FullState, thread_id: Optional[str] = None) -> dict:
+        """
+        Collects the arguments for generate_story_segment, including the challenge prompt if a challenge
+        must be incorporated into this segment.
+        """
+        # Get the recent narrative history from the global state (older turns come as a summary)
+        current_narrative, story_summary = self.context.window(state, thread_id)
         print(f"\n\ncurrent_narrative: {current_narrative!r}\n")
 
         challenge_index = state.narrative.challenge_index
 
-        if challenge_index is not None:
-            next_challenge = state.challenge.challenge_history[challenge_index]
-            print(f"\n[Narrative] next_challenge: {next_challenge}\n")
+        if challenge_index is None:
+            return {"current_narrative": current_narrative, "survey_data": state.narrative.survey_data,
+                    "story_summary": story_summary}
 
-            print(f"\n\nnext_challenge: {next_challenge!r}\n")
+        next_challenge = state.challenge.challenge_history[challenge_index]
+        print(f"\n[Narrative] next_challenge: {next_challenge}\n")
 
-            print("Incorporating challenge into the story...")
-            if state.challenge.challenge_type == "Vocabulary Awareness":
-                # Ensure next_challenge is a ChallengeTriplet object
-                from core.challenges import ChallengeTriplet
-                if next_challenge and isinstance(next_challenge, dict):
-                    next_challenge = ChallengeTriplet.from_dict(next_challenge)
+        print(f"\n\nnext_challenge: {next_challenge!r}\n")
 
-                challenge_prompt = self.challenge_prompts['vocabulary_awareness'].format(triplet=next_challenge.triplet)
-            else:
-                #TODO: Implement handling for other challenge types
-                challenge_prompt = None
+        print("Incorporating challenge into the story...")
+        if state.challenge.challenge_type == "Vocabulary Awareness":
+            # Ensure next_challenge is a ChallengeTriplet object
+            from core.challenges import ChallengeTriplet
+            if next_challenge and isinstance(next_challenge, dict):
+                next_challenge = ChallengeTriplet.from_dict(next_challenge)
 
-            story_segment = self.generate_story_segment(current_narrative, challenge_prompt=challenge_prompt, next_challenge=next_challenge)
+            challenge_prompt = self.challenge_prompts['vocabulary_awareness'].format(triplet=next_challenge.triplet)
         else:
-            story_segment = self.generate_story_segment(current_narrative)
+            #TODO: Implement handling for other challenge types
+            challenge_prompt = None
+
+        return {
+            "current_narrative": current_narrative,
+            "survey_data": state.narrative.survey_data,
+            "challenge_prompt": challenge_prompt,
+            "next_challenge": next_challenge,
+            "story_summary": story_summary,
+        }
+
+    def store_story_segment(self, state: FullState, story_segment, thread_id: Optional[str] = None) -> FullState:
         story_segment = self.add_agent_metadata(story_segment)
 
         # Append AI turn
@@ -64,26 +122,68 @@ class NarrativeAgent(BaseAgent):
         state.full_history.append(story_segment)
         state.last_agent = self.name
 
+        # Summarize turns that fell out of the prompt window in the background
+        self.context.maybe_fold(state, thread_id)
+
         return state
 
-    def handle_survey(self, state: FullState) -> FullState:
+    def handle_survey(self, state: FullState, thread_id: Optional[str] = None) -> FullState:
         """
         Handles the survey logic
         """
-        # Check for skip command in latest user message
-        if state.full_history and isinstance(state.full_history[-1], HumanMessage):
-            user_msg = state.full_history[-1].content.strip()
+        # Check for skip survey command
+        if self.is_skip_command(state):
+            return self.finish_survey(state, skip_survey=True)
+
+        self.store_survey_answer(state)
+
+        # Generate next survey question
+        next_question = self.conduct_survey(state.narrative.survey_conversation)
+        state = self.store_survey_question(state, next_question)
+
+        # Check if the survey is finished
+        if self.survey_is_finished(next_question):
+            state = self.finish_survey(state, thread_id=thread_id)
+        else:
+            self.start_prefetch(state, thread_id)
+
+        return state
+
+    async def ahandle_survey(self, state: FullState, thread_id: Optional[str] = None) -> FullState:
+        """
+        Async variant of handle_survey.
+        """
+        if self.is_skip_command(state):
+            return await self.afinish_survey(state, skip_survey=True)
+
+        self.store_survey_answer(state)
+
+        next_question = await self.aconduct_survey(state.narrative.survey_conversation)
+        state = self.store_survey_question(state, next_question)
+
+        if self.survey_is_finished(next_question):
+            state = await self.afinish_survey(state, thread_id=thread_id)
+        else:
+            self.start_prefetch(state, thread_id)
 
-            # Check for skip survey command
-            if user_msg == "SKIP SURVEY":
-                return self.finish_survey(state, skip_survey=True)
+        return state
 
+    @staticmethod
+    def is_skip_command(state: FullState) -> bool:
+        """
+        Checks for the skip command in the latest user message.
+        """
+        if state.full_history and isinstance(state.full_history[-1], HumanMessage):
+            return state.full_history[-1].content.strip() == "SKIP SURVEY"
+        return False
+
+    @staticmethod
+    def store_survey_answer(state: FullState):
         # Append user message
         if isinstance(state.full_history[-1], HumanMessage):
             state.narrative.survey_conversation.append(state.full_history[-1])
 
-        # Generate next survey question
-        next_question = self.conduct_survey(state.narrative.survey_conversation)
+    def store_survey_question(self, state: FullState, next_question) -> FullState:
         next_question = self.add_agent_metadata(next_question)
 
         # Append AI turn
@@ -93,41 +193,130 @@ class NarrativeAgent(BaseAgent):
         state.full_history.append(next_question)
         state.last_agent = self.name
 
-        # Check if the survey is finished
-        if "<END>" in next_question.content[-15:]:
-            state = self.finish_survey(state)
-
         return state
 
+    @staticmethod
+    def survey_is_finished(next_question) -> bool:
+        return "<END>" in next_question.content[-15:]
+
+    @usage_label("survey")
     def conduct_survey(self, survey_conversation):
         print(f"\n--- Asking Survey Question ---")
 
-        # Append system prompt
-        messages = [SystemMessage(content=self.survey_prompt)] + survey_conversation
+        next_question = self.model.invoke(self.survey_messages(survey_conversation))
+        print(f"\nnext_question: {next_question!r}", end="\n\n")
+
+        return next_question
+
+    @usage_label("survey")
+    async def aconduct_survey(self, survey_conversation):
+        print(f"\n--- Asking Survey Question (async) ---")
 
-        next_question = self.model.invoke(messages)
+        next_question = await self.model.ainvoke(self.survey_messages(survey_conversation))
         print(f"\nnext_question: {next_question!r}", end="\n\n")
 
         return next_question
 
-    def finish_survey(self, state: FullState, skip_survey: bool = False):
+    def survey_messages(self, survey_conversation):
+        # Append system prompt
+        return [SystemMessage(content=self.survey_prompt)] + survey_conversation
+
+    def finish_survey(self, state: FullState, skip_survey: bool = False, thread_id: Optional[str] = None):
         """
         Finish the survey and prepare the story to begin.
         """
         print("[NarrativeAgent] Finishing survey...")
 
-        # Set finished_survey to True
-        state.narrative.finished_survey = True
-
         # If skip_survey is True, use default survey results
         if skip_survey:
             print("[NarrativeAgent] Skipping survey and using default survey results.")
-            state.narrative.survey_data = str(default_survey_results)
+            survey_data = str(default_survey_results)
         else:
-            # Format the survey results
-            state.narrative.survey_data = self.format_survey_results(state.narrative.survey_conversation)
+            # Format the survey results, unless they were already extracted in the background
+            survey_data = self.prefetched_survey_data(state, thread_id) \
+                or self.format_survey_results(state.narrative.survey_conversation)
 
-        self.prompt = self.prompt.format(survey_results=state.narrative.survey_data)
+        return self.begin_story(state, survey_data)
+
+    async def afinish_survey(self, state: FullState, skip_survey: bool = False, thread_id: Optional[str] = None):
+        """
+        Async variant of finish_survey.
+        """
+        print("[NarrativeAgent] Finishing survey...")
+
+        if skip_survey:
+            print("[NarrativeAgent] Skipping survey and using default survey results.")
+            survey_data = str(default_survey_results)
+        else:
+            survey_data = await asyncio.to_thread(self.prefetched_survey_data, state, thread_id) \
+                or await self.aformat_survey_results(state.narrative.survey_conversation)
+
+        return self.begin_story(state, survey_data)
+
+    @staticmethod
+    def survey_answers(state: FullState) -> int:
+        return sum(isinstance(msg, HumanMessage) for msg in state.narrative.survey_conversation)
+
+    def start_prefetch(self, state: FullState, thread_id: Optional[str]):
+        """
+        Once the survey has enough answers, prepares the survey data, the story opening and the first
+        challenge batch in the background, while the child is still answering. Answers given while a
+        preparation is running are picked up by a single follow-up run once it is done (see PrefetchStore).
+        """
+        answers = self.survey_answers(state)
+        if not Config.PREFETCH or thread_id is None or answers < Config.PREFETCH_AFTER_ANSWERS:
+            return
+        survey_conversation = list(state.narrative.survey_conversation)
+        PREFETCH.submit(thread_id, answers, lambda: self.prefetch_artifacts(survey_conversation))
+
+    def prefetch_artifacts(self, survey_conversation):
+        """
+        Background job computing everything that only depends on the survey. Artifacts are yielded as they
+        are ready, so the survey data and the opening are served without waiting on the challenges.
+        """
+        survey_data = self.format_survey_results(survey_conversation)
+        yield "survey_data", survey_data
+        opening_narrative = [HumanMessage(content=OPENING_CUE)]
+        yield "opening", (survey_data, self.generate_story_segment(opening_narrative, survey_data))
+        if self.challenge_generator is not None:
+            yield "challenges", self.challenge_generator(survey_data)
+
+    def prefetched_survey_data(self, state: FullState, thread_id: Optional[str]) -> Optional[str]:
+        """
+        Returns the survey data extracted in the background, if it was computed from all the answers but
+        (at most) the last one, which is the one that ended the survey. Waits at most Config.PREFETCH_WAIT
+        for an extraction still running; after that, extracting it live is no slower.
+        """
+        survey_data = PREFETCH.pop(thread_id, "survey_data", min_version=self.survey_answers(state) - 1)
+        if survey_data is not None:
+            print("[NarrativeAgent] Using survey data prepared during the survey.")
+        return survey_data
+
+    @staticmethod
+    def prefetched_opening(thread_id: Optional[str], segment_inputs: dict):
+        """
+        Returns the story opening prepared during the survey if this turn is the opening and it was written
+        from the same survey data, otherwise None.
+        """
+        current_narrative = segment_inputs["current_narrative"]
+        is_opening = [msg.content for msg in current_narrative] == [OPENING_CUE]
+        if not is_opening or segment_inputs.get("challenge_prompt"):
+            return None
+        opening = PREFETCH.pop(thread_id, "opening", timeout=0)
+        if opening is None or opening[0] != segment_inputs["survey_data"]:
+            return None
+        print("[NarrativeAgent] Using story opening prepared during the survey.")
+        return opening[1]
+
+    def begin_story(self, state: FullState, survey_data: str) -> FullState:
+        """
+        Stores the survey data and resets the story so it can begin.
+        """
+        # Set finished_survey to True
+        state.narrative.finished_survey = True
+        state.narrative.survey_data = survey_data
+        state.narrative.story_summary = ""
+        state.narrative.summarized_upto = 0
 
         # Reset the story to start fresh
         start_message = AIMessage(content="**--- BEGINNING STORY ---**\n---\n")
@@ -140,24 +329,48 @@ class NarrativeAgent(BaseAgent):
 
         return state
 
-    def generate_story_segment(self, current_narrative, challenge_prompt=None, next_challenge=None):
+    @usage_label("story")
+    def generate_story_segment(self, current_narrative, survey_data, challenge_prompt=None, next_challenge=None,
+                               story_summary=""):
         """
         Generate a story segment based on the current narrative and (optionally) a challenge prompt.
+        The story prompt is personalized with the session's survey data on every call, since the agent is shared.
         """
         print(f"\n--- Generating Story Segment ---")
 
-        # Append system prompt
-        if challenge_prompt:
-            prompt = challenge_prompt
-        else:
-            prompt = self.prompt
-        messages = [SystemMessage(content=prompt)] + current_narrative
+        messages = self.story_messages(current_narrative, survey_data, challenge_prompt, story_summary)
 
         # print(f"\nmessages: {messages!r}", end="\n\n")
 
         story_segment = self.model.invoke(messages)
         # print(f"\nGenerated story segment: {story_segment.content}", end="\n\n")
 
+        return self.attach_challenge(story_segment, challenge_prompt, next_challenge)
+
+    @usage_label("story")
+    async def agenerate_story_segment(self, current_narrative, survey_data, challenge_prompt=None, next_challenge=None,
+                                      story_summary=""):
+        """
+        Async variant of generate_story_segment.
+        """
+        print(f"\n--- Generating Story Segment (async) ---")
+
+        messages = self.story_messages(current_narrative, survey_data, challenge_prompt, story_summary)
+        story_segment = await self.model.ainvoke(messages)
+
+        return self.attach_challenge(story_segment, challenge_prompt, next_challenge)
+
+    def story_messages(self, current_narrative, survey_data, challenge_prompt=None, story_summary=""):
+        # Append system prompt
+        if challenge_prompt:
+            prompt = challenge_prompt
+        else:
+            prompt = self.prompt.format(survey_results=survey_data)
+        prompt += self.context.system_suffix(story_summary)
+        return [SystemMessage(content=prompt)] + list(current_narrative)
+
+    @staticmethod
+    def attach_challenge(story_segment, challenge_prompt=None, next_challenge=None):
         print(f"\n[Narrative] challenge_prompt: {challenge_prompt}\n")
         print(f"\n[Narrative] next_challenge: {next_challenge}\n")
 
@@ -175,12 +388,31 @@ class NarrativeAgent(BaseAgent):
             message.metadata["agent"] = self.name
             return message
 
+    @usage_label("survey_extraction")
     def format_survey_results(self, survey_conversation):
         """
         Format the survey results into a dictionary.
         """
         print(f"\n--- Formatting Survey Results ---")
 
+        survey_data = self.model.invoke(self.survey_format_messages(survey_conversation))
+        print(f"\nSurvey data: {survey_data.content}", end="\n\n")
+
+        return survey_data.content.strip()
+
+    @usage_label("survey_extraction")
+    async def aformat_survey_results(self, survey_conversation):
+        """
+        Async variant of format_survey_results.
+        """
+        print(f"\n--- Formatting Survey Results (async) ---")
+
+        survey_data = await self.model.ainvoke(self.survey_format_messages(survey_conversation))
+        print(f"\nSurvey data: {survey_data.content}", end="\n\n")
+
+        return survey_data.content.strip()
+
+    def survey_format_messages(self, survey_conversation):
         # Convert the survey conversation into a string
         survey_conversation_string = ""
         for msg in survey_conversation:
@@ -190,9 +422,4 @@ class NarrativeAgent(BaseAgent):
                 survey_conversation_string += (f"\nAI: {msg.content!r}")
 
         # Append system prompt
-        messages = [SystemMessage(content=self.survey_format_prompt), HumanMessage(content=f"Here is the conversation for you to turn into a dictionary of survey data collected on the user:\n\n{survey_conversation_string}")]
-
-        survey_data = self.model.invoke(messages)
-        print(f"\nSurvey data: {survey_data.content}", end="\n\n")
-
-        return survey_data.content.strip()
+        return [SystemMessage(content=self.survey_format_prompt), HumanMessage(content=f"Here is the conversation for you to turn into a dictionary of survey data collected on the user:\n\n{survey_conversation_string}")]
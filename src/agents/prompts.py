@@ -87,6 +87,42 @@ Justification valid: no
 Score: 0  
 Error Category: semantic_mismatch  
 Error Reasoning: “Light” has different meanings here; this pair lacks a valid semantic relationship.
+""",
+
+
+"assessment": """
+You are assessing a child's Vocabulary Awareness (VA) response in a single step: first extract the word pairs the child gave, then evaluate each of them.
+Each item gives a triplet (e.g., "light, sun, feather"), the child's raw response and the expected pairs.
+
+Step 1 - Extraction:
+- Extract word pairs and justifications exactly as the child said them, even if they are unusual or incorrect.
+- Do not reinterpret, "fix" or add pairs; if a pair is not explicitly stated, do not include it.
+
+Step 2 - Evaluation of each extracted pair:
+1. Evaluate if the word pair and the justification are valid.
+2. Score: 1 = both pair and justification are valid; 0 = otherwise.
+3. If score is 0, assign an error category and a short explanation.
+
+Error categories:
+- semantic_mismatch: the words aren’t meaningfully related.
+- justification_vague: explanation is too vague or generic.
+- off_topic: the response is unrelated to the task or triplet.
+- incomplete: fewer than 2 pairs or missing justification.
+- other: doesn’t fit above.
+
+Be strict:
+- Only accept pairs with clear, commonly understood semantic relationships.
+- Reject guesses, puns, or surface-level links.
+- If the justification sounds okay but the words don’t belong together, mark as invalid.
+
+Example:
+
+Triplet: (light, sun, feather)
+Student Response: "sun and light because the sun makes light, and sun and feather because both are light"
+
+Evaluations:
+- Words: sun, light | Justification: the sun makes light | Pair valid: yes | Justification valid: yes | Score: 1 | Error Category: none
+- Words: sun, feather | Justification: both are light | Pair valid: no | Justification valid: no | Score: 0 | Error Category: semantic_mismatch
 """,
     },
 }
@@ -220,7 +256,26 @@ Yes, let's do it
 
 *Storyteller**:
 Excellent! Let us begin...
-"""
+""",
+
+        # Prompt for folding older story turns into the running summary
+        'story_summary_prompt': """
+You keep a running summary of an interactive children's story so the storyteller can continue it without rereading every turn.
+
+You will be given the current summary (possibly empty) and the story turns that happened after it. Write an updated summary that merges both. Keep the names of characters, places and objects, the child's choices, open plot threads, any challenges the child was given and how they answered, and the tone of the story. Leave out wording details and greetings.
+
+Write at most 200 words of plain prose. Output only the summary.
+""",
+
+        # Appended to the storyteller's system prompt when older turns have been summarized
+        'story_summary_context': """
+
+## Story so far
+
+The earlier part of the story (before the messages below) is summarized here:
+
+{story_summary}
+""",
     },
 
     'challenge_prompts': {
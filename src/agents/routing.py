@@ -0,0 +1,85 @@
+import re
+from typing import Optional
+
+from langchain_core.messages import HumanMessage
+
+from core.config import Config
+from core.states import FullState
+
+# The child asking for a game directly
+CHALLENGE_REQUEST = re.compile(r"\b(challenge|game|puzzle|quiz|riddle)\b", re.IGNORECASE)
+
+
+class RoutingPolicy:
+    """
+    Rule-based routing for the turns the challenge flow does not handle, so the manager only calls the
+    LLM when the rules cannot decide. The challenge flow handles every turn while generated challenges
+    are still to be incorporated or assessed, so the rules only see turns with no challenge pending.
+
+    Modes:
+        "rules": never call the LLM; undecided turns continue the story.
+        "hybrid": call the LLM on undecided turns only.
+        "llm": always call the LLM (previous behaviour).
+
+    With `every_k` = K, the story continues for K - 1 turns after a challenge, the K-th turn is left to the
+    LLM (is this a good moment for a challenge?), and from then on challenges are requested. A child asking
+    for a game gets one right away.
+    """
+
+    def __init__(self, mode: str = Config.ROUTING_POLICY, every_k: int = Config.CHALLENGE_EVERY_K):
+        """
+        :param mode: "rules", "hybrid" or "llm"
+        :param every_k: Number of narrative turns between challenges
+        """
+        self.mode = mode
+        self.every_k = every_k
+
+    def decide(self, state: FullState) -> Optional[dict]:
+        """
+        Returns a decision dict like the manager's, or None if the LLM should decide.
+        """
+        if self.mode == "llm":
+            return None
+
+        decision = self.apply_rules(state)
+        if decision is None and self.mode == "rules":
+            decision = continue_story()
+        if decision is not None:
+            print(f"[RoutingPolicy] Rule decision: {decision}")
+        return decision
+
+    def apply_rules(self, state: FullState) -> Optional[dict]:
+        turns = state.narrative_turns_since_challenge
+        last_message = state.full_history[-1] if state.full_history else None
+        last_text = last_message.content if isinstance(last_message, HumanMessage) else ""
+
+        # The very first story turn
+        if len(state.narrative.story) <= 1:
+            return continue_story()
+
+        if last_text and CHALLENGE_REQUEST.search(last_text) and turns >= 1:
+            return {"next_agent": "challenge_agent", "task": "The child asked for a challenge."}
+
+        if turns >= self.every_k:
+            return {"next_agent": "challenge_agent", "task": "Create new challenges for the story."}
+
+        if turns < self.every_k - 1:
+            return continue_story()
+
+        # A challenge will soon be due: let the LLM judge whether the story is at a good point for it
+        return None
+
+    @staticmethod
+    def record(state: FullState, decision: dict):
+        """
+        Updates the turn counter the rules rely on after a decision has been made.
+        """
+        next_agent = decision.get("next_agent") if isinstance(decision, dict) else None
+        if next_agent == "challenge_agent":
+            state.narrative_turns_since_challenge = 0
+        elif next_agent == "narrative_agent":
+            state.narrative_turns_since_challenge += 1
+
+
+def continue_story() -> dict:
+    return {"next_agent": "narrative_agent", "task": "Continue the story"}
@@ -0,0 +1,87 @@
+from typing import List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from core.config import Config
+from core.prefetch import SUMMARIES
+from core.usage import usage_label
+from core.states import FullState
+from .prompts import NARRATIVE_PROMPTS
+
+
+class StoryContext:
+    """
+    Keeps the narrative prompt roughly constant in size however long the session runs.
+
+    The last `keep_last` story messages are sent verbatim; older ones are folded into a running summary
+    (`NarrativeState.story_summary`). Folding happens in the background once `fold_every` messages have
+    fallen out of the window: the new summary is computed while the child reads and answers, and is
+    picked up on a later turn, never waited for. Until then the messages it will cover stay in the window.
+    """
+
+    def __init__(self, model, keep_last: int = Config.STORY_KEEP_LAST, fold_every: int = Config.STORY_FOLD_EVERY):
+        """
+        :param model: Chat model used to write the summary
+        :param keep_last: Number of most recent story messages sent verbatim
+        :param fold_every: Number of messages outside the window that triggers a new summary
+        """
+        self.model = model
+        self.keep_last = keep_last
+        self.fold_every = fold_every
+        self.summary_prompt = NARRATIVE_PROMPTS['main_prompts']['story_summary_prompt']
+        self.summary_context = NARRATIVE_PROMPTS['main_prompts']['story_summary_context']
+
+    def window(self, state: FullState, thread_id: Optional[str]) -> Tuple[List, str]:
+        """
+        Returns the story messages to send verbatim and the summary of everything before them, first
+        applying a background summary if one has finished.
+        """
+        self.apply_ready_summary(state, thread_id)
+        narrative = state.narrative
+        return narrative.story[narrative.summarized_upto:], narrative.story_summary
+
+    def apply_ready_summary(self, state: FullState, thread_id: Optional[str]):
+        narrative = state.narrative
+        result = SUMMARIES.pop(thread_id, "summary", min_version=narrative.summarized_upto + 1, timeout=0)
+        if result is None:
+            return
+        summarized_upto, story_summary = result
+        # Ignore summaries of a story that has since been reset
+        if summarized_upto <= len(narrative.story):
+            print(f"[StoryContext] Applying summary of the first {summarized_upto} story messages")
+            narrative.summarized_upto = summarized_upto
+            narrative.story_summary = story_summary
+
+    def maybe_fold(self, state: FullState, thread_id: Optional[str]):
+        """
+        Starts summarizing older story messages in the background if enough have fallen out of the window.
+        """
+        narrative = state.narrative
+        # One summary at a time per thread: a newer one would only supersede the one being written
+        if thread_id is None or not narrative.finished_survey or SUMMARIES.has(thread_id):
+            return
+        fold_upto = len(narrative.story) - self.keep_last
+        if fold_upto - narrative.summarized_upto < self.fold_every:
+            return
+        previous_summary = narrative.story_summary
+        to_fold = list(narrative.story[narrative.summarized_upto:fold_upto])
+        SUMMARIES.submit(thread_id, fold_upto,
+                         lambda: {"summary": (fold_upto, self.summarize(previous_summary, to_fold))})
+
+    @usage_label("story_summary")
+    def summarize(self, previous_summary: str, messages: List) -> str:
+        turns = []
+        for msg in messages:
+            if isinstance(msg, HumanMessage):
+                turns.append(f"Child: {msg.content}")
+            elif isinstance(msg, AIMessage):
+                turns.append(f"Storyteller: {msg.content}")
+        request = f"Current summary:\n{previous_summary or '(none)'}\n\nNew story turns:\n" + "\n\n".join(turns)
+        response = self.model.invoke([SystemMessage(content=self.summary_prompt), HumanMessage(content=request)])
+        return response.content.strip()
+
+    def system_suffix(self, story_summary: str) -> str:
+        """
+        Text appended to the storyteller's system prompt to carry the summary.
+        """
+        return self.summary_context.format(story_summary=story_summary) if story_summary else ""
@@ -1,18 +1,33 @@
+import asyncio
 from abc import ABC, abstractmethod
-from typing import Any, Mapping
+from typing import Any, Mapping, Optional
 
 
 class BaseAgent(ABC):
+    """
+    Agents are shared by every session served by a compiled graph, so they must not keep per-child data
+    on the instance: everything that belongs to a conversation lives in FullState.
+    """
+
     def __init__(self, name: str):
         self.name = name
-        self.state: dict[str, Any] = {}
 
     @abstractmethod
     def __call__(self, inputs: Mapping[str, Any]) -> Mapping[str, Any]:
         pass
 
-    def update_state(self, key: str, value: Any):
-        self.state[key] = value
+    async def acall(self, inputs: Mapping[str, Any]) -> Mapping[str, Any]:
+        """
+        Async entry point used when the graph runs with ainvoke/astream. Agents override this with a
+        version that awaits their model calls; the default runs the sync agent in a worker thread.
+        """
+        return await asyncio.to_thread(self.__call__, inputs)
+
 
-    def get_state(self) -> Mapping[str, Any]:
-        return self.state
+def get_thread_id(config: Optional[Mapping[str, Any]]) -> Optional[str]:
+    """
+    Returns the LangGraph thread id from a runnable config, or None if it is not set.
+    """
+    if not config:
+        return None
+    return config.get("configurable", {}).get("thread_id")
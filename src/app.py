@@ -1,11 +1,10 @@
 import gradio as gr
 import os
-import uuid
 import re
+import asyncio
 import traceback
-import shutil
 from typing import Optional, List, Dict, Any
-from core.audio_utils import speak_text, get_tts_model, get_stt_model, transcribe_speech
+from core.audio_utils import get_tts_model, get_stt_model, BackgroundModel, BatchedTranscriber, StreamingSpeaker
 
 # Langchain and LLM imports
 from langchain_core.messages import HumanMessage, AIMessage
@@ -16,12 +15,16 @@ from langchain_google_genai import ChatGoogleGenerativeAI
 # Import from the new graph location
 from core.graph import initialize_graph  # MODIFIED IMPORT
 from core.states import FullState
+from core.sessions import SessionRegistry
+from core.usage import USAGE, track_usage
+from core.tracing import end_span, span, start_span, trace_model, traceparent, with_traceparent
+from core.config import Config
 
 
 # --- NEW: Load state from file and initialize graph ---
-def load_state_and_resume(filename: str, api_key_ui: Optional[str] = None):
+def load_state_and_resume(filename: str, session_id: str, api_key_ui: Optional[str] = None):
     """
-    Loads a saved FullState from file and resumes the graph from that state.
+    Loads a saved FullState from file and resumes the session's graph from that state.
     """
     try:
         state = FullState.load_from_file(filename)
@@ -30,20 +33,18 @@ def load_state_and_resume(filename: str, api_key_ui: Optional[str] = None):
         state = None
     graph = None
     if api_key_ui:
-        graph, _ = ensure_graph_initialized(api_key_ui)
+        graph, _ = ensure_graph_initialized(api_key_ui, session_id)
         # Use StateGraph's built-in update_state method
         if graph is not None and state is not None:
             try:
-                graph.update_state(state)
-                global LANG_GRAPH_APP
-                LANG_GRAPH_APP = graph
+                graph.update_state(SESSIONS.get(session_id).config, state)
             except Exception as e:
                 print(f"Error updating graph state: {e}")
     return state, graph
 
 
 # --- Gradio handler for file upload ---
-def gradio_load_file(file_obj, api_key_ui=None):
+def gradio_load_file(file_obj, api_key_ui=None, session_id: str = ""):
     """
     Gradio handler to load a state file and resume the conversation.
     """
@@ -53,19 +54,14 @@ def gradio_load_file(file_obj, api_key_ui=None):
     filename = file_obj.name
     print(f"[gradio_load_file] Loading state from file: {filename}")
     # Always initialize the graph before loading state
-    graph, _ = ensure_graph_initialized(api_key_ui)
-    state, _ = load_state_and_resume(filename, api_key_ui)
+    graph, _ = ensure_graph_initialized(api_key_ui, session_id)
+    state, _ = load_state_and_resume(filename, session_id, api_key_ui)
     # print(f"[gradio_load_file] Loaded state: {state}")
     print(f"[gradio_load_file] Graph: {graph}")
     display_history = []
 
-    # Initialize CURRENT_THREAD_ID if not already set
-    global CURRENT_THREAD_ID
-    if CURRENT_THREAD_ID is None:
-        CURRENT_THREAD_ID = generate_thread_id(prefix="chat")
-
     if graph is not None and state is not None:
-        langgraph_config = {"configurable": {"thread_id": CURRENT_THREAD_ID}}
+        langgraph_config = SESSIONS.get(session_id).config
         print(f"[gradio_load_file] Invoking graph with loaded state...")
 
         result = graph.invoke(state, langgraph_config)
@@ -101,22 +97,30 @@ def gradio_load_file(file_obj, api_key_ui=None):
     return display_history
 
 
-# Define a configurable thread_id
-def generate_thread_id(prefix: str = "", length: int = 8) -> str:
+def session_id_from_request(request: Optional[gr.Request]) -> str:
     """
-    Generates a unique thread ID with an optional prefix and specified length.
-    Default length is 8 characters.
+    Key used for the session registry: one session per connected Gradio client.
     """
-    return f'LQ-{prefix}_{str(uuid.uuid4())[:length]}'
+    return getattr(request, "session_hash", None) or "default"
 
 
 # Global state variables
-LANG_GRAPH_APP: Optional[Any] = None
 CURRENT_LLM_INFO: str = "LLM: Not yet determined. Press 'Let's start!' or send a message."
-CURRENT_THREAD_ID: str = generate_thread_id(prefix="chat")
-PREVIOUS_API_KEY_USED: Optional[str] = None
-tts_model = get_tts_model("tts_models/en/jenny/jenny")
-stt_model = get_stt_model('tiny')
+# Audio models load in the background; text chat works while they warm up
+tts_model = BackgroundModel("TTS", get_tts_model, "tts_models/en/jenny/jenny")
+stt_model = BackgroundModel("Whisper", get_stt_model, 'tiny')
+# One transcriber shared by all sessions, so concurrent utterances are decoded in a single batch
+stt_service = BatchedTranscriber(stt_model, window=Config.STT_BATCH_WINDOW, max_batch=Config.STT_MAX_BATCH)
+if Config.PRELOAD_AUDIO_MODELS:
+    tts_model.start()
+    stt_model.start()
+
+
+def audio_status() -> str:
+    """
+    Readiness of the audio models, shown in the UI.
+    """
+    return f"Voice: {tts_model.status} · Speech recognition: {stt_model.status}"
 
 
 # LLM selection logic
@@ -184,62 +188,96 @@ def get_llm(api_key_from_ui: Optional[str] = None):
         raise ValueError(error_message) from e
 
 
+def build_graph(api_key_ui: Optional[str]):
+    """
+    Graph factory used by the session registry.
+    Returns:
+        tuple: (compiled graph, llm_info_string)
+    """
+    llm, llm_info = get_llm(api_key_ui)
+    # Record tokens, latency and cost of every model call (see core/usage.py)
+    return initialize_graph(trace_model(track_usage(llm))), llm_info  # This now calls the function from src.core.graph
+
+
+# Live sessions, one per connected client
+SESSIONS = SessionRegistry(graph_factory=build_graph)
+
+
 # Function to initialize/get graph and LLM info
-def ensure_graph_initialized(api_key_ui: Optional[str]):
-    global LANG_GRAPH_APP, CURRENT_LLM_INFO, PREVIOUS_API_KEY_USED, CURRENT_THREAD_ID
+def ensure_graph_initialized(api_key_ui: Optional[str], session_id: str):
+    session = SESSIONS.ensure_graph(session_id, api_key_ui)
+    return session.graph, session.llm_info
 
-    if LANG_GRAPH_APP is None or PREVIOUS_API_KEY_USED != api_key_ui:
-        print(
-            f"Initializing graph. App is None: {LANG_GRAPH_APP is None}. API key changed: {PREVIOUS_API_KEY_USED != api_key_ui if PREVIOUS_API_KEY_USED else 'N/A' != api_key_ui}")
-        try:
-            llm, llm_info = get_llm(api_key_ui)
-            LANG_GRAPH_APP = initialize_graph(llm)  # This now calls the function from src.core.graph
-            CURRENT_LLM_INFO = f"LLM: {llm_info} (Thread: {CURRENT_THREAD_ID})"
-            PREVIOUS_API_KEY_USED = api_key_ui
-            print(f"Graph initialized successfully with {llm_info} on thread {CURRENT_THREAD_ID}")
-        except Exception as e:
-            error_msg = f"Error initializing chat system: {e}"
-            print(error_msg)
-            LANG_GRAPH_APP = None  # Ensure app is None if initialization fails
-            CURRENT_LLM_INFO = f"Error: {str(e)}. Check API key or Ollama."
-            # Do not raise here; let UI handlers show the error via CURRENT_LLM_INFO
-    return LANG_GRAPH_APP, CURRENT_LLM_INFO
+
+def latest_story_text(values: Dict[str, Any]) -> str:
+    """
+    Returns the last narrative message of a thread's state, or "" if the story does not end with one.
+    """
+    narrative = values.get("narrative")
+    story = getattr(narrative, "story", None) or []
+    if story and isinstance(story[-1], AIMessage):
+        return story[-1].content
+    return ""
 
 
 # --- Gradio Chat Function ---
-def chat_interface_function(message_text: str, api_key_ui: str,
-                            tts_enabled):  # api_key_ui is for ensure_graph_initialized
-    global LANG_GRAPH_APP, CURRENT_THREAD_ID, CURRENT_LLM_INFO
+async def achat_interface_function(message_text: str, api_key_ui: str, tts_enabled, session_id: str):
+    """
+    Runs one turn of the session's conversation and yields the narrative as it streams. Built on `astream`:
+    the graph runs the agents' async entry points, so an in-flight turn waits on the event loop instead of
+    holding a worker thread.
+    """
+    session = SESSIONS.get(session_id)
 
-    # Ensure the graph is initialized with the current API key
-    if LANG_GRAPH_APP is None:
-        yield f"Chat system initialization failed. Details: {CURRENT_LLM_INFO.replace('LLM: ', '')}"
+    if session.graph is None:
+        yield f"Chat system initialization failed. Details: {session.llm_info.replace('LLM: ', '')}"
         return
 
-    # Ensure the thread ID is set
-    langgraph_config = {"configurable": {"thread_id": CURRENT_THREAD_ID}}
     current_turn_input = {"full_history": [HumanMessage(content=message_text)]}
+    turn = USAGE.start_turn(session.thread_id)
+    # Every node, model, STT and TTS span of this turn hangs off one turn span
+    turn_span = start_span("turn", thread_id=session.thread_id, turn=turn)
+    langgraph_config = with_traceparent(session.config, turn_span)
+
+    speaker = StreamingSpeaker(tts_model.get(), text_filter=strip_emoji,
+                               trace_parent=traceparent(turn_span)) if tts_enabled and tts_model.ready else None
+
+    try:
+        output = ""
+        async for chunk, metadata in session.graph.astream(
+                current_turn_input,
+                langgraph_config,
+                stream_mode="messages",
+        ):
+            if metadata['langgraph_node'] == 'narrative_agent':
+                output += chunk.content
+                if speaker:
+                    speaker.feed(chunk.content)
+                yield output
+            else:
+                yield f"*{metadata['langgraph_node']} is processing...*"
+        if not output:
+            output = latest_story_text((await session.graph.aget_state(langgraph_config)).values)
+            if output:
+                if speaker:
+                    speaker.feed(output)
+                yield output
+        if speaker:
+            await asyncio.to_thread(speaker.join)
+    finally:
+        end_span(turn_span)
 
-    output = ""
-    for chunk, metadata in LANG_GRAPH_APP.stream(
-            current_turn_input,
-            langgraph_config,
-            stream_mode="messages",
-    ):
-        if metadata['langgraph_node'] == 'narrative_agent':
-            output += chunk.content
-            yield output
-        else:
-            yield f"*{metadata['langgraph_node']} is processing...*"
-    if tts_enabled:
-        emoji_pattern = re.compile("["
-                                   u"\U0001F600-\U0001F64F"  # emoticons
-                                   u"\U0001F300-\U0001F5FF"  # symbols & pictographs
-                                   u"\U0001F680-\U0001F6FF"  # transport & map symbols
-                                   u"\U0001F1E0-\U0001F1FF"  # flags (iOS)
-                                   "]+", flags=re.UNICODE)
-        output = emoji_pattern.sub(r'', output)
-        speak_text(tts_model, output)
+
+EMOJI_PATTERN = re.compile("["
+                           u"\U0001F600-\U0001F64F"  # emoticons
+                           u"\U0001F300-\U0001F5FF"  # symbols & pictographs
+                           u"\U0001F680-\U0001F6FF"  # transport & map symbols
+                           u"\U0001F1E0-\U0001F1FF"  # flags (iOS)
+                           "]+", flags=re.UNICODE)
+
+
+def strip_emoji(text: str) -> str:
+    return EMOJI_PATTERN.sub(r'', text)
 
 
 # --- Gradio UI Setup ---
@@ -277,10 +315,10 @@ with gr.Blocks(theme=gr.themes.Soft()) as demo:
             toggle_tts = gr.Button("Speak", visible=False)
             # toggle_stt = gr.Audio(sources=['microphone'], label='Record', type='filepath')
 
-    audio_box = gr.Audio(sources=['microphone'], label='Record',
-                         type='filepath', waveform_options=gr.WaveformOptions(waveform_color="#B83A4B"), )
-
-    HARDCODED_AUDIO_PATH = "latest_recording.wav"
+    audio_box = gr.Audio(sources=['microphone'], label='Record', interactive=stt_model.ready,
+                         type='numpy', waveform_options=gr.WaveformOptions(waveform_color="#B83A4B"), )
+    audio_status_display = gr.Markdown(value=audio_status())
+    audio_status_timer = gr.Timer(2.0)
 
     # clear.click(lambda: None, None, msg_textbox, queue=False)
 
@@ -289,8 +327,8 @@ with gr.Blocks(theme=gr.themes.Soft()) as demo:
 
 
     # Event handler for API key changes
-    def handle_api_key_change_effect(api_key: str):
-        _app, llm_info_status = ensure_graph_initialized(api_key)
+    def handle_api_key_change_effect(api_key: str, request: gr.Request):
+        _app, llm_info_status = ensure_graph_initialized(api_key, session_id_from_request(request))
         return llm_info_status
 
 
@@ -303,8 +341,13 @@ with gr.Blocks(theme=gr.themes.Soft()) as demo:
 
 
     # Function to handle starting the story
-    def handle_start_story(current_display_history: List[Dict[str, Any]], api_key: str, tts_enabled):
-        _app, llm_info_status = ensure_graph_initialized(api_key)
+    async def handle_start_story(current_display_history: List[Dict[str, Any]], api_key: str, tts_enabled,
+                                 request: gr.Request):
+        session_id = session_id_from_request(request)
+        # Load the audio models on first use if they were not preloaded at startup
+        tts_model.start()
+        stt_model.start()
+        _app, llm_info_status = await asyncio.to_thread(ensure_graph_initialized, api_key, session_id)
         if not isinstance(current_display_history, list): current_display_history = []
         full_display_history = current_display_history + [{"role": "assistant", "content": ""}]
         if not _app:
@@ -318,7 +361,7 @@ with gr.Blocks(theme=gr.themes.Soft()) as demo:
         yield full_display_history, llm_info_status, gr.update(visible=False), gr.update(visible=True), gr.update(
             visible=True), gr.update(visible=True), gr.update(visible=False), gr.update(visible=True)
         full_response = ""
-        for ai_response_chunk in chat_interface_function("--- START NOW ---", api_key, tts_enabled):
+        async for ai_response_chunk in achat_interface_function("--- START NOW ---", api_key, tts_enabled, session_id):
             full_response = ai_response_chunk
             full_display_history[-1]["content"] = full_response
             yield full_display_history, llm_info_status, gr.update(visible=False), gr.update(visible=True), gr.update(
@@ -384,11 +427,12 @@ with gr.Blocks(theme=gr.themes.Soft()) as demo:
             )"""
 
 
-    def process_message(message_text: str, current_display_history: List[Dict[str, Any]], api_key: str, tts_enabled):
+    async def process_message(message_text: str, current_display_history: List[Dict[str, Any]], api_key: str,
+                              tts_enabled, session_id: str):
         if not isinstance(current_display_history, list):
             current_display_history = []
 
-        _app, llm_info_status = ensure_graph_initialized(api_key)
+        _app, llm_info_status = await asyncio.to_thread(ensure_graph_initialized, api_key, session_id)
 
         full_display_history = current_display_history + [{"role": "user", "content": message_text}]
         full_display_history = full_display_history + [{"role": "assistant", "content": ""}]
@@ -403,17 +447,19 @@ with gr.Blocks(theme=gr.themes.Soft()) as demo:
         yield full_display_history, llm_info_status, True  # Ready to respond
 
         full_response = ""
-        for ai_response_chunk in chat_interface_function(message_text, api_key, tts_enabled):
+        async for ai_response_chunk in achat_interface_function(message_text, api_key, tts_enabled, session_id):
             full_response = ai_response_chunk
             full_display_history[-1]["content"] = full_response
             yield full_display_history, llm_info_status, True
 
 
-    def handle_submit(message_text: str, current_display_history: List[Dict[str, Any]], api_key: str, tts_enabled):
+    async def handle_submit(message_text: str, current_display_history: List[Dict[str, Any]], api_key: str,
+                            tts_enabled, request: gr.Request):
+        session_id = session_id_from_request(request)
         if not message_text.strip():
             yield (
                 current_display_history,  # chatbot
-                CURRENT_LLM_INFO,  # llm_status_display
+                SESSIONS.get(session_id).llm_info,  # llm_status_display
                 gr.update(visible=False),  # start_button
                 gr.update(visible=True),  # msg_textbox
                 gr.update(visible=True),  # clear_button
@@ -423,8 +469,9 @@ with gr.Blocks(theme=gr.themes.Soft()) as demo:
             )
             return
 
-        for step, (chat_history, llm_status, ready) in enumerate(
-                process_message(message_text, current_display_history, api_key, tts_enabled)):
+        step = 0
+        async for chat_history, llm_status, ready in process_message(message_text, current_display_history, api_key,
+                                                                     tts_enabled, session_id):
             if step == 0:
                 # First yield: setup
                 yield (
@@ -449,20 +496,18 @@ with gr.Blocks(theme=gr.themes.Soft()) as demo:
                     gr.update(visible=False),
                     gr.update(visible=True),
                 )
+            step += 1
 
 
     # Function to clear chat and reset thread
-    def clear_chat_and_reset_thread():
-        global LANG_GRAPH_APP, CURRENT_THREAD_ID, CURRENT_LLM_INFO, PREVIOUS_API_KEY_USED
-        LANG_GRAPH_APP = None
-        PREVIOUS_API_KEY_USED = None
-        CURRENT_THREAD_ID = generate_thread_id(prefix="chat")
-        new_llm_status = f"Chat cleared. New Thread: {CURRENT_THREAD_ID}. LLM will re-initialize on next message."
-        CURRENT_LLM_INFO = new_llm_status
-        print(f"Chat cleared. New thread: {CURRENT_THREAD_ID}. Graph will re-initialize on next interaction.")
-        # Hide chat controls, show start button
+    def clear_chat_and_reset_thread(request: gr.Request):
+        session = SESSIONS.reset(session_id_from_request(request))
+        new_llm_status = f"Chat cleared. New Thread: {session.thread_id}. LLM will re-initialize on next message."
+        session.llm_info = new_llm_status
+        print(f"Chat cleared. New thread: {session.thread_id}. Graph will re-initialize on next interaction.")
+        # Hide chat controls, show start button; the browser keeps the new conversation's resume key
         return [], new_llm_status, gr.update(visible=True), gr.update(visible=False), gr.update(
-            visible=False), gr.update(visible=False), gr.update(visible=True)
+            visible=False), gr.update(visible=False), gr.update(visible=True), session.resume_key
 
 
     def toggle_tts_state(current_value):
@@ -470,19 +515,54 @@ with gr.Blocks(theme=gr.themes.Soft()) as demo:
         label = "Mute" if new_value else "Speak"
         return new_value, label
 
-    def handle_audio(audio_tmp_path, current_display_history, api_key, tts_enabled):
-        if audio_tmp_path is None:
+    async def handle_audio(recording, current_display_history, api_key, tts_enabled, request: gr.Request):
+        if recording is None:
             yield current_display_history, "LLM: no input"
             return
+        if not stt_model.ready:
+            yield current_display_history, f"Speech recognition is {stt_model.status}, please type your reply."
+            return
 
-        shutil.copy(audio_tmp_path, HARDCODED_AUDIO_PATH)
-        transcript = transcribe_speech(stt_model, HARDCODED_AUDIO_PATH)
+        # The recording arrives as an in-memory (samplerate, samples) tuple, private to this request
+        with span("stt.transcribe"):
+            transcript = await asyncio.wrap_future(stt_service.submit(recording))
 
-        for chat_history, llm_status, _ in process_message(transcript, current_display_history, api_key, tts_enabled):
+        async for chat_history, llm_status, _ in process_message(transcript, current_display_history, api_key,
+                                                                 tts_enabled, session_id_from_request(request)):
             yield chat_history, llm_status
 
 
+    def refresh_audio_status():
+        # Turn audio features on once their models are ready, then stop polling
+        loading = any(status in ("not loaded", "loading") for status in (tts_model.status, stt_model.status))
+        return (audio_status(), gr.update(interactive=stt_model.ready), gr.update(interactive=tts_model.ready),
+                gr.Timer(active=loading))
+
+
+    def handle_file_load(file_obj, api_key, request: gr.Request):
+        return (gradio_load_file(file_obj, api_key, session_id_from_request(request)), gr.update(visible=False),
+                gr.update(visible=False), gr.update(visible=True), gr.update(visible=True), gr.update(visible=True),
+                gr.update(visible=False))
+
+
+    def handle_load(stored_resume_key: str, request: gr.Request):
+        # Reattach this browser to its earlier conversation (the key is kept across reloads and server restarts);
+        # the registry hands out a new key when there is nothing durable to resume or another tab has it
+        session_id = session_id_from_request(request)
+        if stored_resume_key:
+            session = SESSIONS.resume(session_id, stored_resume_key)
+        else:
+            session = SESSIONS.get(session_id)
+        return session.resume_key
+
+
+    def handle_unload(request: gr.Request):
+        # Free the session when the client disconnects (durable checkpoints are kept for resuming)
+        SESSIONS.close(session_id_from_request(request))
+
+
     tts_enabled = gr.State(value=False)
+    resume_key = gr.BrowserState("", storage_key="lexiquest-resume-key")
 
     audio_box.change(
         fn=handle_audio,
@@ -490,6 +570,13 @@ with gr.Blocks(theme=gr.themes.Soft()) as demo:
         outputs=[chatbot, llm_status_display]
     ).then(lambda: None, None, audio_box, queue=False)
 
+    audio_status_timer.tick(
+        fn=refresh_audio_status,
+        inputs=[],
+        outputs=[audio_status_display, audio_box, toggle_tts, audio_status_timer],
+        show_progress="hidden"
+    )
+
     toggle_tts.click(
         toggle_tts_state,
         inputs=[tts_enabled],
@@ -522,17 +609,18 @@ with gr.Blocks(theme=gr.themes.Soft()) as demo:
     clear_button.click(
         fn=clear_chat_and_reset_thread,
         inputs=[],
-        outputs=[chatbot, llm_status_display, start_button, msg_textbox, clear_button, submit_button, file_loader],
+        outputs=[chatbot, llm_status_display, start_button, msg_textbox, clear_button, submit_button, file_loader,
+                 resume_key],
         show_progress=True
     )
     file_loader.change(
-        fn=lambda file_obj, api_key: (
-            gradio_load_file(file_obj, api_key), gr.update(visible=False), gr.update(visible=False),
-            gr.update(visible=True), gr.update(visible=True), gr.update(visible=True), gr.update(visible=False)),
+        fn=handle_file_load,
         inputs=[file_loader, api_key_textbox],
         outputs=[chatbot, llm_status_display, start_button, msg_textbox, clear_button, submit_button, file_loader],
         show_progress=True
     )
+    demo.load(handle_load, inputs=[resume_key], outputs=[resume_key])
+    demo.unload(handle_unload)
 
 # --- Main Execution ---
 if __name__ == "__main__":
@@ -547,6 +635,6 @@ if __name__ == "__main__":
 
     print(f"OpenAI API Key from env: {'Set' if os.environ.get('OPENAI_API_KEY') else 'Not set'}")
     print(f"Google API Key from env: {'Set' if os.environ.get('GOOGLE_API_KEY') else 'Not set'}")
-    print(f"Initial Thread ID: {CURRENT_THREAD_ID}")
+    print(f"Session capacity: {SESSIONS.capacity}, idle TTL: {SESSIONS.idle_ttl}s")
 
     demo.launch()
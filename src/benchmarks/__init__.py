@@ -0,0 +1 @@
+# Submodules are imported on demand, so `python -m benchmarks` can set up the environment before core is loaded
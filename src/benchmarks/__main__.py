@@ -0,0 +1,75 @@
+"""
+End-to-end benchmark of the LexiQuest graph with a scripted fake LLM (no API calls).
+
+Run from the repository root:
+    PYTHONPATH=src python -m benchmarks --sessions 5 --turns 20 --first-token-latency 0.3 --output bench.json
+    PYTHONPATH=src python -m benchmarks --baseline bench-main.json --max-regression 0.2
+"""
+import sys
+import json
+import asyncio
+import argparse
+
+from .environment import prepare_environment
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay scripted sessions through the graph with a fake LLM.")
+    parser.add_argument("--sessions", type=int, default=3, help="Number of sessions, run one after another")
+    parser.add_argument("--turns", type=int, default=15, help="Child messages per session")
+    parser.add_argument("--first-token-latency", type=float, default=0.0,
+                        help="Simulated seconds before the first token of each model call")
+    parser.add_argument("--token-latency", type=float, default=0.0,
+                        help="Simulated seconds between streamed chunks")
+    parser.add_argument("--survey-questions", type=int, default=4)
+    parser.add_argument("--skip-survey", action="store_true", help="Start the story right away")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Drive the graph with astream")
+    parser.add_argument("--checkpointer", choices=["memory", "sqlite"], default="memory")
+    parser.add_argument("--output", default="bench.json", help="Machine-readable report")
+    parser.add_argument("--baseline", help="Earlier report to compare against")
+    parser.add_argument("--max-regression", type=float,
+                        help="Exit with status 1 if p95 latency or overhead grew by more than this fraction")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    prepare_environment(args.checkpointer)
+    # Only imported now: Config reads the environment prepared above
+    from .runner import arun_session, build_fake_graph, compare, run_session, write_report
+    from .scripts import ScriptedChild
+
+    graph = build_fake_graph(args.first_token_latency, args.token_latency, args.survey_questions)
+    child = ScriptedChild(skip_survey=args.skip_survey)
+
+    records = []
+    for i in range(args.sessions):
+        print(f"[benchmarks] Session {i + 1}/{args.sessions}")
+        if args.use_async:
+            records += asyncio.run(arun_session(graph, child, args.turns))
+        else:
+            records += run_session(graph, child, args.turns)
+
+    report = write_report(args.output, vars(args), records)
+    summary = report["summary"]
+    print(f"[benchmarks] {summary['turns']} turns: latency p50 {summary['latency_s']['p50']:.3f}s "
+          f"p95 {summary['latency_s']['p95']:.3f}s, overhead p50 {summary['overhead_s']['p50']:.3f}s, "
+          f"peak RSS {summary['peak_rss_mb']:.0f} MB -> {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            deltas = compare(report, json.load(f))
+        for name, delta in deltas.items():
+            change = f"{delta['change']:+.1%}" if delta["change"] is not None else "n/a"
+            print(f"[benchmarks] {name}: {delta['baseline']} -> {delta['current']} ({change})")
+        if args.max_regression is not None:
+            regressed = [name for name in ("latency_p95", "overhead_p95")
+                         if (deltas[name]["change"] or 0) > args.max_regression]
+            if regressed:
+                print(f"[benchmarks] Regression beyond {args.max_regression:.0%}: {', '.join(regressed)}")
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+import os
+import tempfile
+
+
+def prepare_environment(checkpointer: str = "memory") -> str:
+    """
+    Points the app's databases and logs at a scratch directory so benchmark runs leave the real ones alone.
+    Config reads the environment on import, so this must run before anything from core is imported.
+    :param checkpointer: Value for LQ_CHECKPOINTER
+    :return str: The scratch directory
+    """
+    workdir = tempfile.mkdtemp(prefix="lq-bench-")
+    os.environ["LQ_CHECKPOINTER"] = checkpointer
+    os.environ.setdefault("LQ_CHECKPOINT_DB", os.path.join(workdir, "checkpoints.sqlite"))
+    os.environ.setdefault("LQ_CHALLENGE_BANK_DB", os.path.join(workdir, "challenge_bank.sqlite"))
+    os.environ.setdefault("LQ_USAGE_LOG", "")
+    os.environ.setdefault("LQ_ASSESSMENT_EXPORT_DIR", os.path.join(workdir, "assessments"))
+    os.environ.setdefault("LQ_ASSESSMENT_DB", os.path.join(workdir, "assessments.sqlite"))
+    return workdir
@@ -0,0 +1,115 @@
+import time
+import asyncio
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+
+def count_tokens(text: str) -> int:
+    # Rough estimate (about 4 characters per token), good enough for the usage records
+    return max(1, len(text) // 4)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic chat model for benchmarks: answers come from a `responder` instead of an API, after a
+    configurable simulated latency, so the graph can be timed without paying for (or waiting on) real calls.
+
+    The responder is called with the prompt messages and, for `with_structured_output` calls, the requested
+    schema; it returns the reply text, or an instance of the schema. Replies are streamed token by token, so
+    stream_mode="messages" behaves as with a real model, and report token usage so core/usage.py records them.
+    """
+
+    responder: Callable[[List[BaseMessage], Optional[type]], Any]
+    model_name: str = "fake-chat"
+    # Seconds before the first token, and between tokens
+    first_token_latency: float = 0.0
+    token_latency: float = 0.0
+    # Characters per streamed chunk
+    chunk_size: int = 16
+
+    @property
+    def _llm_type(self) -> str:
+        return "lexiquest-fake"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model_name": self.model_name}
+
+    def with_structured_output(self, schema, **kwargs):
+        """
+        Returns a runnable producing instances of `schema`: the responder's answer goes through the model as
+        JSON (so it is streamed, timed and recorded like any other call) and is parsed back.
+        """
+        return self.bind(schema=schema) | RunnableLambda(lambda message: schema.model_validate_json(message.content))
+
+    def _reply(self, messages: List[BaseMessage], schema: Optional[type]) -> str:
+        reply = self.responder(messages, schema)
+        return reply.model_dump_json() if schema is not None else reply
+
+    def _chunks(self, text: str) -> List[str]:
+        return [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)] or [""]
+
+    def _result(self, messages: List[BaseMessage], text: str) -> AIMessage:
+        return AIMessage(content=text, usage_metadata=self._usage(messages, text))
+
+    @staticmethod
+    def _usage(messages: List[BaseMessage], text: str) -> dict:
+        input_tokens = sum(count_tokens(str(msg.content)) for msg in messages)
+        output_tokens = count_tokens(text)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens}
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, schema: Optional[type] = None,
+                  **kwargs: Any) -> ChatResult:
+        text = self._reply(messages, schema)
+        time.sleep(self.first_token_latency + self.token_latency * (len(self._chunks(text)) - 1))
+        return ChatResult(generations=[ChatGeneration(message=self._result(messages, text))],
+                          llm_output={"model_name": self.model_name})
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, schema: Optional[type] = None,
+                         **kwargs: Any) -> ChatResult:
+        text = self._reply(messages, schema)
+        await asyncio.sleep(self.first_token_latency + self.token_latency * (len(self._chunks(text)) - 1))
+        return ChatResult(generations=[ChatGeneration(message=self._result(messages, text))],
+                          llm_output={"model_name": self.model_name})
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, schema: Optional[type] = None,
+                **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        text = self._reply(messages, schema)
+        chunks = self._chunks(text)
+        time.sleep(self.first_token_latency)
+        for i, piece in enumerate(chunks):
+            if i:
+                time.sleep(self.token_latency)
+            yield self._chunk(messages, text, piece, last=i == len(chunks) - 1, run_manager=run_manager)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, schema: Optional[type] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        text = self._reply(messages, schema)
+        chunks = self._chunks(text)
+        await asyncio.sleep(self.first_token_latency)
+        for i, piece in enumerate(chunks):
+            if i:
+                await asyncio.sleep(self.token_latency)
+            chunk = self._chunk(messages, text, piece, last=i == len(chunks) - 1)
+            if run_manager:
+                await run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+
+    def _chunk(self, messages: List[BaseMessage], text: str, piece: str, last: bool,
+               run_manager: Optional[CallbackManagerForLLMRun] = None) -> ChatGenerationChunk:
+        # Usage is reported once, on the last chunk, like the OpenAI integration does
+        message = AIMessageChunk(content=piece, usage_metadata=self._usage(messages, text) if last else None)
+        chunk = ChatGenerationChunk(message=message)
+        if run_manager:
+            run_manager.on_llm_new_token(piece, chunk=chunk)
+        return chunk
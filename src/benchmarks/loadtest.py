@@ -0,0 +1,291 @@
+"""
+Concurrent-session load generator for the Gradio app: N simulated children run whole sessions at once
+(start, text replies, optionally voice replies) while the concurrency ramps up level by level.
+
+Run from the repository root:
+    # In-process: calls the app's handlers directly, with the fake LLM
+    PYTHONPATH=src python -m benchmarks.loadtest --levels 1,4,16,32 --turns 8
+    # Over HTTP: serve the app with the fake LLM, then drive it through gradio_client
+    PYTHONPATH=src python -m benchmarks.loadtest --serve --port 7861 --concurrency-limit 16
+    PYTHONPATH=src python -m benchmarks.loadtest --url http://127.0.0.1:7861 --levels 1,4,16
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from .environment import prepare_environment
+from .stats import distribution
+
+# Gradio API name of the handler serving each kind of turn
+HTTP_ENDPOINTS = {"start": "/handle_start_story", "text": "/handle_submit", "audio": "/handle_audio"}
+
+WORDS = ("dragon castle moon rocket forest river friend jump run fly open look find brave tiny happy "
+         "why where what can we go the a to and is my").split()
+
+
+class RandomChild:
+    """
+    Child replying with random short sentences; works without access to the graph state (e.g. over HTTP).
+    """
+
+    def __init__(self, seed: int):
+        self.random = random.Random(seed)
+
+    def next_message(self, values: Dict[str, Any], turn: int) -> str:
+        return " ".join(self.random.choice(WORDS) for _ in range(self.random.randint(3, 10))).capitalize() + "."
+
+
+def synthetic_recording(seconds: float = 1.5, samplerate: int = 16000):
+    """
+    A (samplerate, int16 samples) recording, as gr.Audio(type='numpy') delivers it: a warbling tone.
+    """
+    import numpy as np
+    t = np.arange(int(seconds * samplerate)) / samplerate
+    samples = 0.3 * np.sin(2 * np.pi * (220 + 60 * np.sin(2 * np.pi * 3 * t)) * t)
+    return samplerate, (samples * 32767).astype(np.int16)
+
+
+def has_reply(history) -> bool:
+    # The handlers first show "..." and "*<node> is processing...*" placeholders
+    if not history or history[-1].get("role") != "assistant":
+        return False
+    content = history[-1].get("content") or ""
+    return bool(content) and content != "..." and not content.startswith("*")
+
+
+class TurnTimer:
+    """
+    Times one handler call from its updates: queueing delay (until the first update), time to the first
+    story text and total latency.
+    """
+
+    def __init__(self, level: int, child: int, turn: int, kind: str):
+        self.record = {"level": level, "child": child, "turn": turn, "kind": kind, "queue_s": None,
+                       "ttft_s": None, "latency_s": None, "error": None}
+        self.started = time.perf_counter()
+        self.history = None
+
+    def update(self, history):
+        elapsed = time.perf_counter() - self.started
+        if self.record["queue_s"] is None:
+            self.record["queue_s"] = elapsed
+        if self.record["ttft_s"] is None and has_reply(history):
+            self.record["ttft_s"] = elapsed
+        self.history = history
+
+    def finish(self, error: Optional[BaseException] = None) -> Dict[str, Any]:
+        self.record["latency_s"] = time.perf_counter() - self.started
+        if error is not None:
+            self.record["error"] = f"{type(error).__name__}: {error}"
+        return self.record
+
+
+async def run_child_in_process(app, level: int, index: int, child, turns: int, think: float,
+                               audio_ratio: float, timeout: float) -> List[Dict[str, Any]]:
+    """
+    One simulated child calling the app's handlers directly, with a request carrying its own session hash.
+    """
+    rng = random.Random(index)
+    request = SimpleNamespace(session_hash=f"load-{level}-{index}")
+    history, records = [], []
+    for turn in range(turns):
+        if turn == 0:
+            kind, updates = "start", app.handle_start_story(history, "", False, request)
+        elif audio_ratio and rng.random() < audio_ratio:
+            kind, updates = "audio", app.handle_audio(synthetic_recording(), history, "", False, request)
+        else:
+            session = app.SESSIONS.get(request.session_hash)
+            values = (await session.graph.aget_state(session.config)).values if session.graph else {}
+            kind, updates = "text", app.handle_submit(child.next_message(values, turn), history, "", False, request)
+
+        timer = TurnTimer(level, index, turn, kind)
+        try:
+            async def consume():
+                async for outputs in updates:
+                    timer.update(outputs[0])
+            await asyncio.wait_for(consume(), timeout)
+            records.append(timer.finish())
+        except Exception as e:
+            records.append(timer.finish(e))
+        if isinstance(timer.history, list):
+            history = timer.history
+        if think:
+            await asyncio.sleep(rng.expovariate(1 / think))
+
+    app.handle_unload(request)
+    return records
+
+
+def run_child_http(url: str, level: int, index: int, child, turns: int, think: float, audio_ratio: float,
+                   timeout: float, recording_path: Optional[str]) -> List[Dict[str, Any]]:
+    """
+    One simulated child driving a running app through gradio_client (one client, hence one session, per child).
+    """
+    from gradio_client import Client, handle_file
+
+    rng = random.Random(index)
+    client = Client(url, verbose=False)
+    history, records = [], []
+    for turn in range(turns):
+        if turn == 0:
+            kind, inputs = "start", (history, "")
+        elif audio_ratio and recording_path and rng.random() < audio_ratio:
+            kind, inputs = "audio", (handle_file(recording_path), history, "")
+        else:
+            kind, inputs = "text", (child.next_message({}, turn), history, "")
+
+        timer = TurnTimer(level, index, turn, kind)
+        try:
+            job = client.submit(*inputs, api_name=HTTP_ENDPOINTS[kind])
+            for outputs in job:
+                timer.update(outputs[0])
+            job.result(timeout=timeout)
+            records.append(timer.finish())
+        except Exception as e:
+            records.append(timer.finish(e))
+        if isinstance(timer.history, list):
+            history = timer.history
+        if think:
+            time.sleep(rng.expovariate(1 / think))
+
+    client.close()
+    return records
+
+
+def summarize_level(level: int, records: List[Dict[str, Any]], wall_s: float) -> Dict[str, Any]:
+    ok = [r for r in records if r["error"] is None]
+    errors = {}
+    for r in records:
+        if r["error"] is not None:
+            kind = r["error"].split(":")[0]
+            errors[kind] = errors.get(kind, 0) + 1
+    return {
+        "concurrency": level,
+        "turns": len(records),
+        "wall_s": wall_s,
+        "throughput_turns_per_s": len(ok) / wall_s if wall_s else None,
+        "error_rate": (len(records) - len(ok)) / len(records) if records else None,
+        "errors": errors,
+        "queue_s": distribution([r["queue_s"] for r in ok if r["queue_s"] is not None]),
+        "ttft_s": distribution([r["ttft_s"] for r in ok if r["ttft_s"] is not None]),
+        "latency_s": distribution([r["latency_s"] for r in ok]),
+    }
+
+
+def make_child(kind: str, seed: int):
+    if kind == "scripted":
+        from .scripts import ScriptedChild
+        return ScriptedChild()
+    return RandomChild(seed)
+
+
+async def run_level_in_process(app, level: int, args) -> List[Dict[str, Any]]:
+    results = await asyncio.gather(*(
+        run_child_in_process(app, level, i, make_child(args.child, i), args.turns, args.think,
+                             args.audio_ratio, args.timeout)
+        for i in range(level)
+    ))
+    return [record for records in results for record in records]
+
+
+def run_level_http(level: int, args, recording_path: Optional[str]) -> List[Dict[str, Any]]:
+    with ThreadPoolExecutor(max_workers=level) as pool:
+        futures = [pool.submit(run_child_http, args.url, level, i, make_child(args.child, i), args.turns,
+                               args.think, args.audio_ratio, args.timeout, recording_path)
+                   for i in range(level)]
+        return [record for future in futures for record in future.result()]
+
+
+def write_recording() -> str:
+    import wave
+    samplerate, samples = synthetic_recording()
+    path = tempfile.NamedTemporaryFile(prefix="lq-load-", suffix=".wav", delete=False).name
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(samplerate)
+        f.writeframes(samples.tobytes())
+    return path
+
+
+def use_fake_llm(app, args):
+    """
+    Makes the app's session registry build graphs around the fake LLM instead of a real provider.
+    """
+    from .runner import build_fake_graph
+    graph = build_fake_graph(args.first_token_latency, args.token_latency)
+    app.SESSIONS.graph_factory = lambda api_key: (graph, "Fake LLM (load test)")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Ramp up concurrent simulated children against the app.")
+    parser.add_argument("--levels", default="1,2,4,8,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--turns", type=int, default=8, help="Handler calls per child (the first starts the story)")
+    parser.add_argument("--child", choices=["random", "scripted"], default="random",
+                        help="Reply generator; 'scripted' reads the session state, so it needs in-process mode")
+    parser.add_argument("--think", type=float, default=0.0, help="Mean think time between turns, in seconds")
+    parser.add_argument("--audio-ratio", type=float, default=0.0, help="Fraction of replies sent as voice")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds before a turn counts as failed")
+    parser.add_argument("--llm", choices=["fake", "real"], default="fake",
+                        help="In-process/serve: local stand-in LLM or the app's own provider selection")
+    parser.add_argument("--first-token-latency", type=float, default=0.5)
+    parser.add_argument("--token-latency", type=float, default=0.02)
+    parser.add_argument("--url", help="Drive a running app over HTTP instead of calling the handlers in-process")
+    parser.add_argument("--serve", action="store_true", help="Launch the app (with --llm) for HTTP load tests")
+    parser.add_argument("--port", type=int, default=7861)
+    parser.add_argument("--concurrency-limit", type=int, default=1,
+                        help="--serve: Gradio's default_concurrency_limit (events processed at once)")
+    parser.add_argument("--output", default="loadtest.json")
+    args = parser.parse_args()
+    if args.url and args.child == "scripted":
+        parser.error("--child scripted needs the session state, which is only available in-process")
+    return args
+
+
+def main():
+    args = parse_args()
+
+    if args.serve or not args.url:
+        prepare_environment()
+        import app
+        if args.llm == "fake":
+            use_fake_llm(app, args)
+        if args.audio_ratio and not args.serve:
+            # Otherwise voice turns would only measure the "still loading" reply
+            print("[loadtest] Waiting for the speech recognition model...")
+            app.stt_model.get()
+        if args.serve:
+            print(f"[loadtest] Serving the app on port {args.port} ({args.llm} LLM)")
+            app.demo.queue(default_concurrency_limit=args.concurrency_limit).launch(server_port=args.port)
+            return
+
+    recording_path = write_recording() if args.url and args.audio_ratio else None
+    levels = [int(level) for level in args.levels.split(",")]
+    summaries, records = [], []
+    for level in levels:
+        started = time.perf_counter()
+        if args.url:
+            level_records = run_level_http(level, args, recording_path)
+        else:
+            level_records = asyncio.run(run_level_in_process(app, level, args))
+        summary = summarize_level(level, level_records, time.perf_counter() - started)
+        summaries.append(summary)
+        records += level_records
+        print(f"[loadtest] concurrency {level:>3}: {summary['throughput_turns_per_s']:.2f} turns/s, "
+              f"latency p50 {summary['latency_s']['p50'] or 0:.2f}s p99 {summary['latency_s']['p99'] or 0:.2f}s, "
+              f"queue p95 {summary['queue_s']['p95'] or 0:.2f}s, errors {summary['error_rate']:.1%}")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"benchmark": "lexiquest-load", "timestamp": time.time(), "settings": vars(args),
+                   "levels": summaries, "turns": records}, f, indent=2)
+    print(f"[loadtest] Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
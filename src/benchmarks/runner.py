@@ -0,0 +1,188 @@
+import sys
+import time
+import json
+import resource
+import subprocess
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import HumanMessage
+
+from core.graph import initialize_graph
+from core.prescoring import PRESCORE_STATS
+from core.profanity import PROFANITY_SCREEN
+from core.sessions import generate_thread_id
+from core.tracing import trace_model
+from core.usage import USAGE, track_usage
+from .fake_llm import FakeChatModel
+from .scripts import ScriptedChild, ScriptedResponder
+from .stats import distribution
+
+
+def build_fake_graph(first_token_latency: float = 0.0, token_latency: float = 0.0, survey_questions: int = 4,
+                     story_sentences: int = 5):
+    """
+    Compiles the real graph around a FakeChatModel playing a ScriptedResponder.
+    :param first_token_latency: Simulated seconds before the first token of every model call
+    :param token_latency: Simulated seconds between streamed chunks
+    """
+    llm = FakeChatModel(responder=ScriptedResponder(survey_questions, story_sentences),
+                        first_token_latency=first_token_latency, token_latency=token_latency)
+    return initialize_graph(trace_model(track_usage(llm)))
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def checkpoint_bytes(graph, config: dict) -> int:
+    """
+    Serialized size of the thread's latest checkpoint.
+    """
+    checkpoint = graph.checkpointer.get_tuple(config)
+    if checkpoint is None:
+        return 0
+    return len(graph.checkpointer.serde.dumps_typed(checkpoint.checkpoint)[1])
+
+
+def turn_record(thread_id: str, turn: int, phase: str, started: float, first_token: Optional[float],
+                ended: float) -> Dict[str, Any]:
+    # Model time of the calls made by graph nodes this turn (background jobs overlap the turn, so they are left out)
+    calls = [r for r in USAGE.records(thread_id) if r["turn"] == turn and r["agent"] != "background"]
+    latency = ended - started
+    model_s = sum(r["latency_s"] for r in calls)
+    return {
+        "thread_id": thread_id,
+        "turn": turn,
+        "phase": phase,
+        "latency_s": latency,
+        "ttft_s": first_token - started if first_token is not None else None,
+        "model_s": model_s,
+        # What the turn costs beyond waiting on the model: routing, state (de)serialization, checkpointing, ...
+        "overhead_s": max(latency - model_s, 0.0),
+        "model_calls": len(calls),
+    }
+
+
+def run_session(graph, child: ScriptedChild, turns: int) -> List[Dict[str, Any]]:
+    """
+    Replays `turns` child messages through the graph on a new thread with `stream`, as the Gradio app does.
+    """
+    thread_id = generate_thread_id(prefix="bench")
+    config = {"configurable": {"thread_id": thread_id}}
+    records = []
+    for i in range(turns):
+        values = graph.get_state(config).values
+        phase = child.phase(values)
+        message = child.next_message(values, i)
+
+        turn = USAGE.start_turn(thread_id)
+        started, first_token = time.perf_counter(), None
+        for chunk, metadata in graph.stream({"full_history": [HumanMessage(content=message)]}, config,
+                                            stream_mode="messages"):
+            if first_token is None and metadata["langgraph_node"] == "narrative_agent" and chunk.content:
+                first_token = time.perf_counter()
+        records.append(turn_record(thread_id, turn, phase, started, first_token, time.perf_counter()))
+
+    records[-1]["checkpoint_bytes"] = checkpoint_bytes(graph, config)
+    return records
+
+
+async def arun_session(graph, child: ScriptedChild, turns: int) -> List[Dict[str, Any]]:
+    """
+    Async variant of run_session, driving the agents' async entry points with `astream`.
+    """
+    thread_id = generate_thread_id(prefix="bench")
+    config = {"configurable": {"thread_id": thread_id}}
+    records = []
+    for i in range(turns):
+        values = (await graph.aget_state(config)).values
+        phase = child.phase(values)
+        message = child.next_message(values, i)
+
+        turn = USAGE.start_turn(thread_id)
+        started, first_token = time.perf_counter(), None
+        async for chunk, metadata in graph.astream({"full_history": [HumanMessage(content=message)]}, config,
+                                                   stream_mode="messages"):
+            if first_token is None and metadata["langgraph_node"] == "narrative_agent" and chunk.content:
+                first_token = time.perf_counter()
+        records.append(turn_record(thread_id, turn, phase, started, first_token, time.perf_counter()))
+
+    records[-1]["checkpoint_bytes"] = checkpoint_bytes(graph, config)
+    return records
+
+
+def summarize(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Latency, time-to-first-token and overhead percentiles, overall and per phase, plus resource figures.
+    """
+    summary = {
+        "turns": len(records),
+        "latency_s": distribution([r["latency_s"] for r in records]),
+        "ttft_s": distribution([r["ttft_s"] for r in records if r["ttft_s"] is not None]),
+        "overhead_s": distribution([r["overhead_s"] for r in records]),
+        "model_calls_per_turn": sum(r["model_calls"] for r in records) / len(records) if records else None,
+        "by_phase": {},
+        "checkpoint_bytes": distribution([r["checkpoint_bytes"] for r in records if "checkpoint_bytes" in r]),
+        "peak_rss_mb": peak_rss_mb(),
+        # Assessed items (and answers) the local pre-scorer settled without an evaluation call
+        "prescore": PRESCORE_STATS.summary(),
+        # Alignment checks by deciding path (cache, fast, guardrails) with their latency percentiles
+        "profanity_checks": PROFANITY_SCREEN.stats(),
+    }
+    for phase in sorted({r["phase"] for r in records}):
+        phase_records = [r for r in records if r["phase"] == phase]
+        summary["by_phase"][phase] = {
+            "latency_s": distribution([r["latency_s"] for r in phase_records]),
+            "overhead_s": distribution([r["overhead_s"] for r in phase_records]),
+        }
+    return summary
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Relative change of the headline figures between two reports (positive means slower or bigger).
+    """
+    def pick(report, *path):
+        value = report["summary"]
+        for key in path:
+            value = (value or {}).get(key)
+        return value
+
+    deltas = {}
+    for name, path in {
+        "latency_p50": ("latency_s", "p50"),
+        "latency_p95": ("latency_s", "p95"),
+        "ttft_p50": ("ttft_s", "p50"),
+        "overhead_p50": ("overhead_s", "p50"),
+        "overhead_p95": ("overhead_s", "p95"),
+        "checkpoint_bytes_p50": ("checkpoint_bytes", "p50"),
+        "peak_rss_mb": ("peak_rss_mb",),
+    }.items():
+        new, old = pick(current, *path), pick(baseline, *path)
+        change = (new - old) / old if new is not None and old else None
+        deltas[name] = {"baseline": old, "current": new, "change": change}
+    return deltas
+
+
+def write_report(path: str, settings: Dict[str, Any], records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    report = {
+        "benchmark": "lexiquest-e2e",
+        "timestamp": time.time(),
+        "commit": git_commit(),
+        "settings": settings,
+        "summary": summarize(records),
+        "turns": records,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return report
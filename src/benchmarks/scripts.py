@@ -0,0 +1,212 @@
+import re
+import threading
+import typing
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import BaseMessage
+
+from agents.manager_agent import ManagerDecision
+from core.assessments import VAItemAssessment, VAItemEvaluation, VAPairingList
+from core.challenges import ChallengeTriplet, PhonemicAwareness
+from core.usage import current_usage_label
+
+# (x, y, z, why x and y go together, why x and z go together)
+TRIPLETS = [
+    ("dog", "cat", "bone", "they are both animals", "dogs like bones"),
+    ("light", "sun", "feather", "the sun gives light", "a feather is light"),
+    ("ship", "sea", "anchor", "ships sail on the sea", "a ship drops an anchor"),
+    ("bird", "nest", "sky", "birds live in nests", "birds fly in the sky"),
+    ("key", "door", "piano", "a key opens a door", "a piano has keys"),
+    ("rock", "stone", "music", "a rock is a stone", "rock is a kind of music"),
+    ("dragon", "fire", "castle", "dragons breathe fire", "dragons guard castles"),
+    ("rocket", "moon", "fuel", "rockets fly to the moon", "rockets burn fuel"),
+    ("tree", "leaf", "bark", "trees have leaves", "trees have bark"),
+    ("bat", "cave", "ball", "bats live in caves", "you hit a ball with a bat"),
+]
+
+NON_WORDS = ["bip", "trog", "plim", "snaff", "glup", "dremp", "flort", "skib"]
+
+SURVEY_ANSWERS = ["I'm 8!", "I love dragons and space.", "I want to be an astronaut.", "Blue, and pizza!"]
+STORY_REPLIES = ["Let's open the door!", "I want to fly with the dragon.", "What is inside the cave?",
+                 "Can we go to the moon?", "I run to the castle."]
+
+STORY_WORDS = ("the brave explorer walked through a glowing forest where dragons whispered secrets about "
+               "hidden stars and a little rocket waited by the river for the next adventure").split()
+
+# "x and y because ..." in a child's answer
+ANSWER_PAIR = re.compile(r"(\w+) and (\w+) because ([^.]+)", re.IGNORECASE)
+# "(x, y): justification" lines of the evaluation prompt
+PROMPT_PAIR = re.compile(r"\(([^,()]+), ([^,()]+)\): (.+)")
+
+
+def triplet_challenge(i: int) -> ChallengeTriplet:
+    x, y, z, why_xy, why_xz = TRIPLETS[i % len(TRIPLETS)]
+    # Past the end of the list, number the words so every challenge stays distinct
+    suffix = "" if i < len(TRIPLETS) else str(i // len(TRIPLETS))
+    x, y, z = x + suffix, y + suffix, z + suffix
+    return ChallengeTriplet(triplet=[x, y, z], pairings=[
+        {"words": [x, y], "justification": why_xy},
+        {"words": [x, z], "justification": why_xz},
+    ])
+
+
+def phonemic_challenge(i: int) -> PhonemicAwareness:
+    word = NON_WORDS[i % len(NON_WORDS)] + ("" if i < len(NON_WORDS) else str(i // len(NON_WORDS)))
+    return PhonemicAwareness(non_word_pair=(word, word[1:]), phonemic_pair=(word, word[1:]))
+
+
+class ScriptedResponder:
+    """
+    Plays the LLM in benchmarks: returns a canned but well-formed answer for every kind of call the agents
+    make, identified by the call's usage label (see core/usage.py) or the structured output schema.
+    """
+
+    def __init__(self, survey_questions: int = 4, story_sentences: int = 5):
+        """
+        :param survey_questions: Number of survey questions asked before the survey ends
+        :param story_sentences: Length of every story segment
+        """
+        self.survey_questions = survey_questions
+        self.story_sentences = story_sentences
+        self._challenges = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, messages: List[BaseMessage], schema: Optional[type] = None) -> Any:
+        if schema is not None:
+            return self.structured(messages, schema)
+        label = current_usage_label()
+        if label == "survey":
+            return self.survey_question(messages)
+        if label == "survey_extraction":
+            return "age: 8,\ninterests: dragons, space,\nwants_to_be: astronaut,\nfavorite_color: blue"
+        if label == "story_summary":
+            return "The explorer and a friendly dragon are looking for a lost rocket in a glowing forest."
+        return self.story_segment(messages)
+
+    def survey_question(self, messages: List[BaseMessage]) -> str:
+        answers = sum(msg.type == "human" for msg in messages)
+        if answers >= self.survey_questions:
+            return "Thank you! Now let's start our adventure. <END>"
+        return f"Question {answers + 1}: what else do you like?"
+
+    def story_segment(self, messages: List[BaseMessage]) -> str:
+        offset = len(messages)
+        sentences = []
+        for i in range(self.story_sentences):
+            words = [STORY_WORDS[(offset + i * 7 + j) % len(STORY_WORDS)] for j in range(12)]
+            sentences.append(" ".join(words).capitalize() + ".")
+        return " ".join(sentences)
+
+    def next_challenges(self, n: int) -> range:
+        with self._lock:
+            start, self._challenges = self._challenges, self._challenges + n
+        return range(start, start + n)
+
+    def structured(self, messages: List[BaseMessage], schema: type) -> Any:
+        prompt = "\n".join(str(msg.content) for msg in messages)
+        if schema is ManagerDecision:
+            return ManagerDecision(next_agent="narrative_agent", task="Continue the story")
+        if "challenges" in schema.model_fields:
+            # A batch: List[<challenge class>]
+            item_class = typing.get_args(schema.model_fields["challenges"].annotation)[0]
+            match = re.search(r"Generate (\d+) challenges", prompt)
+            n = int(match.group(1)) if match else 1
+            return schema(challenges=[self.structured(messages, item_class) for _ in range(n)])
+        if issubclass(schema, ChallengeTriplet):
+            return triplet_challenge(self.next_challenges(1)[0])
+        if issubclass(schema, PhonemicAwareness):
+            return phonemic_challenge(self.next_challenges(1)[0])
+        if schema is VAPairingList:
+            # Only the child's answer: the instructions around it have examples of their own
+            answer = prompt.partition("Use the following")[0].rpartition("Input:")[2]
+            return VAPairingList(pairings=[{"words": [x, y], "justification": why}
+                                           for x, y, why in ANSWER_PAIR.findall(answer)[:2]])
+        if schema is VAItemEvaluation:
+            return self.evaluation(prompt)
+        if schema is VAItemAssessment:
+            return self.assessment(prompt)
+        raise ValueError(f"ScriptedResponder has no answer for schema {schema.__name__}")
+
+    @staticmethod
+    def evaluation(prompt: str) -> VAItemEvaluation:
+        # The input block sits between the instructions and the schema
+        student, _, expected = prompt.partition("Use the following")[0].rpartition("Expected Response:")
+        student = student.rpartition("Student Response:")[2]
+        return VAItemEvaluation(evaluations=ScriptedResponder.evaluate_pairs(PROMPT_PAIR.findall(student), expected))
+
+    @staticmethod
+    def assessment(prompt: str) -> VAItemAssessment:
+        # Single pass: the child's raw answer instead of extracted "(x, y): why" lines
+        student, _, expected = prompt.partition("Use the following")[0].rpartition("Expected Response:")
+        student = student.rpartition("Student Response:")[2]
+        return VAItemAssessment(evaluations=ScriptedResponder.evaluate_pairs(ANSWER_PAIR.findall(student), expected))
+
+    @staticmethod
+    def evaluate_pairs(pairs: List[tuple], expected: str) -> List[Dict[str, Any]]:
+        expected_pairs = {frozenset((x.strip(), y.strip())) for x, y, _ in PROMPT_PAIR.findall(expected)}
+        evaluations = []
+        for x, y, why in pairs:
+            valid = frozenset((x.strip(), y.strip())) in expected_pairs
+            evaluations.append({
+                "evaluated_pairing": {"words": [x.strip(), y.strip()], "justification": why.strip()},
+                "pair_is_valid": valid,
+                "justification_is_valid": valid,
+                "score": "1" if valid else "0",
+                "error_analysis": {"category": "none" if valid else "semantic_mismatch",
+                                   "category_reasoning": "Scripted evaluation."},
+            })
+        return evaluations
+
+
+class ScriptedChild:
+    """
+    Plays the child in benchmarks: answers the survey, replies to the story and answers challenges
+    (correctly or not), based on the thread's current graph state.
+    """
+
+    def __init__(self, skip_survey: bool = False, correct_every: int = 2):
+        """
+        :param skip_survey: Send "SKIP SURVEY" instead of answering the survey
+        :param correct_every: Answer one challenge in `correct_every` fully correctly, the others half right
+        """
+        self.skip_survey = skip_survey
+        self.correct_every = correct_every
+
+    def next_message(self, values: Dict[str, Any], turn: int) -> str:
+        narrative = values.get("narrative")
+        if narrative is None or not narrative.finished_survey:
+            if self.skip_survey:
+                return "SKIP SURVEY"
+            return SURVEY_ANSWERS[turn % len(SURVEY_ANSWERS)]
+
+        challenge = self.current_challenge(values)
+        if challenge is not None:
+            return self.answer(challenge, correct=turn % self.correct_every == 0)
+        return STORY_REPLIES[turn % len(STORY_REPLIES)]
+
+    @staticmethod
+    def phase(values: Dict[str, Any]) -> str:
+        """
+        What the child's next message is: a survey answer, a challenge answer or a story reply.
+        """
+        narrative = values.get("narrative")
+        if narrative is None or not narrative.finished_survey:
+            return "survey"
+        return "challenge" if ScriptedChild.current_challenge(values) is not None else "story"
+
+    @staticmethod
+    def current_challenge(values: Dict[str, Any]) -> Optional[ChallengeTriplet]:
+        # Once a challenge has been told in the story, the manager treats every reply as an answer to it
+        index = values["narrative"].challenge_index
+        if index is None:
+            return None
+        challenge = values["challenge"].challenge_history[index]
+        return ChallengeTriplet.from_dict(challenge) if isinstance(challenge, dict) else challenge
+
+    @staticmethod
+    def answer(challenge: ChallengeTriplet, correct: bool) -> str:
+        first, second = challenge.pairings
+        x, y, z = challenge.triplet
+        wrong = f"{y} and {z} because they are in the story."
+        right = f"{second.words[0]} and {second.words[1]} because {second.justification}."
+        return f"{first.words[0]} and {first.words[1]} because {first.justification}. " + (right if correct else wrong)
@@ -0,0 +1,23 @@
+from typing import Any, Dict, List, Optional
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """
+    Percentile with linear interpolation between closest ranks, or None for no values.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = (len(values) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def distribution(values: List[float]) -> Dict[str, Any]:
+    stats = {f"p{p}": percentile(values, p) for p in PERCENTILES}
+    stats["mean"] = sum(values) / len(values) if values else None
+    stats["n"] = len(values)
+    return stats
@@ -0,0 +1,171 @@
+"""
+Cohort analytics over the cross-session assessment store (core/assessment_store.py).
+
+Run from the repository root:
+    PYTHONPATH=src python -m core.assessment_analytics --db assessments.sqlite --since-days 30
+"""
+import json
+import time
+import sqlite3
+import argparse
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from core.config import Config
+
+
+ITEM_COLUMNS = "thread_id, subtask, item, item_label, item_score, max_item_score, basal, ceiling, answered_at"
+PAIRING_COLUMNS = "thread_id, subtask, item, item_label, score, error_category, answered_at"
+
+
+def _load(path: str, table: str, columns: str, since: Optional[float], subtask: Optional[str]) -> pd.DataFrame:
+    clauses, params = [], []
+    if since is not None:
+        clauses.append("answered_at >= ?")
+        params.append(since)
+    if subtask is not None:
+        clauses.append("subtask = ?")
+        params.append(subtask)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    conn = sqlite3.connect(path)
+    try:
+        frame = pd.read_sql_query(f"SELECT {columns} FROM {table}{where}", conn, params=params)
+    finally:
+        conn.close()
+
+    # Repeated strings as categoricals: much smaller, and group-bys on them run on integer codes
+    for column in ("thread_id", "subtask", "item_label", "error_category"):
+        if column in frame:
+            frame[column] = frame[column].astype("category")
+    for column in ("basal", "ceiling"):
+        if column in frame:
+            frame[column] = frame[column].astype(bool)
+    return frame
+
+
+def load_items(path: str = Config.ASSESSMENT_DB, since: Optional[float] = None,
+               subtask: Optional[str] = None) -> pd.DataFrame:
+    """
+    One row per assessed item.
+    :param since: Only items answered at or after this Unix time
+    :param subtask: Only items of this subtask (type key)
+    """
+    return _load(path, "assessment_items", ITEM_COLUMNS, since, subtask)
+
+
+def load_pairings(path: str = Config.ASSESSMENT_DB, since: Optional[float] = None,
+                  subtask: Optional[str] = None) -> pd.DataFrame:
+    """
+    One row per evaluated answer (e.g. VA word pairing).
+    """
+    return _load(path, "pairing_results", PAIRING_COLUMNS, since, subtask)
+
+
+def session_scores(items: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per session and subtask: number of items, total score and normalized average (total / maximum possible).
+    """
+    grouped = items.groupby(["thread_id", "subtask"], observed=True)
+    scores = grouped.agg(items=("item", "size"), total_score=("item_score", "sum"),
+                         max_score=("max_item_score", "sum"))
+    scores["normalized_average"] = scores["total_score"] / scores["max_score"]
+    return scores.reset_index()
+
+
+def cohort_score_distribution(items: pd.DataFrame, bins: int = 10) -> Dict[str, Any]:
+    """
+    Distribution of the sessions' normalized averages (quantiles and a histogram over [0, 1]) and of the
+    item scores.
+    """
+    averages = session_scores(items)["normalized_average"].to_numpy(dtype=float)
+    counts, edges = np.histogram(averages, bins=bins, range=(0.0, 1.0))
+    item_scores = items["item_score"].value_counts(normalize=True).sort_index()
+    return {
+        "sessions": int(averages.size),
+        "items": int(len(items)),
+        "normalized_average": {
+            "mean": float(averages.mean()) if averages.size else None,
+            **{f"p{q}": float(np.percentile(averages, q)) if averages.size else None for q in (10, 25, 50, 75, 90)},
+        },
+        "histogram": {"edges": edges.round(2).tolist(), "sessions": counts.tolist()},
+        "item_score_shares": {int(score): float(share) for score, share in item_scores.items()},
+    }
+
+
+def error_category_rates(pairings: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Share of incorrect answers in each error category, overall and per subtask.
+    """
+    incorrect = pairings[pairings["score"] == 0]
+    by_subtask = (incorrect.groupby("subtask", observed=True)["error_category"]
+                  .value_counts(normalize=True).unstack(fill_value=0.0))
+    return {
+        "answers": int(len(pairings)),
+        "incorrect_share": float(len(incorrect) / len(pairings)) if len(pairings) else None,
+        "overall": {str(k): float(v) for k, v in
+                    incorrect["error_category"].value_counts(normalize=True).items() if v},
+        "by_subtask": {str(subtask): {str(k): float(v) for k, v in row.items() if v}
+                       for subtask, row in by_subtask.iterrows()},
+    }
+
+
+def basal_ceiling_rates(items: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Share of sessions that hit the basal and the ceiling rule, and the median item at which they first did.
+    """
+    ordered = items.sort_values(["thread_id", "subtask", "item"])
+    grouped = ordered.groupby(["thread_id", "subtask"], observed=True)
+    rates = {"sessions": int(grouped.ngroups)}
+    for rule in ("basal", "ceiling"):
+        hit = grouped[rule].any()
+        # First item flagged, per session that hit the rule
+        first = ordered[ordered[rule]].groupby(["thread_id", "subtask"], observed=True)["item"].min()
+        rates[rule] = {
+            "hit_rate": float(hit.mean()) if len(hit) else None,
+            "median_first_item": float(first.median()) if len(first) else None,
+        }
+    return rates
+
+
+def item_difficulty(pairings: pd.DataFrame, min_answers: int = 5, limit: int = 10) -> Dict[str, Any]:
+    """
+    The challenge items answered correctly least often (among those with at least `min_answers` answers).
+    """
+    stats = pairings.groupby("item_label", observed=True)["score"].agg(["mean", "size"])
+    stats = stats[stats["size"] >= min_answers].sort_values("mean").head(limit)
+    return {str(label): {"correct_share": float(row["mean"]), "answers": int(row["size"])}
+            for label, row in stats.iterrows()}
+
+
+def cohort_report(path: str = Config.ASSESSMENT_DB, since: Optional[float] = None,
+                  subtask: Optional[str] = None) -> Dict[str, Any]:
+    items = load_items(path, since, subtask)
+    pairings = load_pairings(path, since, subtask)
+    return {
+        "scores": cohort_score_distribution(items),
+        "errors": error_category_rates(pairings),
+        "basal_ceiling": basal_ceiling_rates(items),
+        "hardest_items": item_difficulty(pairings),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cohort statistics over the assessment store.")
+    parser.add_argument("--db", default=Config.ASSESSMENT_DB)
+    parser.add_argument("--since-days", type=float, help="Only items answered in the last N days")
+    parser.add_argument("--subtask", help="Only this subtask, e.g. 'Vocabulary Awareness'")
+    args = parser.parse_args()
+
+    since = time.time() - args.since_days * 86400 if args.since_days is not None else None
+    started = time.perf_counter()
+    report = cohort_report(args.db, since, args.subtask)
+    print(json.dumps(report, indent=2))
+    print(f"[assessment_analytics] {report['scores']['items']} items, {report['errors']['answers']} answers "
+          f"analyzed in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
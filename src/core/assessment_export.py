@@ -0,0 +1,168 @@
+import io
+import os
+import csv
+import time
+import atexit
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from core.config import Config
+from core.assessment_store import get_assessment_store
+
+
+def atomic_write(path: str, data: bytes):
+    """
+    Writes `data` to `path` through a temporary file in the same directory, so readers never see a partial file.
+    """
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.splitext(path)[1])
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def csv_bytes(rows: List[list]) -> bytes:
+    buffer = io.StringIO(newline="")
+    csv.writer(buffer, quoting=csv.QUOTE_ALL).writerows(rows)
+    return buffer.getvalue().encode("utf-8")
+
+
+class AssessmentExporter:
+    """
+    Writes each session's assessment results to its own directory, `<directory>/<thread_id>/`, off the
+    request path.
+
+    After every answer the item's rows are appended to the subtask's history CSV and the (one-line) score
+    summary is replaced atomically, so the cost of an export no longer grows with the number of items.
+    The item is also added to the cross-session assessment store, if enabled.
+    Plots are rendered from the session's latest history on the same background worker, by default once
+    the session ends (see `finish`).
+    """
+
+    def __init__(self, directory: str = Config.ASSESSMENT_EXPORT_DIR, plots: str = Config.ASSESSMENT_PLOTS):
+        """
+        :param directory: Parent directory of the per-session directories
+        :param plots: When to render plots: "end" (session end), "item" (after every answer) or "off"
+        """
+        self.directory = directory
+        self.plots = plots
+        # A single worker, so the writes of a session run in the order they were submitted
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="assessment-export")
+        # Subtask handler and latest assessment history of every session with unrendered plots
+        self._sessions: Dict[str, Tuple[object, list]] = {}
+        # Renders queued but not started yet; renders requested meanwhile are folded into them
+        self._queued_renders: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def session_dir(self, thread_id: Optional[str]) -> str:
+        return os.path.join(self.directory, thread_id or "default")
+
+    def record_item(self, thread_id: Optional[str], subtask_handler, assessment, challenge_item=None) -> Future:
+        """
+        Queues the export of the last item of `assessment` (an AssessmentState) for the session.
+        :param challenge_item: The item's challenge, stored alongside the results (skipped in the store if None)
+        :return Future: Completes once the item's rows are written
+        """
+        history = list(assessment.assessment_history)
+        summary = dict(assessment.score_summary)
+        with self._lock:
+            self._sessions[thread_id] = (subtask_handler, history)
+
+        item = {"item_score": assessment.item_total_scores[-1], "basal": assessment.basal,
+                "ceiling": assessment.ceiling, "answered_at": time.time()}
+        future = self._executor.submit(self._write_item, thread_id, subtask_handler, len(history), history[-1],
+                                       summary, challenge_item, item)
+        if self.plots == "item":
+            self.render(thread_id)
+        return future
+
+    def _write_item(self, thread_id: Optional[str], subtask_handler, item_number: int, evaluated_student_answers,
+                    score_summary: dict, challenge_item=None, item: Optional[dict] = None):
+        directory = self.session_dir(thread_id)
+        try:
+            os.makedirs(directory, exist_ok=True)
+
+            history_path = os.path.join(directory, subtask_handler.history_filename)
+            rows = subtask_handler.history_rows(item_number, evaluated_student_answers)
+            if not os.path.exists(history_path):
+                rows = [subtask_handler.history_header] + rows
+            # One write per item: a reader sees either all of the item's rows or none of them
+            with open(history_path, "ab") as f:
+                f.write(csv_bytes(rows))
+
+            atomic_write(os.path.join(directory, "score_summary.csv"),
+                         csv_bytes([subtask_handler.summary_header, subtask_handler.summary_row(score_summary)]))
+        except Exception as e:
+            print(f"[AssessmentExporter] Could not export item {item_number} of thread {thread_id}: {e}")
+
+        store = get_assessment_store()
+        if store is None or challenge_item is None:
+            return
+        try:
+            store.add_item(thread_id, subtask_handler, item_number, subtask_handler.item_label(challenge_item),
+                           evaluated_student_answers, **item)
+        except Exception as e:
+            print(f"[AssessmentExporter] Could not store item {item_number} of thread {thread_id}: {e}")
+
+    def render(self, thread_id: Optional[str]) -> Optional[Future]:
+        """
+        Queues the rendering of the session's plots from its latest history (e.g. when a report is requested).
+        :return Future: Completes once the plots are written, or None if there is nothing to render
+        """
+        with self._lock:
+            if thread_id not in self._sessions:
+                return None
+            if thread_id not in self._queued_renders:
+                self._queued_renders[thread_id] = self._executor.submit(self._render, thread_id)
+            return self._queued_renders[thread_id]
+
+    def _render(self, thread_id: Optional[str], entry: Optional[Tuple[object, list]] = None):
+        if entry is None:
+            with self._lock:
+                self._queued_renders.pop(thread_id, None)
+                entry = self._sessions.get(thread_id)
+            if entry is None:
+                return
+        subtask_handler, history = entry
+        try:
+            subtask_handler.render_plots(history, self.session_dir(thread_id))
+        except Exception as e:
+            print(f"[AssessmentExporter] Could not render the plots of thread {thread_id}: {e}")
+
+    def finish(self, thread_id: Optional[str]) -> Optional[Future]:
+        """
+        The session has ended: renders its plots (unless plots are off) and forgets it.
+        """
+        with self._lock:
+            entry = self._sessions.pop(thread_id, None)
+        if entry is None or self.plots == "off":
+            return None
+        return self._executor.submit(self._render, thread_id, entry)
+
+    def flush(self, timeout: Optional[float] = None):
+        """
+        Waits until every export queued so far has been written.
+        """
+        self._executor.submit(lambda: None).result(timeout)
+
+    def close(self):
+        """
+        Renders the plots of the sessions still open (at interpreter exit, when the worker no longer takes jobs).
+        """
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            entries, self._sessions = self._sessions, {}
+        if self.plots != "off":
+            for thread_id, entry in entries.items():
+                self._render(thread_id, entry)
+
+
+# Process-wide exporter shared by all sessions
+ASSESSMENT_EXPORTS = AssessmentExporter()
+atexit.register(ASSESSMENT_EXPORTS.close)
@@ -0,0 +1,111 @@
+import sqlite3
+import threading
+from functools import lru_cache
+from typing import Dict, Optional
+
+from core.config import Config
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS assessment_items (
+    thread_id TEXT NOT NULL,
+    subtask TEXT NOT NULL,
+    item INTEGER NOT NULL,
+    item_label TEXT NOT NULL,
+    item_score INTEGER NOT NULL,
+    max_item_score INTEGER NOT NULL,
+    basal INTEGER NOT NULL,
+    ceiling INTEGER NOT NULL,
+    answered_at REAL NOT NULL,
+    PRIMARY KEY (thread_id, subtask, item)
+);
+CREATE INDEX IF NOT EXISTS assessment_items_by_time ON assessment_items (answered_at);
+CREATE TABLE IF NOT EXISTS pairing_results (
+    thread_id TEXT NOT NULL,
+    subtask TEXT NOT NULL,
+    item INTEGER NOT NULL,
+    answer_index INTEGER NOT NULL,
+    item_label TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    justification TEXT NOT NULL,
+    answer_valid INTEGER NOT NULL,
+    justification_valid INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    error_category TEXT NOT NULL,
+    answered_at REAL NOT NULL,
+    PRIMARY KEY (thread_id, subtask, item, answer_index)
+);
+CREATE INDEX IF NOT EXISTS pairing_results_by_time ON pairing_results (answered_at);
+"""
+
+
+class AssessmentStore:
+    """
+    Cross-session store of assessment results in a local SQLite database, for cohort analytics
+    (see core/assessment_analytics.py).
+
+    Every assessed item is one row of `assessment_items` (score, basal and ceiling flags) and every evaluated
+    answer of the item (e.g. a VA word pairing) one row of `pairing_results`, flat scalar columns only, so
+    whole tables load straight into pandas. Rows are keyed by (thread, subtask, item); thread ids are full
+    UUIDs (see core/sessions.py), and an item that is written twice raises instead of overwriting the
+    stored one, so results of different sessions can never replace each other.
+    """
+
+    def __init__(self, path: str = Config.ASSESSMENT_DB):
+        """
+        :param path: Location of the SQLite database file
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(_SCHEMA)
+            self.conn.commit()
+
+    def add_item(self, thread_id: Optional[str], subtask_handler, item_number: int, item_label: str,
+                 evaluated_student_answers, item_score: int, basal: bool, ceiling: bool, answered_at: float):
+        """
+        Stores one assessed item and the evaluations of its answers, in a single transaction.
+        Raises sqlite3.IntegrityError if the item is already stored.
+        :param subtask_handler: The item's BaseAssessmentSubtask (provides the per-answer result columns)
+        :param item_number: 1-based number of the item in the session
+        :param item_label: The challenge item as text (e.g. the VA triplet)
+        """
+        thread_id = thread_id or "default"
+        results = subtask_handler.result_rows(evaluated_student_answers)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO assessment_items (thread_id, subtask, item, item_label, item_score, "
+                "max_item_score, basal, ceiling, answered_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, subtask_handler.type_key, item_number, item_label, item_score,
+                 subtask_handler.max_item_score, int(basal), int(ceiling), answered_at),
+            )
+            self.conn.executemany(
+                "INSERT INTO pairing_results (thread_id, subtask, item, answer_index, item_label, answer, "
+                "justification, answer_valid, justification_valid, score, error_category, answered_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (thread_id, subtask_handler.type_key, item_number, i, item_label, row["answer"],
+                     row["justification"], int(row["answer_valid"]), int(row["justification_valid"]),
+                     row["score"], row["error_category"], answered_at)
+                    for i, row in enumerate(results)
+                ],
+            )
+
+    def count(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                table: self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("assessment_items", "pairing_results")
+            }
+
+
+@lru_cache(maxsize=None)
+def get_assessment_store() -> Optional[AssessmentStore]:
+    """
+    Returns the process-wide assessment store, or None if it is disabled with LQ_ASSESSMENT_STORE=0.
+    """
+    if not Config.ASSESSMENT_STORE:
+        return None
+    return AssessmentStore()
@@ -1,10 +1,7 @@
-import os
-import csv
+import io
 import os
 
 import numpy as np
-import seaborn as sns
-import matplotlib.pyplot as plt
 
 from enum import Enum
 from abc import ABC, abstractmethod
@@ -14,6 +11,8 @@ from typing import List, Optional, ClassVar, Dict, Type
 from pydantic import BaseModel, Field
 
 from core.challenges import ChallengeTriplet, Pairing, BaseChallenge
+from core.config import Config
+from core.prescoring import justification_similarity, lemma
 
 
 
@@ -47,10 +46,17 @@ class BaseAssessmentSubtask(ABC):
     type_key: str
     extraction_schema: Type["BaseAssessmentExtractSchema"]
     evaluation_schema: Type["BaseAssessmentEvalSchema"]
+    # Extraction and evaluation in one model call (single-pass assessment mode)
+    assessment_schema: Type["BaseAssessmentEvalSchema"]
     error_analysis_schema: Type["BaseAssessmentErrorAnalysisSchema"]
 
     max_item_score: int
 
+    # Exports (see core/assessment_export.py): the per-item history CSV and the score summary CSV
+    history_filename: str
+    history_header: ClassVar[List[str]]
+    summary_header: ClassVar[List[str]] = ["Subtask", "Total Items", "Total Score", "Average Score"]
+
     def __init_subclass__(cls):
         if hasattr(cls, "type_key"):
             BaseAssessmentSubtask._registry[cls.type_key] = cls
@@ -92,6 +98,51 @@ class BaseAssessmentSubtask(ABC):
         raise NotImplementedError
 
 
+    @abstractmethod
+    def answer_count(self, structured_student_response: Type["BaseAssessmentExtractSchema"]) -> int:
+        """
+        Number of answers (e.g. word pairings) in the extracted student response.
+        """
+
+        raise NotImplementedError
+
+
+    def prescore(self, structured_student_response: Type["BaseAssessmentExtractSchema"], challenge_item: BaseChallenge) -> Dict[int, any]:
+        """
+        Local pre-scoring: evaluates the answers whose outcome is clear without the model. Subtasks without a
+        local scorer settle nothing.
+
+        Args:
+            structured_student_response (BaseAssessmentExtractSchema): Student answers to the given subtask challenge item
+            challenge_item (BaseChallenge): The ground-truth challenge data for the current subtask item
+
+        Returns:
+            settled (Dict): Evaluations of the settled answers, by answer index
+        """
+
+        return {}
+
+
+    def pending_answers(self, structured_student_response: Type["BaseAssessmentExtractSchema"], settled: Dict[int, any]) -> Type["BaseAssessmentExtractSchema"]:
+        """
+        The extracted answers that prescore did not settle, to be evaluated by the model. Subtasks without a
+        local scorer settle nothing, so by default the whole response is pending.
+        """
+
+        return structured_student_response
+
+
+    def merge_evaluations(self, structured_student_response: Type["BaseAssessmentExtractSchema"], settled: Dict[int, any], model_evaluations: Optional[Type["BaseAssessmentEvalSchema"]]) -> Type["BaseAssessmentEvalSchema"]:
+        """
+        Combines the locally settled evaluations and the model's evaluations of the pending answers, in the
+        order of the student's answers. Returns None if the model's evaluations do not match the pending answers
+        (e.g. a missing or reworded answer), in which case the whole item should be evaluated by the model.
+        By default nothing is settled locally, so the model's evaluations are the item's evaluations.
+        """
+
+        return None if settled else model_evaluations
+
+
     @abstractmethod
     def format_evaluation_input(self, structured_student_response: Type["BaseAssessmentExtractSchema"], challenge_item: BaseChallenge) -> str:
         """
@@ -108,6 +159,55 @@ class BaseAssessmentSubtask(ABC):
         raise NotImplementedError
 
 
+    @abstractmethod
+    def format_assessment_input(self, raw_student_response: Dict[str, any], challenge_item: BaseChallenge) -> str:
+        """
+        Formats the student's raw response and the correct answers for the single-pass assessment prompt.
+
+        Args:
+            raw_student_response (Dict): Student's raw response to the given subtask challenge item
+            challenge_item (BaseChallenge): The ground-truth challenge data for the current subtask item
+
+        Returns:
+            formatted_assessment_input (str): Student and correct answers formatted for the assessment prompt
+        """
+
+        raise NotImplementedError
+
+
+    @abstractmethod
+    def filter_assessed_answers(self, assessed_student_response: Type["BaseAssessmentEvalSchema"], raw_student_response: Dict[str, any]) -> Type["BaseAssessmentEvalSchema"]:
+        """
+        Applies the same filtering as filter_extracted_answers to the answers extracted by a single-pass
+        assessment, keeping the evaluations of the answers that remain.
+
+        Args:
+            assessed_student_response (BaseAssessmentEvalSchema): Extracted and evaluated answers (assessment_schema)
+            raw_student_response (Dict): Student's raw response to the given subtask challenge item
+
+        Returns:
+            evaluated_student_answers (BaseAssessmentEvalSchema): Evaluations of the kept answers (evaluation_schema)
+        """
+
+        raise NotImplementedError
+
+
+    @abstractmethod
+    def compare_evaluations(self, reference: Type["BaseAssessmentEvalSchema"], candidate: Type["BaseAssessmentEvalSchema"]) -> Dict[str, any]:
+        """
+        Measures how far two evaluations of the same item agree (e.g. two-pass vs single-pass assessment).
+
+        Args:
+            reference (BaseAssessmentEvalSchema): The evaluation taken as reference
+            candidate (BaseAssessmentEvalSchema): The evaluation compared against it
+
+        Returns:
+            agreement (Dict): Agreement figures for the item
+        """
+
+        raise NotImplementedError
+
+
     @abstractmethod
     def update_score(self, evaluated_student_answers: Type["BaseAssessmentEvalSchema"]) -> int:
         """
@@ -154,15 +254,68 @@ class BaseAssessmentSubtask(ABC):
     
 
     @abstractmethod
-    def export_to_csv_and_plots(self, assessment_history: list[Type["BaseAssessmentEvalSchema"]], score_summary: Dict[str, any]):
+    def history_rows(self, item_number: int, evaluated_student_answers: Type["BaseAssessmentEvalSchema"]) -> List[list]:
         """
-        Exports the current assessment history and score summary to various plots and CSV files.
+        Rows of the history CSV (see history_header) for one assessed item.
+
+        Args:
+            item_number (int): 1-based number of the item in the session
+            evaluated_student_answers (BaseAssessmentEvalSchema): Evaluations of the item's answers
+
+        Returns:
+            rows (list): One row per evaluated answer
+        """
+
+        raise NotImplementedError
+
+
+    def summary_row(self, score_summary: Dict[str, any]) -> list:
+        """
+        Row of the score summary CSV (see summary_header).
 
         Args:
-            assessment_history (list): The history of evaluated student answers
             score_summary (dict): Summary of the current challenge assessment scores
         """
 
+        return [self.type_key, score_summary["total_items"], score_summary["total_score"], score_summary["normalized_average"]]
+
+
+    @abstractmethod
+    def result_rows(self, evaluated_student_answers: Type["BaseAssessmentEvalSchema"]) -> List[Dict[str, any]]:
+        """
+        Flat records of the item's evaluated answers for the cross-session store (see core/assessment_store.py).
+
+        Args:
+            evaluated_student_answers (BaseAssessmentEvalSchema): Evaluations of the item's answers
+
+        Returns:
+            rows (list): One dict per answer, with the keys answer, justification, answer_valid,
+                         justification_valid, score and error_category
+        """
+
+        raise NotImplementedError
+
+
+    @abstractmethod
+    def item_label(self, challenge_item: BaseChallenge) -> str:
+        """
+        Short text identifying the challenge item in the cross-session store (e.g. the VA triplet).
+        """
+
+        raise NotImplementedError
+
+
+    @abstractmethod
+    def render_plots(self, assessment_history: list[Type["BaseAssessmentEvalSchema"]], directory: str):
+        """
+        Renders the subtask's plots of the assessment history into `directory`. Runs on the exporter's
+        background worker, so it must not use pyplot's global state.
+
+        Args:
+            assessment_history (list): The history of evaluated student answers
+            directory (str): The session's export directory
+        """
+
         raise NotImplementedError
 
 
@@ -260,13 +413,26 @@ class VAItemEvaluation(BaseAssessmentEvalSchema):
 
 
 
+class VAItemAssessment(BaseAssessmentEvalSchema):
+    evaluations: List[VAPairingEvaluation] = Field(
+        description="One evaluation for each word pair the student gave, with the pair and justification extracted exactly as the student said them."
+    )
+
+
+
 class VocabularyAwarenessSubtask(BaseAssessmentSubtask):
     type_key = "Vocabulary Awareness"
     extraction_schema = VAPairingList
     evaluation_schema = VAItemEvaluation
+    assessment_schema = VAItemAssessment
 
     max_item_score = 2
 
+    history_filename = "VA_assessment_history.csv"
+    history_header = [
+        "Item", "Pair", "Justification", "Pair Valid", "Justification Valid", "Score", "Error Category", "Error Reasoning"
+    ]
+
 
     def format_extraction_input(self, raw_student_response):
         # return raw_student_response["alphabetic"]
@@ -276,11 +442,22 @@ class VocabularyAwarenessSubtask(BaseAssessmentSubtask):
 
     def filter_extracted_answers(self, structured_student_response, raw_student_response):
 
+        return VAPairingList(pairings=self.rank_pairings(structured_student_response.pairings, raw_student_response)[:2])
+
+
+
+    @staticmethod
+    def rank_pairings(pairings, raw_student_response):
+        """
+        Keeps the best-supported pairing for each distinct word pair, i.e. the one whose justification is
+        closest to what the student actually said.
+        """
+
         ranked = []
         pair_dict = defaultdict(list)
         student_text = raw_student_response.lower()
 
-        for pair in structured_student_response.pairings:
+        for pair in pairings:
             key = tuple(sorted(pair.words))
             pair_dict[key].append(pair)
 
@@ -297,11 +474,111 @@ class VocabularyAwarenessSubtask(BaseAssessmentSubtask):
             ranked.append(best)
 
 
-        return VAPairingList(pairings=ranked[:2])
+        return ranked
 
                          
 
 
+    def answer_count(self, structured_student_response):
+
+        return len(structured_student_response.pairings)
+
+
+
+    def prescore(self, structured_student_response, challenge_item):
+
+        if not isinstance(challenge_item, ChallengeTriplet):
+            challenge_item = ChallengeTriplet.from_dict(challenge_item)
+
+        triplet_lemmas = [lemma(word) for word in challenge_item.triplet]
+        expected = {frozenset(lemma(word) for word in pair.words): pair.justification for pair in challenge_item.pairings}
+
+        def in_triplet(word_lemma):
+            # Lenient, so that only words clearly outside the triplet are settled ("dogs", "sunlight" are in)
+            return any(word_lemma == t or word_lemma in t or t in word_lemma for t in triplet_lemmas)
+
+        settled = {}
+
+        for i, pairing in enumerate(structured_student_response.pairings):
+            pair_lemmas = [lemma(word) for word in pairing.words]
+
+            outside = [word for word, word_lemma in zip(pairing.words, pair_lemmas) if not in_triplet(word_lemma)]
+            if outside:
+                settled[i] = self.local_evaluation(
+                    pairing, valid=False, category=VAErrorCategoryEnum.off_topic,
+                    reasoning=f"{', '.join(outside)} {'is' if len(outside) == 1 else 'are'} not in the triplet."
+                )
+                continue
+
+            # Anything but an expected pair with a close justification is left to the model, which can also
+            # accept a valid link the challenge did not list
+            expected_justification = expected.get(frozenset(pair_lemmas))
+            if expected_justification is None or len(set(pair_lemmas)) < 2:
+                continue
+
+            similarity = justification_similarity(pairing.justification, expected_justification, pair_lemmas)
+            if similarity >= Config.PRESCORE_MIN_SIMILARITY:
+                settled[i] = self.local_evaluation(
+                    pairing, valid=True, category=VAErrorCategoryEnum.none,
+                    reasoning=f"Expected pair with a matching justification (similarity {similarity:.2f})."
+                )
+
+        return settled
+
+
+
+    @staticmethod
+    def local_evaluation(pairing, valid, category, reasoning):
+
+        return VAPairingEvaluation(
+            evaluated_pairing=pairing,
+            pair_is_valid=valid,
+            justification_is_valid=valid,
+            score=ItemScoreEnum.correct if valid else ItemScoreEnum.incorrect,
+            error_analysis=VAErrorAnalysis(category=category, category_reasoning=reasoning)
+        )
+
+
+
+    def pending_answers(self, structured_student_response, settled):
+
+        return VAPairingList(pairings=[
+            pairing for i, pairing in enumerate(structured_student_response.pairings) if i not in settled
+        ])
+
+
+
+    @staticmethod
+    def pair_key(pairing):
+
+        return frozenset(word.strip().lower() for word in pairing.words)
+
+
+
+    def merge_evaluations(self, structured_student_response, settled, model_evaluations):
+
+        pending = [i for i in range(len(structured_student_response.pairings)) if i not in settled]
+        model_list = list(model_evaluations.evaluations) if model_evaluations is not None else []
+        if len(model_list) != len(pending):
+            print(f"[VocabularyAwarenessSubtask] Expected {len(pending)} model evaluation(s), got {len(model_list)}")
+            return None
+
+        # Pair the model's evaluations with the pending answers by their words, not by position
+        evaluations = dict(settled)
+        for i in pending:
+            key = self.pair_key(structured_student_response.pairings[i])
+            match = next((evaluation for evaluation in model_list
+                          if self.pair_key(evaluation.evaluated_pairing) == key), None)
+            if match is None:
+                print(f"[VocabularyAwarenessSubtask] No model evaluation for the pair {sorted(key)}")
+                return None
+            model_list.remove(match)
+            evaluations[i] = match
+
+        return VAItemEvaluation(evaluations=[evaluations[i] for i in sorted(evaluations)])
+
+
+
     def format_evaluation_input(self, structured_student_response, challenge_item):
 
         # Ensure that challenge_item is of type ChallengeTriplet
@@ -328,6 +605,61 @@ class VocabularyAwarenessSubtask(BaseAssessmentSubtask):
 
 
 
+    def format_assessment_input(self, raw_student_response, challenge_item):
+
+        if not isinstance(challenge_item, ChallengeTriplet):
+            challenge_item = ChallengeTriplet.from_dict(challenge_item)
+
+        expected_lines = "\n".join(
+            f"({pair.words[0]}, {pair.words[1]}): {pair.justification}"
+            for pair in challenge_item.pairings
+        )
+
+        return (
+            f"Triplet: {challenge_item.triplet}\n\n"
+            f"Student Response: {raw_student_response}\n\n"
+            f"Expected Response: {expected_lines}"
+        )
+
+
+
+    def filter_assessed_answers(self, assessed_student_response, raw_student_response):
+
+        evaluations = assessed_student_response.evaluations
+        kept = self.rank_pairings([evaluation.evaluated_pairing for evaluation in evaluations], raw_student_response)[:2]
+
+        return VAItemEvaluation(evaluations=[
+            evaluation for evaluation in evaluations
+            if any(evaluation.evaluated_pairing is pairing for pairing in kept)
+        ])
+
+
+
+    def compare_evaluations(self, reference, candidate):
+
+        def pair_scores(evaluation):
+            return {
+                frozenset(word.strip().lower() for word in item.evaluated_pairing.words): int(item.score.value)
+                for item in evaluation.evaluations
+            }
+
+        reference_pairs, candidate_pairs = pair_scores(reference), pair_scores(candidate)
+        shared = reference_pairs.keys() & candidate_pairs.keys()
+
+        return {
+            "item_score_match": sum(reference_pairs.values()) == sum(candidate_pairs.values()),
+            "reference_score": sum(reference_pairs.values()),
+            "candidate_score": sum(candidate_pairs.values()),
+            "same_pairs": reference_pairs.keys() == candidate_pairs.keys(),
+            # Share of the pairs found by either evaluation that both found and scored the same
+            "pair_agreement": (
+                sum(reference_pairs[pair] == candidate_pairs[pair] for pair in shared)
+                / len(reference_pairs.keys() | candidate_pairs.keys())
+            ) if reference_pairs or candidate_pairs else 1.0,
+        }
+
+
+
     def update_score(self, evaluated_student_answers):
 
         evaluated_student_answers.update_total_score()
@@ -345,79 +677,77 @@ class VocabularyAwarenessSubtask(BaseAssessmentSubtask):
     
 
 
-    def export_to_csv_and_plots(self, assessment_history, score_summary, dir="src/agents/outputs/"):
+    def history_rows(self, item_number, evaluated_student_answers):
 
-        os.makedirs(dir, exist_ok=True)
+        return [
+            [
+                item_number,
+                " & ".join(eval.evaluated_pairing.words),
+                eval.evaluated_pairing.justification,
+                eval.pair_is_valid,
+                eval.justification_is_valid,
+                eval.score.value,
+                eval.error_analysis.category.value,
+                eval.error_analysis.category_reasoning
+            ]
+            for eval in evaluated_student_answers.evaluations
+        ]
 
-        history_filename = dir + "VA_assessment_history.csv"
 
-        if not os.path.exists(dir):
-            os.makedirs(dir)
 
-        with open(history_filename, 'w+', newline="") as file:
-            writer = csv.writer(file, quoting=csv.QUOTE_ALL)
-            writer.writerow(
-                [
-                    "Item", "Pair", "Justification", "Pair Valid", "Justification Valid", "Score", "Error Category", "Error Reasoning"
-                ]
-            )
+    def result_rows(self, evaluated_student_answers):
 
-            for i, response in enumerate(assessment_history):
-                for eval in response.evaluations:
-                    writer.writerow(
-                        [
-                            i + 1,
-                            " & ".join(eval.evaluated_pairing.words),
-                            eval.evaluated_pairing.justification,
-                            eval.pair_is_valid,
-                            eval.justification_is_valid,
-                            eval.score.value,
-                            eval.error_analysis.category.value,
-                            eval.error_analysis.category_reasoning
-                        ]
-                    )
-
-        
-
-        score_filename = dir + "score_summary.csv"
-
-        """if not os.path.exists(dir):
-            os.makedirs(dir)"""
-
-        with open(score_filename, 'w+', newline="") as file:
-            writer = csv.writer(file, quoting=csv.QUOTE_ALL)
-            writer.writerow(
-                [
-                    "Subtask", "Total Items", "Total Score", "Average Score"
-                ]
-            )
+        return [
+            {
+                "answer": " & ".join(eval.evaluated_pairing.words),
+                "justification": eval.evaluated_pairing.justification,
+                "answer_valid": eval.pair_is_valid,
+                "justification_valid": eval.justification_is_valid,
+                "score": int(eval.score.value),
+                "error_category": eval.error_analysis.category.value,
+            }
+            for eval in evaluated_student_answers.evaluations
+        ]
 
-            writer.writerow(
-                [
-                    "Vocabulary Awareness", score_summary["total_items"], score_summary["total_score"], score_summary["normalized_average"]
-                ]
-            )
 
 
-        
-       
+    def item_label(self, challenge_item):
+
+        if not isinstance(challenge_item, ChallengeTriplet):
+            challenge_item = ChallengeTriplet.from_dict(challenge_item)
+
+        return ", ".join(challenge_item.triplet)
+
+
+
+    def render_plots(self, assessment_history, directory):
+
+        # Imported here: plotting is only needed by the background exporter
+        import seaborn as sns
+        from matplotlib.colors import BoundaryNorm
+        from matplotlib.figure import Figure
+
+        from core.assessment_export import atomic_write
 
         num_items = len(assessment_history)
         heatmap_data = np.full((num_items, 2), np.nan)
 
-        heatmap_filename = dir + "per_pair_score_heatmap.png"
+        heatmap_filename = os.path.join(directory, "per_pair_score_heatmap.png")
 
         for i, response in enumerate(assessment_history):
-            for j, eval in enumerate(response.evaluations):
+            for j, eval in enumerate(response.evaluations[:2]):
                 heatmap_data[i, j] = eval.score.value
 
         cmap = sns.color_palette(["lightcoral", "lightgray", "mediumseagreen"])  # 0, NaN, 1
         bounds = [-0.5, 0.1, 0.9, 1.5]
-        norm = plt.matplotlib.colors.BoundaryNorm(bounds, len(cmap))
+        norm = BoundaryNorm(bounds, len(cmap))
 
-        plt.figure(figsize=(6, num_items * 0.6))
+        # A Figure of its own (Agg canvas) rather than pyplot, which is not thread-safe
+        figure = Figure(figsize=(6, max(num_items * 0.6, 2)))
+        ax = figure.subplots()
         sns.heatmap(
             heatmap_data,
+            ax=ax,
             annot=True,
             fmt=".0f",
             linewidths=0.5,
@@ -428,10 +758,11 @@ class VocabularyAwarenessSubtask(BaseAssessmentSubtask):
             yticklabels=[f"{i+1}" for i in range(num_items)]
         )
 
-        plt.title("VA Per-Pair Accuracy Heatmap")
-        plt.xlabel("Pair Index")
-        plt.ylabel("Item")
-        plt.tight_layout()
+        ax.set_title("VA Per-Pair Accuracy Heatmap")
+        ax.set_xlabel("Pair Index")
+        ax.set_ylabel("Item")
+        figure.tight_layout()
 
-        plt.savefig(heatmap_filename, dpi=300)
-        plt.close()
\ No newline at end of file
+        buffer = io.BytesIO()
+        figure.savefig(buffer, format="png", dpi=300)
+        atomic_write(heatmap_filename, buffer.getvalue())
@@ -1,37 +1,398 @@
 
-import torch
-import whisper
+import re
+import time
+import queue
+import threading
+from concurrent.futures import Future
 import numpy as np
-import sounddevice as sd
 
-from TTS.api import TTS
+from core.tts_cache import cache_key, get_tts_cache
+from core.tracing import span
+
+# torch, Whisper, Coqui TTS and sounddevice are heavy to import, so they are only imported
+# by the functions that need them (usually on a BackgroundModel's warm-up thread).
 
 
 def get_stt_model(model_name: str = 'tiny'):
+    import whisper
     return whisper.load_model(model_name)
 
 
 def get_tts_model(model_name: str = 'tts_models/multilingual/multi-dataset/xtts_v2'):
+    import torch
+    from TTS.api import TTS
     gpu_available = torch.cuda.is_available()
     return TTS(model_name=model_name, progress_bar=False, gpu=gpu_available)
 
 
-def speak_text(tts_model: TTS, text: str, using_voice_clone=False):
+class BackgroundModel:
+    """
+    A model loaded on a background warm-up thread so the app can start serving text right away.
+
+    `ready` tells whether the model can be used without blocking; `get()` starts loading if needed
+    and waits for the model.
+    """
+
+    def __init__(self, name: str, loader, *args, **kwargs):
+        """
+        :param name: Display name used in status messages
+        :param loader: Function returning the loaded model, called with *args and **kwargs
+        """
+        self.name = name
+        self._loader = loader
+        self._args = args
+        self._kwargs = kwargs
+        self._model = None
+        self._thread = None
+        self._loaded = threading.Event()
+        self._lock = threading.Lock()
+        self.error = None
+
+    def start(self) -> "BackgroundModel":
+        """
+        Starts loading the model on a daemon thread (no-op if already started).
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._load, name=f"warmup-{self.name}", daemon=True)
+                self._thread.start()
+        return self
+
+    def _load(self):
+        print(f"[audio_utils] Loading {self.name} model in the background...")
+        try:
+            self._model = self._loader(*self._args, **self._kwargs)
+            print(f"[audio_utils] {self.name} model ready.")
+        except Exception as e:
+            self.error = e
+            print(f"[audio_utils] Failed to load {self.name} model: {e}")
+        finally:
+            self._loaded.set()
+
+    @property
+    def ready(self) -> bool:
+        return self._loaded.is_set() and self.error is None
+
+    @property
+    def status(self) -> str:
+        if self._thread is None:
+            return "not loaded"
+        if not self._loaded.is_set():
+            return "loading"
+        return "ready" if self.error is None else "unavailable"
+
+    def get(self, timeout=None):
+        """
+        Returns the model, starting and waiting for the warm-up if needed.
+        Raises RuntimeError if loading failed or did not finish within `timeout` seconds.
+        """
+        self.start()
+        if not self._loaded.wait(timeout):
+            raise RuntimeError(f"{self.name} model is still loading")
+        if self.error is not None:
+            raise RuntimeError(f"{self.name} model could not be loaded: {self.error}")
+        return self._model
+
+
+VOICE_CLONE_SAMPLE = "../harvard.wav"
+
+
+def synthesize(tts_model, text: str, using_voice_clone=False) -> np.ndarray:
+    """
+    Synthesizes `text`, reusing the cached clip when the same text was already spoken with this model and voice.
+    """
+    cache = get_tts_cache()
+    if cache is None:
+        return _synthesize(tts_model, text, using_voice_clone)
+
+    model_name = getattr(tts_model, "model_name", None) or type(tts_model).__name__
+    voice = VOICE_CLONE_SAMPLE if using_voice_clone else "default"
+    samplerate = getattr(getattr(tts_model, "synthesizer", None), "output_sample_rate", None)
+    key = cache_key(text, model_name, voice, samplerate)
+    return cache.get_or_synthesize(key, lambda: _synthesize(tts_model, text, using_voice_clone))
+
+
+def _synthesize(tts_model, text: str, using_voice_clone=False) -> np.ndarray:
     if using_voice_clone:
-        wav = tts_model.tts(text, language="en", speaker_wav="../harvard.wav")
+        wav = tts_model.tts(text, language="en", speaker_wav=VOICE_CLONE_SAMPLE)
     else:
         wav = tts_model.tts(text)
 
-    wav = np.array(wav, dtype=np.float32)
-    sd.play(wav, samplerate=48050)  # Sample rate should match model (22050 is common)
+    return np.array(wav, dtype=np.float32)
+
+
+def play_audio(wav: np.ndarray, samplerate: int = 48050):
+    import sounddevice as sd
+
+    sd.play(wav, samplerate=samplerate)  # Sample rate should match model (22050 is common)
     sd.wait()
 
 
-def transcribe_speech(stt_model, file_location: str):
-    transcription = stt_model.transcribe(file_location)
+def speak_text(tts_model, text: str, using_voice_clone=False):
+    play_audio(synthesize(tts_model, text, using_voice_clone))
+
+
+# End of a sentence (terminal punctuation, optional closing quotes/brackets, then whitespace) or a paragraph break
+SENTENCE_BOUNDARY = re.compile(r'[.!?\u2026]+["\'\u201d\u2019)\]]*\s+|\n\s*\n')
+
+
+class SentenceSplitter:
+    """
+    Accumulates streamed text and returns each sentence as soon as its end has arrived.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+
+    def feed(self, text: str) -> list[str]:
+        self._buffer += text
+        sentences = []
+        while (match := SENTENCE_BOUNDARY.search(self._buffer)) is not None:
+            sentence = self._buffer[:match.end()].strip()
+            self._buffer = self._buffer[match.end():]
+            if sentence:
+                sentences.append(sentence)
+        return sentences
+
+    def flush(self) -> str:
+        """
+        Returns whatever is left once the stream has ended.
+        """
+        remainder, self._buffer = self._buffer.strip(), ""
+        return remainder
+
+
+class StreamingSpeaker:
+    """
+    Speaks a token stream sentence by sentence while it is still being generated.
+
+    `feed()` splits incoming text into sentences; a synthesis worker turns each sentence into audio
+    and a playback worker plays the clips in order, so the first sentence is heard while later ones
+    are still streaming or being synthesized.
+    """
+
+    def __init__(self, tts_model, text_filter=None, samplerate: int = 48050, trace_parent: str = None):
+        """
+        :param tts_model: Loaded TTS model
+        :param text_filter: Optional function applied to each sentence before synthesis (e.g. emoji stripping)
+        :param samplerate: Playback sample rate
+        :param trace_parent: Optional traceparent of the turn span the synthesis and playback spans belong to
+        """
+        self.tts_model = tts_model
+        self.text_filter = text_filter
+        self.samplerate = samplerate
+        self.trace_parent = trace_parent
+        self._splitter = SentenceSplitter()
+        self._sentences = queue.Queue()
+        self._clips = queue.Queue()
+        self._closed = False
+        self._synthesizer = threading.Thread(target=self._synthesize_loop, name="tts-synthesis", daemon=True)
+        self._player = threading.Thread(target=self._play_loop, name="tts-playback", daemon=True)
+        self._synthesizer.start()
+        self._player.start()
+
+    def feed(self, text: str):
+        for sentence in self._splitter.feed(text):
+            self._enqueue(sentence)
+
+    def close(self):
+        """
+        Marks the end of the stream; the last partial sentence is spoken too.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._enqueue(self._splitter.flush())
+        self._sentences.put(None)
+
+    def join(self, timeout=None):
+        """
+        Waits until everything fed so far has been played.
+        """
+        self.close()
+        self._player.join(timeout)
+
+    def _enqueue(self, sentence: str):
+        if self.text_filter is not None:
+            sentence = self.text_filter(sentence)
+        # Skip fragments with nothing to pronounce (e.g. only emoji or separators)
+        if any(ch.isalnum() for ch in sentence):
+            self._sentences.put(sentence.strip())
+
+    def _synthesize_loop(self):
+        while (sentence := self._sentences.get()) is not None:
+            try:
+                with span("tts.synthesize", parent=self.trace_parent, **{"tts.chars": len(sentence)}):
+                    self._clips.put(synthesize(self.tts_model, sentence))
+            except Exception as e:
+                print(f"[StreamingSpeaker] Could not synthesize {sentence!r}: {e}")
+        self._clips.put(None)
+
+    def _play_loop(self):
+        while (wav := self._clips.get()) is not None:
+            try:
+                with span("tts.play", parent=self.trace_parent, **{"tts.seconds": round(len(wav) / self.samplerate, 2)}):
+                    play_audio(wav, samplerate=self.samplerate)
+            except Exception as e:
+                print(f"[StreamingSpeaker] Playback failed: {e}")
+
+
+# Whisper works on 16 kHz mono float32 audio
+WHISPER_SAMPLE_RATE = 16000
+
+
+def decode_audio(audio, samplerate: int = None) -> np.ndarray:
+    """
+    Converts a recording to the 16 kHz mono float32 buffer Whisper expects, entirely in-process
+    (no temporary file and no ffmpeg subprocess).
+
+    :param audio: (samplerate, samples) tuple as produced by gr.Audio(type='numpy'), a numpy array of
+                  samples, or raw encoded bytes / a file path readable by soundfile
+    :param samplerate: Sample rate of `audio` when it is a bare numpy array
+    :return: 1-D float32 array in [-1, 1] sampled at WHISPER_SAMPLE_RATE
+    """
+    if isinstance(audio, tuple):
+        samplerate, audio = audio
+    elif isinstance(audio, (bytes, bytearray, str)):
+        import io
+        import soundfile as sf
+        source = io.BytesIO(audio) if isinstance(audio, (bytes, bytearray)) else audio
+        audio, samplerate = sf.read(source, dtype='float32', always_2d=False)
+
+    audio = np.asarray(audio)
+    if samplerate is None:
+        raise ValueError("samplerate is required when passing raw samples")
+
+    # Integer PCM (what browsers record) is scaled to [-1, 1]
+    if np.issubdtype(audio.dtype, np.integer):
+        audio = audio.astype(np.float32) / np.iinfo(audio.dtype).max
+    else:
+        audio = audio.astype(np.float32, copy=False)
+
+    # Down-mix to mono (samples are frames x channels)
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1)
+
+    if samplerate != WHISPER_SAMPLE_RATE:
+        import soxr
+        audio = soxr.resample(audio, samplerate, WHISPER_SAMPLE_RATE)
+
+    return np.ascontiguousarray(audio, dtype=np.float32)
+
+
+def transcribe_speech(stt_model, audio, samplerate: int = None):
+    """
+    Transcribes a recording with Whisper. The audio is decoded in memory (see decode_audio),
+    so Whisper never has to spawn ffmpeg.
+    """
+    transcription = stt_model.transcribe(decode_audio(audio, samplerate))
     return transcription['text']
 
 
+class BatchedTranscriber:
+    """
+    Shared speech-to-text service that groups utterances arriving at about the same time into one
+    batched Whisper forward pass.
+
+    `submit()` decodes the recording, queues it and returns a Future with the transcript. A worker
+    thread waits up to `window` seconds after the first queued utterance for others to arrive, then
+    pads them all to Whisper's 30 s input and decodes them together. Utterances longer than that
+    are transcribed on their own with the regular (chunked) transcribe().
+    """
+
+    def __init__(self, model_source: BackgroundModel, window: float = 0.05, max_batch: int = 16):
+        """
+        :param model_source: BackgroundModel providing the loaded Whisper model
+        :param window: Seconds to wait for more utterances after the first one of a batch arrives
+        :param max_batch: Maximum number of utterances decoded in one forward pass
+        """
+        self.model_source = model_source
+        self.window = window
+        self.max_batch = max_batch
+        self._requests = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def submit(self, audio, samplerate: int = None) -> Future:
+        """
+        Queues a recording (any input accepted by decode_audio) and returns a Future resolving to its text.
+        """
+        future = Future()
+        try:
+            self._requests.put((decode_audio(audio, samplerate), future))
+        except Exception as e:
+            future.set_exception(e)
+            return future
+        self._ensure_worker()
+        return future
+
+    def transcribe(self, audio, samplerate: int = None, timeout=None) -> str:
+        """
+        Blocking convenience wrapper around submit().
+        """
+        return self.submit(audio, samplerate).result(timeout)
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="stt-batcher", daemon=True)
+                self._worker.start()
+
+    def _next_batch(self) -> list:
+        batch = [self._requests.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                model = self.model_source.get()
+                with span("stt.whisper_batch", **{"stt.batch_size": len(batch)}):
+                    self._transcribe_batch(model, batch)
+            except Exception as e:
+                print(f"[BatchedTranscriber] Batch of {len(batch)} failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    @staticmethod
+    def _transcribe_batch(model, batch: list):
+        import torch
+        import whisper
+
+        max_samples = whisper.audio.N_SAMPLES
+        short = [(audio, future) for audio, future in batch if len(audio) <= max_samples]
+
+        # Long utterances need Whisper's sliding-window transcribe; there are few of them
+        for audio, future in batch:
+            if len(audio) > max_samples:
+                future.set_result(model.transcribe(audio)['text'])
+
+        if not short:
+            return
+
+        mel = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(torch.from_numpy(audio)), n_mels=model.dims.n_mels)
+            for audio, _ in short
+        ]).to(model.device)
+        options = whisper.DecodingOptions(fp16=model.device.type == "cuda")
+        with torch.no_grad():
+            results = whisper.decode(model, mel, options)
+
+        print(f"[BatchedTranscriber] Decoded {len(short)} utterance(s) in one pass")
+        for (_, future), result in zip(short, results):
+            future.set_result(result.text)
+
+
 if __name__ == "__main__":
     tts = get_tts_model("tts_models/en/jenny/jenny")
     text_to_speak = 'Greetings earthling! You have been chosen to join the Earth Space Command.' \
@@ -0,0 +1,283 @@
+import re
+import ast
+import json
+import time
+import sqlite3
+import threading
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from core.config import Config
+from core.challenges import BaseChallenge
+from core.usage import usage_thread
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS challenges (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type_key TEXT NOT NULL,
+    age_band TEXT NOT NULL,
+    dedupe_key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    used_count INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    UNIQUE (type_key, age_band, dedupe_key)
+);
+CREATE INDEX IF NOT EXISTS challenges_by_profile ON challenges (type_key, age_band, used_count);
+CREATE TABLE IF NOT EXISTS challenge_themes (
+    challenge_id INTEGER NOT NULL REFERENCES challenges (id) ON DELETE CASCADE,
+    keyword TEXT NOT NULL,
+    PRIMARY KEY (keyword, challenge_id)
+);
+"""
+
+_STOPWORDS = {
+    "the", "and", "for", "with", "that", "this", "likes", "like", "loves", "love", "wants", "want", "favorite",
+    "interests", "age", "years", "old", "name", "none", "not", "very", "are", "was", "his", "her", "their",
+}
+
+
+def age_band(age: Optional[int]) -> str:
+    """
+    Groups ages into the bands challenges are banked by.
+    """
+    if age is None:
+        return "any"
+    if age <= 6:
+        return "4-6"
+    if age <= 8:
+        return "7-8"
+    if age <= 10:
+        return "9-10"
+    return "11+"
+
+
+# Words of the survey's key names (favorite_color, ...) that older banks used as themes
+_KEY_NAME_THEMES = {"interests", "wants", "favorite", "color", "colour", "food", "animal", "book", "movie", "subject"}
+
+# Survey fields whose values describe what the child is into (the keys themselves are never themes)
+_THEME_FIELD = re.compile(r"^(interests?|hobbies|wants_to_be|favou?rite_\w+)$")
+
+
+def survey_fields(survey_data) -> Dict[str, str]:
+    """
+    The survey data as {key: value text}, from a dict, its repr, or the "key: value," lines the survey
+    extraction prompt produces.
+    """
+    if isinstance(survey_data, str) and survey_data.strip().startswith("{"):
+        try:
+            survey_data = ast.literal_eval(survey_data.strip())
+        except (ValueError, SyntaxError):
+            pass
+    if isinstance(survey_data, dict):
+        return {str(key).strip().lower(): " ".join(map(str, value)) if isinstance(value, (list, tuple, set))
+                else str(value) for key, value in survey_data.items()}
+
+    fields = {}
+    # One field per line, or several on a line separated by "," before the next "key:"
+    for segment in re.split(r"\n|,\s*(?=[A-Za-z_]+\s*:)", str(survey_data or "")):
+        key, sep, value = segment.partition(":")
+        if sep:
+            fields[key.strip().strip("'\"{ ").lower()] = value.strip().strip(",}")
+    return fields
+
+
+def profile_from_survey(survey_data) -> Tuple[str, List[str]]:
+    """
+    Extracts the age band and theme keywords from the survey data (a dict or its string form). Themes only
+    come from the values of the interest fields (interests, wants_to_be, favorite_*), so two children share
+    a theme only if they share an interest.
+    """
+    fields = survey_fields(survey_data)
+    match = re.search(r"\d+", fields.get("age", ""))
+    age = int(match.group()) if match else None
+
+    keywords = []
+    for key, value in fields.items():
+        if not _THEME_FIELD.match(key):
+            continue
+        for word in re.findall(r"[a-z]{3,}", value.lower()):
+            if word not in _STOPWORDS and word not in keywords:
+                keywords.append(word)
+    return age_band(age), keywords
+
+
+def _dedupe_key(challenge: BaseChallenge) -> str:
+    key = challenge.dedupe_key()
+    if isinstance(key, (set, frozenset)):
+        key = sorted(key)
+    return json.dumps(key)
+
+
+class ChallengeBank:
+    """
+    Persistent bank of validated challenges in a local SQLite database, indexed by challenge type,
+    age band and theme keywords, so the challenge agent can serve a challenge without waiting for the LLM.
+
+    `take()` prefers the least used items sharing the most theme keywords with the child's profile.
+    Profiles that could not be served are remembered (`misses()`) so a ChallengeBankRefiller can top them up.
+    """
+
+    def __init__(self, path: str = Config.CHALLENGE_BANK_DB):
+        """
+        :param path: Location of the SQLite database file
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self._misses = {}
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA foreign_keys=ON")
+            self.conn.executescript(_SCHEMA)
+            # Banks written before themes came from the survey values only were also tagged with the
+            # survey's key names, which every profile shared
+            key_names = sorted(_KEY_NAME_THEMES)
+            self.conn.execute(f"DELETE FROM challenge_themes WHERE keyword IN ({','.join('?' * len(key_names))})",
+                              key_names)
+            self.conn.commit()
+
+    def add(self, challenges: Iterable[BaseChallenge], band: str, themes: Iterable[str]) -> int:
+        """
+        Stores challenges under the given profile, skipping ones already banked.
+        :return int: Number of challenges added
+        """
+        themes = list(dict.fromkeys(themes))
+        added = 0
+        with self.lock:
+            for challenge in challenges:
+                cursor = self.conn.execute(
+                    "INSERT OR IGNORE INTO challenges (type_key, age_band, dedupe_key, payload, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (challenge.type_key, band, _dedupe_key(challenge), challenge.model_dump_json(), time.time()),
+                )
+                if cursor.rowcount:
+                    added += 1
+                    self.conn.executemany(
+                        "INSERT OR IGNORE INTO challenge_themes (challenge_id, keyword) VALUES (?, ?)",
+                        [(cursor.lastrowid, keyword) for keyword in themes],
+                    )
+            self.conn.commit()
+        return added
+
+    def take(self, type_key: str, band: str, themes: Iterable[str], n: int,
+             exclude: Iterable[BaseChallenge] = (), thread_id: Optional[str] = None) -> List[BaseChallenge]:
+        """
+        Returns up to `n` banked challenges for the profile, excluding ones the child has already seen,
+        and marks them as used. If the child has themes, only challenges sharing at least one of them are
+        served. A short result is recorded as a miss for the refill job.
+        :param thread_id: Thread of the child asking, which the refill of a miss is charged to
+        """
+        themes = list(themes)
+        excluded = [_dedupe_key(c) for c in exclude]
+        theme_clause = ",".join("?" * len(themes))
+        exclude_clause = f"AND c.dedupe_key NOT IN ({','.join('?' * len(excluded))}) " if excluded else ""
+        having_clause = "HAVING COUNT(t.keyword) > 0 " if themes else ""
+
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT c.id, c.payload FROM challenges c "
+                f"LEFT JOIN challenge_themes t ON t.challenge_id = c.id AND t.keyword IN ({theme_clause}) "
+                f"WHERE c.type_key = ? AND c.age_band IN (?, 'any') {exclude_clause}"
+                f"GROUP BY c.id {having_clause}ORDER BY COUNT(t.keyword) DESC, c.used_count ASC, c.id ASC LIMIT ?",
+                (*themes, type_key, band, *excluded, n),
+            ).fetchall()
+            self.conn.executemany("UPDATE challenges SET used_count = used_count + 1 WHERE id = ?",
+                                  [(row[0],) for row in rows])
+            if len(rows) < n:
+                self._misses[(type_key, band, tuple(themes))] = (themes, thread_id)
+            self.conn.commit()
+
+        return [BaseChallenge.get_class_by_type(type_key).model_validate_json(row[1]) for row in rows]
+
+    def count(self, type_key: str, band: str, themes: Iterable[str] = ()) -> int:
+        """
+        Number of challenges banked for the age band, counting only those sharing a theme if `themes` is given.
+        """
+        themes = list(themes)
+        theme_join = f"JOIN challenge_themes t ON t.challenge_id = c.id AND t.keyword IN " \
+                     f"({','.join('?' * len(themes))}) " if themes else ""
+        with self.lock:
+            return self.conn.execute(
+                f"SELECT COUNT(DISTINCT c.id) FROM challenges c {theme_join}WHERE c.type_key = ? AND c.age_band = ?",
+                (*themes, type_key, band),
+            ).fetchone()[0]
+
+    def misses(self) -> List[Tuple[str, str, List[str], Optional[str]]]:
+        """
+        Returns and clears the profiles that could not be fully served since the last call, with the thread
+        of the latest miss of each.
+        """
+        with self.lock:
+            misses, self._misses = self._misses, {}
+        return [(type_key, band, themes, thread_id) for (type_key, band, _), (themes, thread_id) in misses.items()]
+
+
+class ChallengeBankRefiller:
+    """
+    Background job keeping the challenge bank topped up for the profiles children actually have.
+
+    Every `interval` seconds (or right after `wake()`), each profile that recently missed is refilled
+    until it holds `target` challenges, using `generate(type_key, age_band, themes)` to produce new ones.
+    """
+
+    def __init__(self, bank: ChallengeBank, generate: Callable[[str, str, List[str]], List[BaseChallenge]],
+                 target: int = Config.CHALLENGE_BANK_TARGET, interval: float = 60.0):
+        """
+        :param bank: Bank to refill
+        :param generate: Function returning a list of validated challenges for a profile
+        :param target: Number of challenges to keep per profile
+        :param interval: Seconds between refill rounds
+        """
+        self.bank = bank
+        self.generate = generate
+        self.target = target
+        self.interval = interval
+        self._wake = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self) -> "ChallengeBankRefiller":
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="challenge-bank-refill", daemon=True)
+                self._thread.start()
+        return self
+
+    def wake(self):
+        """
+        Starts a refill round now (starting the job if needed).
+        """
+        self.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            for type_key, band, themes, thread_id in self.bank.misses():
+                # Charge the refill to the session that missed
+                with usage_thread(thread_id):
+                    self.refill(type_key, band, themes)
+
+    def refill(self, type_key: str, band: str, themes: List[str]):
+        # Stop after a few empty rounds so a model that keeps repeating itself cannot loop forever
+        attempts = 0
+        while self.bank.count(type_key, band, themes) < self.target and attempts < 3:
+            try:
+                added = self.bank.add(self.generate(type_key, band, themes), band, themes)
+            except Exception as e:
+                print(f"[ChallengeBankRefiller] Refill of {type_key}/{band} failed: {e}")
+                return
+            print(f"[ChallengeBankRefiller] Added {added} {type_key} challenge(s) for age band {band}")
+            attempts += 0 if added else 1
+
+
+@lru_cache(maxsize=None)
+def get_challenge_bank() -> Optional[ChallengeBank]:
+    """
+    Returns the process-wide challenge bank, or None if it is disabled with LQ_CHALLENGE_BANK=0.
+    """
+    if not Config.CHALLENGE_BANK:
+        return None
+    return ChallengeBank()
@@ -1,7 +1,8 @@
 from abc import abstractmethod
+from functools import lru_cache
 from typing import ClassVar, Dict, Type, Any, List, Tuple
 from typing_extensions import Self
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, create_model
 
 
 class BaseChallenge(BaseModel):
@@ -35,6 +36,15 @@ class BaseChallenge(BaseModel):
             raise ValueError(f"Unknown challenge type: {type_key}")
         return cls._registry[type_key].example().model_dump()
 
+    @classmethod
+    def batch_class_for(cls, type_key: str) -> Type[BaseModel]:
+        """Return a model wrapping a list of challenges of the given type, for generating a batch in one call"""
+        return _batch_class(cls.get_class_by_type(type_key))
+
+    def dedupe_key(self) -> Any:
+        """Key identifying challenges that are the same for the child, even if worded differently"""
+        return self.model_dump_json(exclude={"challenge_type"})
+
     @classmethod
     @abstractmethod
     def example(cls) -> "BaseChallenge":
@@ -46,6 +56,14 @@ class BaseChallenge(BaseModel):
         raise NotImplementedError
 
 
+@lru_cache(maxsize=None)
+def _batch_class(challenge_class: Type[BaseChallenge]) -> Type[BaseModel]:
+    return create_model(
+        f"{challenge_class.__name__}Batch",
+        challenges=(List[challenge_class], Field(description="List of distinct challenges")),
+    )
+
+
 class Pairing(BaseModel):
     words: List[str] = Field(description="List of two words that are associated")
     justification: str = Field(default="String representing the justification for the pairing")
@@ -65,6 +83,9 @@ class PhonemicAwareness(BaseChallenge):
     def class_type(cls) -> type["PhonemicAwareness"]:
         return cls
 
+    def dedupe_key(self) -> Any:
+        return self.non_word_pair[0].strip().lower()
+
     @classmethod
     def example(cls) -> "PhonemicAwareness":
         return cls(
@@ -111,6 +132,10 @@ class ChallengeTriplet(BaseChallenge):
     def class_type(cls) -> type["BaseChallenge"]:
         return cls
 
+    def dedupe_key(self) -> Any:
+        # The same three words in any order are the same challenge
+        return frozenset(word.strip().lower() for word in self.triplet)
+
     @classmethod
     def example(cls) -> "ChallengeTriplet":
         return cls(
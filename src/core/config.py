@@ -11,6 +11,91 @@ class Config:
     DEFAULT_MODEL = "gpt-3.5-turbo"
     TEMPERATURE = 0.8
 
+    # Model call telemetry: price table (USD per 1M tokens) and JSONL file every call is logged to ("" to disable)
+    COSTS_FILE = os.getenv("LQ_COSTS_FILE", "data/costs-2025.json")
+    USAGE_LOG = os.getenv("LQ_USAGE_LOG", "usage.jsonl") or None
+
+    # OpenTelemetry tracing of graph nodes and model/STT/TTS calls: "" (off), "console", "file" (JSON lines
+    # in TRACE_FILE) or "otlp" (OTEL_EXPORTER_OTLP_* environment variables)
+    TRACING = os.getenv("LQ_TRACING", "")
+    TRACE_FILE = os.getenv("LQ_TRACE_FILE", "traces.jsonl")
+
+    # Session registry limits (one session per connected Gradio client)
+    SESSION_CAPACITY = int(os.getenv("LQ_SESSION_CAPACITY", 64))
+    SESSION_IDLE_TTL = float(os.getenv("LQ_SESSION_IDLE_TTL", 30 * 60))
+
+    # Checkpointer: "memory" (MemorySaver) or "sqlite" (durable, delta-compressed, bounded per thread)
+    CHECKPOINTER = os.getenv("LQ_CHECKPOINTER", "memory")
+    CHECKPOINT_DB = os.getenv("LQ_CHECKPOINT_DB", "checkpoints.sqlite")
+    CHECKPOINT_KEEP_LAST = int(os.getenv("LQ_CHECKPOINT_KEEP_LAST", 10))
+    # Durable threads are kept after their session ends (to be resumed) and deleted after this many idle days
+    CHECKPOINT_RETENTION_DAYS = float(os.getenv("LQ_CHECKPOINT_RETENTION_DAYS", 30))
+
+    # How the challenge agent generates a batch of challenges:
+    # "list" (one structured call returning the whole batch), "concurrent" (parallel calls with
+    # diversity seeds, then de-duplicated) or "sequential" (one call per challenge, feeding back earlier ones)
+    CHALLENGE_BATCH_MODE = os.getenv("LQ_CHALLENGE_BATCH_MODE", "list")
+    CHALLENGE_BATCH_SIZE = int(os.getenv("LQ_CHALLENGE_BATCH_SIZE", 5))
+
+    # Manager routing outside the challenge flow: "rules", "hybrid" (rules, LLM only when they cannot decide)
+    # or "llm" (LLM on every turn); rules request challenges every CHALLENGE_EVERY_K story turns
+    ROUTING_POLICY = os.getenv("LQ_ROUTING_POLICY", "hybrid")
+    CHALLENGE_EVERY_K = int(os.getenv("LQ_CHALLENGE_EVERY_K", 3))
+    # Manager LLM context: the last messages of full_history and the last control events (FullState.events)
+    MANAGER_CONTEXT_MESSAGES = int(os.getenv("LQ_MANAGER_CONTEXT_MESSAGES", 12))
+    MANAGER_CONTEXT_EVENTS = int(os.getenv("LQ_MANAGER_CONTEXT_EVENTS", 8))
+
+    # Narrative prompt window: the last STORY_KEEP_LAST story messages are sent verbatim, older ones are
+    # summarized in the background every STORY_FOLD_EVERY messages
+    STORY_KEEP_LAST = int(os.getenv("LQ_STORY_KEEP_LAST", 8))
+    STORY_FOLD_EVERY = int(os.getenv("LQ_STORY_FOLD_EVERY", 4))
+
+    # Local bank of validated challenges indexed by type, age band and theme (LLM generation only on a miss)
+    CHALLENGE_BANK = os.getenv("LQ_CHALLENGE_BANK", "1") != "0"
+    CHALLENGE_BANK_DB = os.getenv("LQ_CHALLENGE_BANK_DB", "challenge_bank.sqlite")
+    CHALLENGE_BANK_TARGET = int(os.getenv("LQ_CHALLENGE_BANK_TARGET", 20))
+
+    # Assessment of a child's answer: "two_pass" (an extraction call, then an evaluation call) or "single_pass"
+    # (one call extracting and evaluating; AssessmentAgent.compare_modes measures how well the two agree)
+    ASSESSMENT_MODE = os.getenv("LQ_ASSESSMENT_MODE", "two_pass")
+    # Local pre-scoring of extracted VA answers: expected pairs with a justification at least this similar are
+    # scored correct, and pairs naming words outside the triplet incorrect, without an evaluation call
+    ASSESSMENT_PRESCORE = os.getenv("LQ_ASSESSMENT_PRESCORE", "1") != "0"
+    PRESCORE_MIN_SIMILARITY = float(os.getenv("LQ_PRESCORE_MIN_SIMILARITY", 0.6))
+    # Assessment exports, one directory per session (thread) under ASSESSMENT_EXPORT_DIR. CSVs are appended to in
+    # the background; plots are rendered when the session ends ("end"), after every answer ("item") or never ("off")
+    ASSESSMENT_EXPORT_DIR = os.getenv("LQ_ASSESSMENT_EXPORT_DIR", "src/agents/outputs")
+    ASSESSMENT_PLOTS = os.getenv("LQ_ASSESSMENT_PLOTS", "end")
+    # Cross-session store of assessment results (one row per item and per evaluated answer) for cohort analytics
+    ASSESSMENT_STORE = os.getenv("LQ_ASSESSMENT_STORE", "1") != "0"
+    ASSESSMENT_DB = os.getenv("LQ_ASSESSMENT_DB", "assessments.sqlite")
+
+    # Profanity screen of the child's messages (core/profanity.py): an alt-profanity-check probability below
+    # PROFANITY_CLEAN_BELOW passes, above PROFANITY_PROFANE_ABOVE is rejected, and Guardrails decides in between
+    PROFANITY_CLEAN_BELOW = float(os.getenv("LQ_PROFANITY_CLEAN_BELOW", 0.2))
+    PROFANITY_PROFANE_ABOVE = float(os.getenv("LQ_PROFANITY_PROFANE_ABOVE", 0.9))
+    PROFANITY_CACHE_SIZE = int(os.getenv("LQ_PROFANITY_CACHE_SIZE", 4096))
+
+    # Prepare the survey data, story opening and first challenges in the background once the survey has
+    # this many answers, so finishing the survey does not wait on the LLM
+    PREFETCH = os.getenv("LQ_PREFETCH", "1") != "0"
+    PREFETCH_AFTER_ANSWERS = int(os.getenv("LQ_PREFETCH_AFTER_ANSWERS", 3))
+    PREFETCH_WORKERS = int(os.getenv("LQ_PREFETCH_WORKERS", 4))
+    # Longest wait (seconds) for a prefetched artifact still being computed before computing it live instead
+    PREFETCH_WAIT = float(os.getenv("LQ_PREFETCH_WAIT", 2))
+
+    # Start loading the TTS/Whisper models in the background at startup (otherwise on first use)
+    PRELOAD_AUDIO_MODELS = os.getenv("LQ_PRELOAD_AUDIO", "1") != "0"
+
+    # Speech-to-text micro-batching: utterances arriving within this window share one Whisper pass
+    STT_BATCH_WINDOW = float(os.getenv("LQ_STT_BATCH_WINDOW", 0.05))
+    STT_MAX_BATCH = int(os.getenv("LQ_STT_MAX_BATCH", 16))
+
+    # Content-addressed cache of synthesized speech (memory LRU bounded in bytes, spilled to TTS_CACHE_DIR)
+    TTS_CACHE = os.getenv("LQ_TTS_CACHE", "1") != "0"
+    TTS_CACHE_DIR = os.getenv("LQ_TTS_CACHE_DIR", "tts_cache")
+    TTS_CACHE_MAX_BYTES = int(os.getenv("LQ_TTS_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
     @staticmethod
     def validate_keys():
         if not Config.OPENAI_API_KEY and not Config.GOOGLE_API_KEY:
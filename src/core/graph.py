@@ -1,11 +1,14 @@
 from langgraph.graph import StateGraph, START, END
-from langgraph.checkpoint.memory import MemorySaver
 from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
 
 from agents import NarrativeAgent, ChallengeAgent, ManagerAgent, AlignmentAgent, AssessmentAgent
+from agents.narrative_agent import OPENING_CUE
 
 from core.config import survey_results
 from core.states import FullState
+from core.checkpoint import get_checkpointer
+from core.tracing import traced_node
 
 
 def finish_survey_node(state: FullState) -> FullState:
@@ -15,18 +18,36 @@ def finish_survey_node(state: FullState) -> FullState:
     print("[finish_survey_node] Checking if survey is finished...")
     if getattr(state.narrative, "finished_survey", False):
         print("[finish_survey_node] Survey is finished, resetting story and full history.")
-        separator_message = HumanMessage(content="--- START NOW ---")
+        separator_message = HumanMessage(content=OPENING_CUE)
         state.full_history = [separator_message]  # Reset full history to just the separator
         state.narrative.story = [separator_message]  # Reset full history to just the separator
         print("[finish_survey_node] Story and full history reset.")
     return state
 
 
-def initialize_graph(llm):
+def agent_node(agent, name: str):
+    """
+    Wraps an agent as a graph node exposing both entry points: `__call__` when the graph runs with
+    invoke/stream and `acall` when it runs with ainvoke/astream. Each run of the node is traced as a span.
+    """
+    return RunnableLambda(traced_node(name, agent.__call__), afunc=traced_node(name, agent.acall), name=agent.name)
+
+
+def initialize_graph(llm, checkpointer=None):
+    """
+    Builds and compiles the multi-agent workflow for `llm`.
+
+    Agents keep no per-session data, so the compiled graph is meant to be built once per process (per LLM)
+    and shared by every session; sessions are told apart by their `thread_id`.
+
+    If no checkpointer is given, the process-wide one selected by `Config.CHECKPOINTER` is used.
+    """
     # Create agents
     manager_agent = ManagerAgent(model=llm)
-    narrative_agent = NarrativeAgent(model=llm, survey_results=survey_results)
     challenge_agent = ChallengeAgent(model=llm)
+    # The first challenges are prepared in the background while the survey is still running
+    narrative_agent = NarrativeAgent(model=llm, survey_results=survey_results,
+                                     challenge_generator=challenge_agent.prefetch_challenges)
     assessment_agent = AssessmentAgent(model=llm)
     alignment_agent = AlignmentAgent()
 
@@ -50,18 +71,18 @@ def initialize_graph(llm):
         return state
 
     # Initialize memory
-    memory = MemorySaver()
+    memory = checkpointer if checkpointer is not None else get_checkpointer()
 
     # Define the multi-agent workflow graph
     workflow = (
         StateGraph(FullState)
-        .add_node('alignment_agent', alignment_agent)
-        .add_node('manager', manager_agent)
-        .add_node('narrative_agent', narrative_agent)
-        .add_node('challenge_agent', challenge_agent)
-        .add_node('manager_router', manager_router)
-        .add_node('assessment_agent', assessment_agent)
-        .add_node('finish_survey_node', finish_survey_node)  # Add skip indicator node
+        .add_node('alignment_agent', agent_node(alignment_agent, 'alignment_agent'))
+        .add_node('manager', agent_node(manager_agent, 'manager'))
+        .add_node('narrative_agent', agent_node(narrative_agent, 'narrative_agent'))
+        .add_node('challenge_agent', agent_node(challenge_agent, 'challenge_agent'))
+        .add_node('manager_router', traced_node('manager_router', manager_router))
+        .add_node('assessment_agent', agent_node(assessment_agent, 'assessment_agent'))
+        .add_node('finish_survey_node', traced_node('finish_survey_node', finish_survey_node))  # Add skip indicator node
 
         .add_edge(START, 'alignment_agent')
         .add_conditional_edges(
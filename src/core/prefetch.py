@@ -0,0 +1,206 @@
+import threading
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple, Union
+
+from core.config import Config
+from core.usage import usage_thread
+
+
+# A job returns its artifacts by name, either all at once or as (name, artifact) pairs yielded as they are ready
+Job = Callable[[], Union[Dict[str, Any], Iterable[Tuple[str, Any]]]]
+
+
+class _Run:
+    """
+    One run of a job. Every artifact has its own future, resolved as soon as the job produces it.
+    """
+
+    def __init__(self, version: int):
+        self.version = version
+        self.futures: Dict[str, Future] = {}
+        self.produced: Set[str] = set()
+        self.consumed: Set[str] = set()
+        self.finished = False
+
+    def future(self, name: str) -> Future:
+        # Called under the store's lock
+        if name not in self.futures:
+            self.futures[name] = Future()
+            if self.finished:
+                # The job is over and never produced it
+                self.futures[name].set_result(None)
+        return self.futures[name]
+
+
+class _Slot:
+    """
+    The jobs of one thread: the one running, the latest one waiting for it, and the last one that finished.
+    """
+
+    def __init__(self):
+        self.version = -1
+        self.running: Optional[_Run] = None
+        self.task: Optional[Future] = None
+        self.pending: Optional[Tuple[int, Job]] = None
+        self.finished: Optional[_Run] = None
+
+    def idle(self) -> bool:
+        return self.running is None and self.pending is None and self.finished is None
+
+
+class PrefetchStore:
+    """
+    Artifacts computed ahead of time for a conversation, keyed by LangGraph thread id.
+
+    Agents are shared by every session, so work started in the background for one child (e.g. the
+    survey-data extraction and story opening prepared while the survey is still running) is parked
+    here until the agent serving that child's thread picks it up.
+
+    A job is submitted with a `version` (e.g. the number of survey answers it was computed from). Each thread
+    runs one job at a time: newer versions submitted meanwhile are debounced, so only the latest of them runs
+    once the current job is done. The artifacts of the last finished job stay available until a newer job
+    finishes, and each artifact of a running job is served as soon as it is ready.
+    """
+
+    def __init__(self, max_workers: int = Config.PREFETCH_WORKERS):
+        """
+        :param max_workers: Number of background threads running prefetch jobs
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._slots: Dict[str, _Slot] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, thread_id: str, version: int, job: Job) -> bool:
+        """
+        Runs `job` for the thread unless a job of the same or a newer version was already submitted.
+        If a job is running, `job` replaces any job waiting for it and starts once it is done.
+        :return bool: Whether the job was accepted
+        """
+        with self._lock:
+            slot = self._slots.setdefault(thread_id, _Slot())
+            if slot.version >= version:
+                return False
+            slot.version = version
+            if slot.running is not None:
+                slot.pending = (version, job)
+            else:
+                self._start(thread_id, slot, version, job)
+            return True
+
+    def _start(self, thread_id: str, slot: _Slot, version: int, job: Job):
+        # Called under the lock
+        run = _Run(version)
+        slot.running = run
+        slot.task = self._executor.submit(self._run, thread_id, slot, run, job)
+
+    def _run(self, thread_id: str, slot: _Slot, run: _Run, job: Job):
+        print(f"[prefetch] Preparing artifacts for thread {thread_id} (version {run.version})")
+        # The job's model calls are charged to the thread
+        with usage_thread(thread_id):
+            try:
+                artifacts = job()
+                for name, value in artifacts.items() if isinstance(artifacts, dict) else artifacts:
+                    with self._lock:
+                        run.produced.add(name)
+                        future = run.future(name)
+                    try:
+                        future.set_result(value)
+                    except InvalidStateError:
+                        pass
+            except Exception as e:
+                print(f"[prefetch] Job for thread {thread_id} failed: {e}")
+
+        with self._lock:
+            run.finished = True
+            unresolved = [future for future in run.futures.values() if not future.done()]
+            if slot.running is run:
+                slot.running, slot.task = None, None
+                # A failed job does not hide the artifacts of the previous one
+                if run.produced:
+                    slot.finished = run
+                if slot.pending is not None:
+                    version, pending_job = slot.pending
+                    slot.pending = None
+                    self._start(thread_id, slot, version, pending_job)
+                # A failed job with nothing before or after it leaves nothing to serve: forget the thread,
+                # so has() is False and the next submission (of any version) retries
+                if slot.idle() and self._slots.get(thread_id) is slot:
+                    del self._slots[thread_id]
+        for future in unresolved:
+            future.set_result(None)
+
+    def _lookup(self, thread_id: Optional[str], name: str, min_version: int,
+                timeout: Optional[float]) -> Tuple[Optional[_Run], Optional[Any]]:
+        with self._lock:
+            slot = self._slots.get(thread_id)
+            if slot is None:
+                return None, None
+            # Newest first: the running job, then the last finished one
+            candidates = [(run, run.future(name)) for run in (slot.running, slot.finished)
+                          if run is not None and run.version >= min_version and name not in run.consumed]
+        for run, future in candidates:
+            try:
+                value = future.result(timeout)
+            except Exception:
+                continue
+            if value is not None:
+                return run, value
+        return None, None
+
+    def get(self, thread_id: Optional[str], name: str, min_version: int = 0,
+            timeout: Optional[float] = Config.PREFETCH_WAIT) -> Optional[Any]:
+        """
+        Returns the artifact `name` for the thread from the newest job of at least `min_version` that has it,
+        waiting up to `timeout` seconds for a running job to produce it before falling back on the last
+        finished job. Returns None otherwise.
+        """
+        return self._lookup(thread_id, name, min_version, timeout)[1]
+
+    def pop(self, thread_id: Optional[str], name: str, min_version: int = 0,
+            timeout: Optional[float] = Config.PREFETCH_WAIT) -> Optional[Any]:
+        """
+        Like get(), but the artifact is consumed so it is only served once.
+        """
+        run, value = self._lookup(thread_id, name, min_version, timeout)
+        if run is None:
+            return None
+        with self._lock:
+            run.consumed.add(name)
+            slot = self._slots.get(thread_id)
+            if slot is not None:
+                # Forget finished jobs with nothing left to serve
+                if slot.finished is not None and slot.finished.produced <= slot.finished.consumed:
+                    slot.finished = None
+                if slot.idle():
+                    del self._slots[thread_id]
+        return value
+
+    def has(self, thread_id: Optional[str]) -> bool:
+        """
+        Whether a job for the thread is running or queued, or a finished one still has artifacts to serve.
+        """
+        with self._lock:
+            slot = self._slots.get(thread_id)
+            return slot is not None and not slot.idle()
+
+    def discard(self, thread_id: Optional[str]):
+        """
+        Drops everything prepared for the thread (e.g. when its session is reset or evicted).
+        """
+        with self._lock:
+            slot = self._slots.pop(thread_id, None)
+            if slot is None:
+                return
+            slot.pending = None
+            run, task = slot.running, slot.task
+        # Not started yet: no point running it anymore (a job already running finishes on its own)
+        if task is not None and task.cancel():
+            for future in list(run.futures.values()):
+                if not future.done():
+                    future.set_result(None)
+
+
+# Process-wide stores shared by all agents and sessions
+PREFETCH = PrefetchStore()
+# Background story summaries, versioned by how many story messages they cover (see agents/story_context.py)
+SUMMARIES = PrefetchStore(max_workers=2)
@@ -0,0 +1,136 @@
+import re
+import threading
+from difflib import SequenceMatcher
+from typing import Dict, Iterable
+
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "but", "because", "cause", "cuz", "so", "they", "them", "it", "its", "is", "are",
+    "was", "were", "be", "both", "of", "to", "in", "on", "at", "for", "with", "by", "off", "up", "you", "your",
+    "can", "could", "do", "does", "that", "this", "these", "those", "there", "go", "goes", "together", "like",
+    "i", "me", "my", "we", "he", "she", "his", "her", "their", "has", "have", "very", "really", "just",
+}
+
+
+# Words ending in "s" that are not plurals
+NOT_PLURAL = {"news", "series", "species", "lens", "bus", "gas", "yes", "always", "was", "has", "does", "maths",
+              "physics", "chaos", "famous", "glass", "grass", "dress", "class", "kiss", "boss"}
+
+# Words that deny or flip a relation ("dogs don't like bones", "dogs hate bones"): the pre-scorer never
+# settles a justification containing one, the model judges it
+NEGATION_CUES = {"not", "no", "never", "nothing", "none", "nobody", "neither", "nor", "without", "cannot",
+                 "dont", "doesnt", "didnt", "cant", "wont", "isnt", "arent", "wasnt", "hate", "hates", "hated",
+                 "dislike", "dislikes", "unlike", "opposite", "opposites", "instead"}
+
+VOWELS = set("aeiou")
+
+
+def _restore_stem(stem: str) -> str:
+    # "running" -> "runn" -> "run", "stopped" -> "stopp" -> "stop"; "baking" -> "bak" -> "bake"
+    doubled = len(stem) >= 3 and stem[-1] == stem[-2] and stem[-1] not in VOWELS and stem[-1] not in "lsz"
+    if doubled and not (len(stem) == 3 and stem[0] in VOWELS):  # "adding" -> "add"
+        return stem[:-1]
+    if len(stem) == 3 and stem[0] not in VOWELS and stem[1] in VOWELS and stem[2] not in VOWELS | set("wxy"):
+        return stem + "e"
+    return stem
+
+
+def lemma(word: str) -> str:
+    """
+    Rough English lemma (plurals and common verb endings), enough to match a child's wording against the
+    expected answer without a lexical database: "bones" -> "bone", "flies" -> "fly", "pies" -> "pie",
+    "running" -> "run", "baked" -> "bake", "news" -> "news".
+    """
+    word = word.lower().strip()
+    if len(word) <= 3 or word in NOT_PLURAL:
+        return word
+    if word.endswith("ies"):
+        # "pies", "ties": the "ie" belongs to the word
+        return word[:-1] if len(word) <= 4 else word[:-3] + "y"
+    if word.endswith(("ches", "shes", "sses", "xes", "zes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    if word.endswith("ing") and len(word) > 5:
+        return _restore_stem(word[:-3])
+    if word.endswith("eed"):
+        return word[:-1]
+    if word.endswith("ied") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("ed") and len(word) > 4:
+        return _restore_stem(word[:-2])
+    return word
+
+
+def tokens(text: str) -> list:
+    return re.findall(r"[a-z']+", text.lower())
+
+
+def content_lemmas(text: str, exclude: Iterable[str] = ()) -> list:
+    """
+    Lemmas of the content words of `text` in order, leaving out stopwords and the lemmas in `exclude`.
+    """
+    excluded = set(exclude)
+    return [word for word in (lemma(token) for token in tokens(text) if token not in STOPWORDS) if word not in excluded]
+
+
+def has_negation(text: str) -> bool:
+    """
+    Whether the text contains a negation or antonym cue (see NEGATION_CUES), including any "n't" contraction.
+    """
+    return any(token in NEGATION_CUES or token.endswith("n't") for token in tokens(text))
+
+
+def justification_similarity(answer: str, expected: str, pair_lemmas: Iterable[str] = ()) -> float:
+    """
+    Lexical similarity of two justifications, in [0, 1], over their content lemmas (the paired words themselves
+    excluded, since both justifications tend to repeat them): the larger of the overlap of the two lemma sets
+    and the character similarity of the lemma sequences, which tolerates small spelling differences.
+
+    Surface similarity says nothing about meaning, so it is 0 (left to the model) whenever it could not be
+    trusted: either justification has a negation or antonym cue, one of them has no content lemmas left
+    ("dogs like bones"), or they share none.
+    """
+    if has_negation(answer) or has_negation(expected):
+        return 0.0
+    pair_lemmas = list(pair_lemmas)
+    a, b = content_lemmas(answer, pair_lemmas), content_lemmas(expected, pair_lemmas)
+    if not set(a) & set(b):
+        return 0.0
+    overlap = len(set(a) & set(b)) / len(set(a) | set(b))
+    ratio = SequenceMatcher(None, " ".join(a), " ".join(b)).ratio()
+    return max(overlap, ratio)
+
+
+class PrescoreStats:
+    """
+    Process-wide counters of how many assessed items and answers the local pre-scorer settled on its own.
+    """
+
+    def __init__(self):
+        self.items = 0
+        self.items_settled = 0
+        self.answers = 0
+        self.answers_settled = 0
+        self._lock = threading.Lock()
+
+    def record(self, answers: int, settled: int):
+        with self._lock:
+            self.items += 1
+            self.items_settled += answers > 0 and settled == answers
+            self.answers += answers
+            self.answers_settled += settled
+
+    def summary(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "items": self.items,
+                "items_settled_locally": self.items_settled,
+                "item_share_settled_locally": self.items_settled / self.items if self.items else None,
+                "answers": self.answers,
+                "answers_settled_locally": self.answers_settled,
+                "answer_share_settled_locally": self.answers_settled / self.answers if self.answers else None,
+            }
+
+
+PRESCORE_STATS = PrescoreStats()
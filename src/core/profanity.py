@@ -0,0 +1,179 @@
+import re
+import time
+import threading
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from core.config import Config
+
+
+@lru_cache(maxsize=None)
+def get_fast_scorer():
+    """
+    alt-profanity-check's `predict_prob` (a linear model over character and word n-grams, well under a
+    millisecond per message), or None if the package is not installed.
+    """
+    try:
+        from profanity_check import predict_prob
+    except ImportError as e:
+        print(f"[ProfanityScreen] Fast scorer unavailable, every check goes to Guardrails: {e}")
+        return None
+    return predict_prob
+
+
+@lru_cache(maxsize=None)
+def get_guardrails_validator():
+    """
+    The Guardrails ProfanityFree validator, loaded on first use rather than at import (loading the hub is slow),
+    or None if it is not installed.
+    """
+    try:
+        from guardrails.hub import ProfanityFree
+    except ImportError as e:
+        print(f"[ProfanityScreen] Guardrails ProfanityFree unavailable: {e}")
+        return None
+    return ProfanityFree(on_fail="exception")
+
+
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", str(text)).strip().lower()
+
+
+class ProfanityScreen:
+    """
+    Profanity check for the children's messages with a fast local path.
+
+    Messages are scored by alt-profanity-check first: a probability below `clean_below` passes and one above
+    `profane_above` is rejected right away. Only the unsure ones in between go to the heavier Guardrails
+    ProfanityFree validator. Verdicts for short messages, which repeat a lot ("yes", "SKIP SURVEY"), are kept
+    in an LRU cache. The latency of every check is recorded by the path that decided it (see `stats`).
+    If neither backend is available, every message is rejected.
+    """
+
+    def __init__(self, clean_below: float = Config.PROFANITY_CLEAN_BELOW,
+                 profane_above: float = Config.PROFANITY_PROFANE_ABOVE,
+                 cache_size: int = Config.PROFANITY_CACHE_SIZE, cache_max_chars: int = 64):
+        """
+        :param clean_below: Fast-path probability under which a message is clean
+        :param profane_above: Fast-path probability over which a message is profane
+        :param cache_size: Number of verdicts kept in the LRU cache
+        :param cache_max_chars: Only messages up to this length (normalized) are cached
+        """
+        self.clean_below = clean_below
+        self.profane_above = profane_above
+        self.cache_size = cache_size
+        self.cache_max_chars = cache_max_chars
+        self._cache: "OrderedDict[str, bool]" = OrderedDict()
+        self._latencies: Dict[str, deque] = {}
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def is_clean(self, text: str) -> bool:
+        """
+        Whether the message is free of profanity.
+        """
+        return self.is_clean_batch([text])[0]
+
+    def is_clean_batch(self, texts: List[str]) -> List[bool]:
+        """
+        Checks several messages at once: the cache misses are scored by the fast path in a single call.
+        """
+        started = time.perf_counter()
+        keys = [normalize(text) for text in texts]
+        verdicts: List[Optional[bool]] = [self._cached(key) for key in keys]
+        paths = ["cache" if verdict is not None else None for verdict in verdicts]
+
+        misses = [i for i, verdict in enumerate(verdicts) if verdict is None]
+        scores = self.score_batch([texts[i] for i in misses]) if misses else []
+        for i, score in zip(misses, scores):
+            if score is not None and score < self.clean_below:
+                verdicts[i], paths[i] = True, "fast"
+            elif score is not None and score > self.profane_above:
+                verdicts[i], paths[i] = False, "fast"
+            elif score is None and get_guardrails_validator() is None:
+                # Nothing can check the message: a children's safety filter fails closed (not cached, so
+                # checks resume as soon as a backend is available)
+                print("[ProfanityScreen] ERROR: neither alt-profanity-check nor Guardrails is available, "
+                      "rejecting the message")
+                verdicts[i], paths[i] = False, "unavailable"
+                continue
+            else:
+                verdicts[i], paths[i] = self._validate(texts[i], score), "guardrails"
+            self._remember(keys[i], verdicts[i])
+
+        # A batch shares its fast-path call, so each message is charged an equal part of it (plus its Guardrails call)
+        elapsed = (time.perf_counter() - started) / len(texts) if texts else 0.0
+        for path in paths:
+            self._record(path, elapsed)
+        return verdicts
+
+    def score_batch(self, texts: List[str]) -> List[Optional[float]]:
+        """
+        Fast-path profanity probabilities, or None for every message if the fast scorer is unavailable.
+        """
+        predict_prob = get_fast_scorer()
+        if predict_prob is None:
+            return [None] * len(texts)
+        try:
+            return [float(p) for p in predict_prob([str(text) for text in texts])]
+        except Exception as e:
+            print(f"[ProfanityScreen] Fast scorer failed, deferring to Guardrails: {e}")
+            return [None] * len(texts)
+
+    def _validate(self, text: str, score: Optional[float]) -> bool:
+        validator = get_guardrails_validator()
+        if validator is None:
+            # Nothing heavier to ask: fall back on the fast path's own decision threshold
+            return score is not None and score < 0.5
+        started = time.perf_counter()
+        try:
+            validator(text)
+            return True
+        except Exception as e:
+            print(f"[ProfanityScreen] Guardrails rejected the input: {e}")
+            return False
+        finally:
+            self._record("guardrails_call", time.perf_counter() - started)
+
+    def _cached(self, key: str) -> Optional[bool]:
+        with self._lock:
+            verdict = self._cache.get(key)
+            if verdict is not None:
+                self._cache.move_to_end(key)
+            return verdict
+
+    def _remember(self, key: str, verdict: bool):
+        if len(key) > self.cache_max_chars:
+            return
+        with self._lock:
+            self._cache[key] = verdict
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _record(self, path: str, seconds: float):
+        with self._lock:
+            self._counts[path] = self._counts.get(path, 0) + 1
+            self._latencies.setdefault(path, deque(maxlen=1000)).append(seconds)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Number of checks decided by each path ("cache", "fast", "guardrails", "unavailable") and their latency
+        percentiles in milliseconds, over the last 1000 checks per path. "guardrails_call" times the validator alone.
+        """
+        with self._lock:
+            snapshot = {path: sorted(latencies) for path, latencies in self._latencies.items()}
+            counts = dict(self._counts)
+        return {
+            path: {
+                "checks": counts[path],
+                **{f"p{q}_ms": 1000 * latencies[min(len(latencies) - 1, int(q / 100 * len(latencies)))]
+                   for q in (50, 95, 99)},
+            }
+            for path, latencies in snapshot.items()
+        }
+
+
+# Process-wide screen shared by all sessions
+PROFANITY_SCREEN = ProfanityScreen()
@@ -0,0 +1,56 @@
+import json
+import threading
+from functools import lru_cache
+from typing import Any, Dict, Tuple
+
+from langchain_core.prompts import ChatPromptTemplate
+
+
+# Structured-output runnables by (id of the model, schema); the model is kept with its runnable so its id
+# cannot be reused by another object while the entry exists
+_STRUCTURED: Dict[Tuple[int, Any], Tuple[Any, Any]] = {}
+_STRUCTURED_LOCK = threading.Lock()
+
+# Characters that would otherwise be read as template variables, in a single pass
+_BRACES = str.maketrans({"{": "{{", "}": "}}"})
+
+
+def structured_output(model, schema):
+    """
+    Returns `model.with_structured_output(schema)`, built once per process for each (model, schema) and
+    shared by every agent. The compiled graph and its agents are shared by all sessions, so in practice
+    there is one entry per schema and LLM.
+    """
+    key = (id(model), schema)
+    entry = _STRUCTURED.get(key)
+    if entry is None or entry[0] is not model:
+        with _STRUCTURED_LOCK:
+            entry = _STRUCTURED.get(key)
+            if entry is None or entry[0] is not model:
+                entry = (model, model.with_structured_output(schema))
+                _STRUCTURED[key] = entry
+    return entry[1]
+
+
+@lru_cache(maxsize=None)
+def schema_json(schema) -> str:
+    """
+    The JSON schema of a pydantic model, serialized compactly for prompts.
+    """
+    return json.dumps(schema.model_json_schema(), separators=(",", ":"))
+
+
+@lru_cache(maxsize=256)
+def chat_template(messages: Tuple[Tuple[str, str], ...]) -> ChatPromptTemplate:
+    """
+    A ChatPromptTemplate for (role, template) pairs, parsed once per distinct set of templates.
+    Anything that changes between calls should be a template variable, not part of the template text.
+    """
+    return ChatPromptTemplate(list(messages))
+
+
+def escape_template(text: str) -> str:
+    """
+    Escapes literal braces so `text` can be embedded in a template string.
+    """
+    return text.translate(_BRACES)
@@ -0,0 +1,235 @@
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from core.assessment_export import ASSESSMENT_EXPORTS
+from core.checkpoint import get_checkpointer
+from core.config import Config
+from core.prefetch import PREFETCH, SUMMARIES
+from core.usage import USAGE
+
+
+def generate_thread_id(prefix: str = "", length: Optional[int] = None) -> str:
+    """
+    Generates a unique thread ID with an optional prefix, from a full UUID unless `length` truncates it.
+    Thread ids key per-session results in shared stores (see core/assessment_store.py), so truncating
+    them risks collisions.
+    """
+    return f'LQ-{prefix}_{str(uuid.uuid4())[:length]}'
+
+
+def generate_resume_key() -> str:
+    """
+    A new resume key: a random token the client keeps (e.g. in browser storage) to get back to its conversation.
+    """
+    return uuid.uuid4().hex
+
+
+def thread_id_for(resume_key: str) -> str:
+    """
+    The LangGraph thread id of the conversation behind `resume_key`. It is derived from the key alone,
+    so the same key reaches the same durable checkpoints after a page reload or a server restart.
+    """
+    return f"LQ-chat_{uuid.uuid5(uuid.NAMESPACE_URL, f'lexiquest:{resume_key}')}"
+
+
+class Session:
+    """
+    Everything one Gradio client needs to run its own conversation: its LangGraph thread,
+    the (shared) compiled graph serving it and the API key / LLM description that graph was built with.
+    """
+
+    def __init__(self, session_id: str, resume_key: Optional[str] = None):
+        self.session_id = session_id
+        self.resume_key = resume_key or generate_resume_key()
+        self.thread_id = thread_id_for(self.resume_key)
+        self.graph: Optional[Any] = None
+        self.api_key: Optional[str] = None
+        self.llm_info: str = "LLM: Not yet determined. Press 'Let's start!' or send a message."
+        self.last_access = time.monotonic()
+        self.lock = threading.Lock()
+
+    @property
+    def config(self) -> dict:
+        """LangGraph config addressing this session's thread."""
+        return {"configurable": {"thread_id": self.thread_id}}
+
+    def touch(self):
+        self.last_access = time.monotonic()
+
+
+class SessionRegistry:
+    """
+    Bounded registry of live sessions keyed by Gradio session id.
+
+    Sessions idle for longer than `idle_ttl` seconds are evicted, and when the registry is full the
+    least recently used session is evicted to make room. Evicting a session drops what was prepared
+    for it in the background and, with the in-memory checkpointer, its checkpoints, so memory does not
+    grow with the number of children that ever connected. Durable checkpoints are kept so the child can
+    resume with their resume key; the checkpointer's retention policy removes them eventually.
+
+    Agents are stateless, so graphs are compiled once per API key and shared by every session using
+    that key; sessions only differ by thread id.
+    """
+
+    def __init__(self, graph_factory: Callable[[Optional[str]], Tuple[Any, str]],
+                 capacity: int = Config.SESSION_CAPACITY, idle_ttl: float = Config.SESSION_IDLE_TTL):
+        """
+        :param graph_factory: Callable taking an API key and returning (compiled graph, LLM info string)
+        :param capacity: Maximum number of sessions kept alive at once
+        :param idle_ttl: Seconds of inactivity after which a session is evicted
+        """
+        self.graph_factory = graph_factory
+        self.capacity = capacity
+        self.idle_ttl = idle_ttl
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._graphs: Dict[Optional[str], Tuple[Any, str]] = {}
+        self._lock = threading.Lock()
+        self._graph_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, session_id: str) -> Session:
+        """
+        Returns the session for `session_id`, creating it (and evicting stale or LRU sessions) if needed.
+        """
+        with self._lock:
+            self._evict_expired()
+            session = self._sessions.get(session_id)
+            if session is None:
+                while len(self._sessions) >= self.capacity:
+                    _, lru_session = self._sessions.popitem(last=False)
+                    print(f"[SessionRegistry] Capacity reached, evicting LRU session {lru_session.session_id}")
+                    self._release(lru_session)
+                session = Session(session_id)
+                self._sessions[session_id] = session
+            else:
+                self._sessions.move_to_end(session_id)
+            session.touch()
+            return session
+
+    def resume(self, session_id: str, resume_key: str) -> Session:
+        """
+        Points the session at the conversation behind `resume_key` (e.g. the key stored by the client's
+        browser), so a reconnecting child picks up where they left off.
+
+        The key is only reused if its thread still has durable checkpoints and no other live session
+        (e.g. a second tab of the same browser) is using it. Otherwise the session keeps a fresh key, so a
+        new conversation never reuses an old thread id (and its assessment rows and export directory).
+        :return Session: The session; its `resume_key` is the one the client should store
+        """
+        session = self.get(session_id)
+        with self._lock:
+            in_use = any(other.resume_key == resume_key for sid, other in self._sessions.items() if sid != session_id)
+        with session.lock:
+            if session.resume_key == resume_key:
+                return session
+            if in_use:
+                print(f"[SessionRegistry] Resume key of session {session_id} is in use by another session, "
+                      f"starting a new conversation")
+            elif not self._resumable(thread_id_for(resume_key)):
+                print(f"[SessionRegistry] Nothing to resume for session {session_id}, starting a new conversation")
+            else:
+                self._drop_checkpoints(session)
+                session.resume_key = resume_key
+                session.thread_id = thread_id_for(resume_key)
+                print(f"[SessionRegistry] Session {session_id} resumes thread {session.thread_id}")
+        return session
+
+    @staticmethod
+    def _resumable(thread_id: str) -> bool:
+        """
+        Whether the thread has checkpoints that survive the session (the in-memory checkpointer's do not).
+        """
+        checkpointer = get_checkpointer()
+        if not getattr(checkpointer, "durable", False):
+            return False
+        try:
+            return checkpointer.get_tuple({"configurable": {"thread_id": thread_id}}) is not None
+        except Exception as e:
+            print(f"[SessionRegistry] Could not look up thread {thread_id}: {e}")
+            return False
+
+    def ensure_graph(self, session_id: str, api_key: Optional[str]) -> Session:
+        """
+        Returns the session attached to the graph for `api_key`. Changing the key only moves this
+        session to another graph; other sessions are unaffected.
+        """
+        session = self.get(session_id)
+        with session.lock:
+            if session.graph is None or session.api_key != api_key:
+                print(f"[SessionRegistry] Attaching session {session_id} (thread {session.thread_id}) to graph")
+                self._drop_checkpoints(session)
+                try:
+                    session.graph, llm_info = self._graph_for(api_key)
+                    session.llm_info = f"LLM: {llm_info} (Thread: {session.thread_id})"
+                    session.api_key = api_key
+                except Exception as e:
+                    print(f"Error initializing chat system: {e}")
+                    session.graph = None
+                    session.api_key = None
+                    session.llm_info = f"Error: {str(e)}. Check API key or Ollama."
+        return session
+
+    def _graph_for(self, api_key: Optional[str]) -> Tuple[Any, str]:
+        """
+        Returns the compiled graph for `api_key`, compiling it on first use.
+        """
+        with self._graph_lock:
+            if api_key not in self._graphs:
+                print("[SessionRegistry] Compiling graph for a new API key")
+                self._graphs[api_key] = self.graph_factory(api_key)
+            return self._graphs[api_key]
+
+    def reset(self, session_id: str) -> Session:
+        """
+        Starts a fresh conversation for the session under a new resume key (and so a new thread id).
+        """
+        session = self.get(session_id)
+        with session.lock:
+            self._drop_checkpoints(session)
+            session.graph = None
+            session.api_key = None
+            session.resume_key = generate_resume_key()
+            session.thread_id = thread_id_for(session.resume_key)
+        return session
+
+    def close(self, session_id: str):
+        """
+        Removes the session (e.g. when its browser tab is closed).
+        """
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self._release(session)
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        expired = [sid for sid, s in self._sessions.items() if now - s.last_access > self.idle_ttl]
+        for sid in expired:
+            print(f"[SessionRegistry] Evicting idle session {sid}")
+            self._release(self._sessions.pop(sid))
+
+    def _release(self, session: Session):
+        self._drop_checkpoints(session)
+        # Usage records stay in the JSONL sink; only the in-memory copy is dropped
+        USAGE.discard(session.thread_id)
+        session.graph = None
+
+    @staticmethod
+    def _drop_checkpoints(session: Session):
+        PREFETCH.discard(session.thread_id)
+        SUMMARIES.discard(session.thread_id)
+        # The conversation is over: its assessment plots are rendered in the background
+        ASSESSMENT_EXPORTS.finish(session.thread_id)
+        checkpointer = getattr(session.graph, "checkpointer", None)
+        # Durable threads outlive the session so it can be resumed; retention prunes them
+        if checkpointer is None or getattr(checkpointer, "durable", False):
+            return
+        try:
+            checkpointer.delete_thread(session.thread_id)
+        except Exception as e:
+            print(f"[SessionRegistry] Could not drop checkpoints for thread {session.thread_id}: {e}")
@@ -14,6 +14,9 @@ class NarrativeState(BaseModel):
     survey_conversation: List[AnyMessage] = Field(default_factory=list)
     survey_data: str = Field(default_factory=str, description="Survey data about the child")
     finished_survey: bool = False
+    # Older story turns folded into a running summary; only story[summarized_upto:] is sent verbatim
+    story_summary: str = ""
+    summarized_upto: int = 0
     # For challenge/narrative/assessment agent coordination
     next_triplet: Optional[Any] = None  # The current triplet to be used by the narrative agent
     used_triplets: Optional[list] = []  # List of all triplets that have been used
@@ -36,6 +39,11 @@ class AssessmentState(BaseModel):
     ceiling: bool = Field(default=False, description="Whether the stopping point has been reached or not")
     score_summary: dict = Field(default_factory=dict, description="Summary of the current challenge assessment scores")
     assessment_history: list = Field(default_factory=list, description="The history of evaluated student answers")
+    item_total_scores: List[int] = Field(default_factory=list, description="The total score of each assessed item, in order")
+
+
+# Number of control events kept in FullState.events
+MAX_EVENTS = 100
 
 
 class FullState(BaseModel):
@@ -53,10 +61,29 @@ class FullState(BaseModel):
     input_status: Optional[str] = None
     # For manager_router output
     next_agent: Optional[str] = None
+    # For the manager's routing rules: story turns since challenges were last requested
+    narrative_turns_since_challenge: int = 0
     # For assessment_agent input
     student_response: Optional[str] = None
     # For assessment_agent output
     assessment_feedback: Optional[str] = None
+    # Control-plane records (routing decisions, generated challenges, ...) kept out of full_history so they
+    # are not sent back to the LLMs verbatim; see record_event and recent_events
+    events: List[Dict[str, Any]] = Field(default_factory=list)
+
+    def record_event(self, agent: str, kind: str, summary: str, **data):
+        """
+        Appends a structured control event. `summary` is the one-line form shown to the manager LLM;
+        `data` holds the structured details. Only the last MAX_EVENTS events are kept.
+        """
+        self.events.append({"agent": agent, "kind": kind, "summary": summary, **data})
+        del self.events[:-MAX_EVENTS]
+
+    def recent_events(self, limit: int) -> List[str]:
+        """
+        Returns the summaries of the last `limit` events, oldest first.
+        """
+        return [event["summary"] for event in self.events[-limit:]] if limit > 0 else []
 
     def save_to_file(self, filename: str):
         """
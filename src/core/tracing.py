@@ -0,0 +1,197 @@
+import os
+import asyncio
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from core.config import Config
+
+# OpenTelemetry is opt-in (LQ_TRACING): nothing here imports it unless tracing is enabled.
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer():
+    """
+    Returns the LexiQuest tracer, setting up the OpenTelemetry SDK on first use, or None if tracing is off.
+
+    LQ_TRACING selects the exporter: "console" (stdout), "file" (one JSON span per line in LQ_TRACE_FILE)
+    or "otlp" (OTLP/HTTP, configured with the standard OTEL_EXPORTER_OTLP_* variables).
+    """
+    global _tracer
+    if not Config.TRACING:
+        return None
+    with _tracer_lock:
+        if _tracer is None:
+            from opentelemetry import trace
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+
+            if Config.TRACING == "console":
+                exporter = ConsoleSpanExporter()
+            elif Config.TRACING == "file":
+                exporter = ConsoleSpanExporter(out=open(Config.TRACE_FILE, "a", encoding="utf-8"),
+                                               formatter=lambda s: s.to_json(indent=None) + os.linesep)
+            elif Config.TRACING == "otlp":
+                from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+                exporter = OTLPSpanExporter()
+            else:
+                raise ValueError(f"Unknown LQ_TRACING exporter: {Config.TRACING!r}")
+
+            provider = TracerProvider(resource=Resource.create({"service.name": "lexiquest"}))
+            provider.add_span_processor(BatchSpanProcessor(exporter))
+            trace.set_tracer_provider(provider)
+            _tracer = trace.get_tracer("lexiquest")
+            print(f"[tracing] OpenTelemetry tracing enabled ({Config.TRACING})")
+    return _tracer
+
+
+def _attributes(attributes: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in attributes.items() if value is not None}
+
+
+@contextmanager
+def span(name: str, parent: Optional[str] = None, **attributes):
+    """
+    Context manager running its block in a span (a no-op when tracing is off).
+    :param parent: Optional W3C traceparent of the parent span, for work that crossed a thread or process boundary
+    """
+    tracer = get_tracer()
+    if tracer is None:
+        yield None
+        return
+    context = None
+    if parent:
+        from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
+        context = TraceContextTextMapPropagator().extract({"traceparent": parent})
+    with tracer.start_as_current_span(name, context=context, attributes=_attributes(attributes)) as current:
+        yield current
+
+
+def start_span(name: str, **attributes):
+    """
+    Starts a span that is not made current (for spans opened and closed across generator steps).
+    Returns None when tracing is off; end it with end_span().
+    """
+    tracer = get_tracer()
+    return tracer.start_span(name, attributes=_attributes(attributes)) if tracer is not None else None
+
+
+def end_span(current):
+    if current is not None:
+        current.end()
+
+
+def traceparent(current=None) -> Optional[str]:
+    """
+    Returns the W3C traceparent of `current` (or of the active span), so children can be attached to it elsewhere.
+    """
+    if get_tracer() is None:
+        return None
+    from opentelemetry import trace
+    from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
+    carrier = {}
+    context = trace.set_span_in_context(current) if current is not None else None
+    TraceContextTextMapPropagator().inject(carrier, context=context)
+    return carrier.get("traceparent")
+
+
+def with_traceparent(config: dict, current) -> dict:
+    """
+    Returns a copy of a LangGraph run config carrying the traceparent of `current` in its configurable,
+    which traced_node uses to parent node spans (the config itself if tracing is off).
+    """
+    parent = traceparent(current)
+    if parent is None:
+        return config
+    return {**config, "configurable": {**config.get("configurable", {}), "traceparent": parent}}
+
+
+def traced_node(name: str, func):
+    """
+    Wraps a graph node function (sync or async) in a "node <name>" span. The span is parented to the turn
+    span whose traceparent the chat handler put in the run's configurable, so a turn shows as one waterfall.
+    The wrapper always accepts `config` and only forwards it if `func` takes it.
+    """
+    import inspect
+    takes_config = "config" in inspect.signature(func).parameters
+
+    def parent_of(config) -> Optional[str]:
+        return ((config or {}).get("configurable") or {}).get("traceparent")
+
+    if asyncio.iscoroutinefunction(func):
+        async def async_node(state, config=None):
+            with span(f"node {name}", parent=parent_of(config), **{"langgraph.node": name}):
+                return await (func(state, config) if takes_config else func(state))
+        return async_node
+
+    def node(state, config=None):
+        with span(f"node {name}", parent=parent_of(config), **{"langgraph.node": name}):
+            return func(state, config) if takes_config else func(state)
+    return node
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    LangChain callback opening a child span for every chat model call, under the node span active when
+    the call started.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self._spans: Dict[UUID, Any] = {}
+        self._first_token_seen = set()
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages, *, run_id: UUID,
+                            metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        tracer = get_tracer()
+        if tracer is None:
+            return
+        params = kwargs.get("invocation_params") or {}
+        current = tracer.start_span("llm", attributes=_attributes({
+            "llm.model": params.get("model") or params.get("model_name"),
+            "langgraph.node": (metadata or {}).get("langgraph_node"),
+            "llm.messages": sum(len(batch) for batch in messages),
+        }))
+        with self._lock:
+            self._spans[run_id] = current
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            current = self._spans.get(run_id)
+            if current is None or run_id in self._first_token_seen:
+                return
+            self._first_token_seen.add(run_id)
+        current.add_event("first_token")
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            current = self._spans.pop(run_id, None)
+            self._first_token_seen.discard(run_id)
+        end_span(current)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            current = self._spans.pop(run_id, None)
+            self._first_token_seen.discard(run_id)
+        if current is not None:
+            current.record_exception(error)
+            current.end()
+
+
+TRACING_HANDLER = TracingCallbackHandler()
+
+
+def trace_model(llm):
+    """
+    Attaches the tracing handler to a chat model when tracing is enabled. Returns the model.
+    """
+    if Config.TRACING:
+        llm.callbacks = list(llm.callbacks or []) + [TRACING_HANDLER]
+    return llm
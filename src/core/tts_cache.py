@@ -0,0 +1,172 @@
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+
+from core.config import Config
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizes text before hashing so trivially different strings share one cache entry.
+    Case and punctuation are kept because they change the synthesized prosody.
+    """
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def cache_key(text: str, model_name: str, voice: str, samplerate: Optional[int]) -> str:
+    payload = "\x1f".join([normalize_text(text), model_name, voice, str(samplerate)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """
+    Content-addressed cache of synthesized speech.
+
+    Entries are keyed by the hash of (normalized text, model name, voice, sample rate). A bounded
+    in-memory LRU holds the most recently used float32 clips; every clip is also written to
+    `directory` as a .npy file, so evicted clips (and clips from earlier runs or from the pre-warm
+    command) are loaded from disk instead of being synthesized again.
+    """
+
+    def __init__(self, directory: Optional[str] = Config.TTS_CACHE_DIR, max_bytes: int = Config.TTS_CACHE_MAX_BYTES):
+        """
+        :param directory: Directory for the on-disk store, or None to keep the cache in memory only
+        :param max_bytes: Upper bound on the size of the clips held in memory
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            wav = self._memory.get(key)
+            if wav is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return wav
+
+        wav = self._read(key)
+        with self._lock:
+            if wav is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, wav)
+        return wav
+
+    def put(self, key: str, wav: np.ndarray):
+        wav = np.asarray(wav, dtype=np.float32)
+        with self._lock:
+            self._remember(key, wav)
+        self._write(key, wav)
+
+    def get_or_synthesize(self, key: str, synthesize) -> np.ndarray:
+        """
+        Returns the cached clip for `key`, calling `synthesize()` and caching its result on a miss.
+        """
+        wav = self.get(key)
+        if wav is None:
+            wav = np.asarray(synthesize(), dtype=np.float32)
+            self.put(key, wav)
+        return wav
+
+    def _remember(self, key: str, wav: np.ndarray):
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key).nbytes
+        self._memory[key] = wav
+        self._memory_bytes += wav.nbytes
+        while self._memory_bytes > self.max_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+
+    def _path(self, key: str) -> str:
+        # Shard by the first two hex digits to keep directories small
+        return os.path.join(self.directory, key[:2], f"{key}.npy")
+
+    def _read(self, key: str) -> Optional[np.ndarray]:
+        if not self.directory:
+            return None
+        try:
+            return np.load(self._path(key))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"[TTSCache] Ignoring unreadable cache entry {key}: {e}")
+            return None
+
+    def _write(self, key: str, wav: np.ndarray):
+        if not self.directory:
+            return
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temporary file first so readers never see a partial clip
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, wav)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[TTSCache] Could not write cache entry {key}: {e}")
+
+
+@lru_cache(maxsize=None)
+def get_tts_cache() -> Optional[TTSCache]:
+    """
+    Returns the process-wide TTS cache, or None if it is disabled with LQ_TTS_CACHE=0.
+    """
+    if not Config.TTS_CACHE:
+        return None
+    return TTSCache()
+
+
+if __name__ == "__main__":
+    import argparse
+    from core.audio_utils import get_tts_model, synthesize, SentenceSplitter
+    # synthesize() uses the cache of the imported module, not of this __main__ copy
+    from core.tts_cache import get_tts_cache
+
+    # Everything the app speaks is written by the LLM, so there is no built-in list: pass the fixed texts of
+    # a deployment (e.g. a scripted greeting) as arguments or in a file
+    parser = argparse.ArgumentParser(description="Pre-synthesize fixed phrases into the TTS cache.")
+    parser.add_argument("phrases", nargs="*", help="Phrases to synthesize")
+    parser.add_argument("--file", help="Text file with one phrase (or word) per line")
+    parser.add_argument("--model", default="tts_models/en/jenny/jenny", help="TTS model name")
+    args = parser.parse_args()
+
+    texts = list(args.phrases)
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            texts += [line.strip() for line in f if line.strip()]
+
+    # Speech is synthesized (and cached) sentence by sentence, so pre-warm the same units
+    phrases = []
+    for text in texts:
+        splitter = SentenceSplitter()
+        phrases += splitter.feed(text)
+        if remainder := splitter.flush():
+            phrases.append(remainder)
+
+    if not phrases:
+        parser.error("nothing to pre-warm: pass phrases or --file")
+
+    tts = get_tts_model(args.model)
+    cache = get_tts_cache()
+    for phrase in phrases:
+        synthesize(tts, phrase)
+    print(f"Pre-warmed {len(phrases)} phrases into {cache.directory if cache else 'nowhere (cache disabled)'} "
+          f"({cache.misses if cache else 0} newly synthesized)")
@@ -0,0 +1,286 @@
+import os
+import json
+import time
+import atexit
+import asyncio
+import threading
+import functools
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables.config import var_child_runnable_config
+
+from core.config import Config
+
+# What the current model call is for (e.g. "survey", "extraction"), set by the usage_label decorator
+_CALL_LABEL: ContextVar[Optional[str]] = ContextVar("lq_call_label", default=None)
+
+
+def usage_label(label: str):
+    """
+    Decorator tagging every model call made inside the decorated (sync or async) method with `label`,
+    so telemetry can tell apart calls made by the same agent.
+    """
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                token = _CALL_LABEL.set(label)
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    _CALL_LABEL.reset(token)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            token = _CALL_LABEL.set(label)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _CALL_LABEL.reset(token)
+        return wrapper
+    return decorator
+
+
+def current_usage_label() -> Optional[str]:
+    """
+    Returns the label of the innermost usage_label-decorated call being run, or None outside of one.
+    """
+    return _CALL_LABEL.get()
+
+
+@contextmanager
+def usage_thread(thread_id: Optional[str]):
+    """
+    Model calls made inside the block (e.g. by a background job, outside any graph run) carry `thread_id`
+    in their config metadata, as calls made by graph nodes do, so their usage is charged to that session.
+    """
+    parent = var_child_runnable_config.get() or {}
+    metadata = {**(parent.get("metadata") or {}), "thread_id": thread_id}
+    token = var_child_runnable_config.set({**parent, "metadata": metadata})
+    try:
+        yield
+    finally:
+        var_child_runnable_config.reset(token)
+
+
+def load_price_table(path: str = Config.COSTS_FILE) -> Dict[str, Dict[str, float]]:
+    """
+    Loads the model price table (USD per million input/output tokens), or an empty table if missing.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)["models"]
+    except (OSError, KeyError, ValueError) as e:
+        print(f"[usage] No price table loaded from {path}: {e}")
+        return {}
+
+
+class UsageTracker:
+    """
+    Collects one record per model call (tokens, latency, time to first token, estimated cost), tagged by
+    agent, call label, thread id and turn, and aggregates them per session.
+
+    Records are kept in memory per thread (for the UI and tests) and, if `sink_path` is set, appended
+    to a JSONL file. Appends are buffered and written in batches by a background worker, off the
+    request path.
+    """
+
+    def __init__(self, prices: Optional[Dict[str, Dict[str, float]]] = None, sink_path: Optional[str] = Config.USAGE_LOG,
+                 max_records_per_thread: int = 1000):
+        """
+        :param prices: Price table as returned by load_price_table (loaded from Config.COSTS_FILE if None)
+        :param sink_path: JSONL file every record is appended to, or None to keep records in memory only
+        :param max_records_per_thread: Records kept in memory for each thread
+        """
+        self.prices = load_price_table() if prices is None else prices
+        self.sink_path = sink_path
+        self.max_records_per_thread = max_records_per_thread
+        self._records: Dict[str, List[dict]] = defaultdict(list)
+        self._turns: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        # JSONL lines not written yet, and whether a write of them is already queued on the worker
+        self._sink_buffer: List[str] = []
+        self._sink_queued = False
+        self._sink_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="usage-sink")
+
+    def start_turn(self, thread_id: str) -> int:
+        """
+        Marks the start of a new conversation turn for the thread and returns its number.
+        """
+        with self._lock:
+            self._turns[thread_id] += 1
+            return self._turns[thread_id]
+
+    def estimate_cost(self, model: Optional[str], input_tokens: int, output_tokens: int) -> Optional[float]:
+        price = self.prices.get(model or "")
+        if price is None:
+            # Versioned model names (e.g. "gpt-3.5-turbo-0125") use the price of their base model
+            price = next((p for name, p in self.prices.items() if model and model.startswith(name)), None)
+        if price is None:
+            return None
+        return (input_tokens * price["input"] + output_tokens * price["output"]) / 1_000_000
+
+    def record(self, record: dict):
+        thread_id = record.get("thread_id") or "background"
+        with self._lock:
+            record["turn"] = self._turns.get(thread_id, 0)
+            records = self._records[thread_id]
+            records.append(record)
+            del records[:-self.max_records_per_thread]
+            if self.sink_path:
+                self._sink_buffer.append(json.dumps(record) + "\n")
+                if not self._sink_queued:
+                    self._sink_queued = True
+                    self._sink_executor.submit(self._write_sink)
+
+    def _write_sink(self):
+        with self._lock:
+            lines, self._sink_buffer = self._sink_buffer, []
+            self._sink_queued = False
+        if not lines:
+            return
+        try:
+            with open(self.sink_path, "a", encoding="utf-8") as f:
+                f.write("".join(lines))
+        except OSError as e:
+            print(f"[usage] Could not write {len(lines)} usage record(s): {e}")
+
+    def flush(self, timeout: Optional[float] = None):
+        """
+        Waits until every record so far has been written to the JSONL sink.
+        """
+        self._sink_executor.submit(self._write_sink).result(timeout)
+
+    def close(self):
+        """
+        Writes the remaining records (at interpreter exit).
+        """
+        self._sink_executor.shutdown(wait=True)
+        self._write_sink()
+
+    def records(self, thread_id: str) -> List[dict]:
+        with self._lock:
+            return list(self._records.get(thread_id, []))
+
+    def summary(self, thread_id: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Per-agent totals for a session: calls, tokens, latency, mean time to first token and estimated cost.
+        The "total" entry sums every agent.
+        """
+        summary: Dict[str, Dict[str, Any]] = {}
+        for record in self.records(thread_id):
+            for key in (record["agent"], "total"):
+                entry = summary.setdefault(key, {"calls": 0, "input_tokens": 0, "output_tokens": 0,
+                                                 "latency_s": 0.0, "ttft_s": [], "cost_usd": 0.0})
+                entry["calls"] += 1
+                entry["input_tokens"] += record["input_tokens"]
+                entry["output_tokens"] += record["output_tokens"]
+                entry["latency_s"] += record["latency_s"]
+                entry["cost_usd"] += record["cost_usd"] or 0.0
+                if record["ttft_s"] is not None:
+                    entry["ttft_s"].append(record["ttft_s"])
+        for entry in summary.values():
+            ttfts = entry.pop("ttft_s")
+            entry["mean_ttft_s"] = sum(ttfts) / len(ttfts) if ttfts else None
+        return summary
+
+    def discard(self, thread_id: str):
+        with self._lock:
+            self._records.pop(thread_id, None)
+            self._turns.pop(thread_id, None)
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """
+    LangChain callback recording every chat model call into a UsageTracker.
+
+    It is attached to the model itself (not to a run), so it also sees calls made outside a graph run,
+    e.g. background prefetch and summary jobs. The agent and thread are taken from the LangGraph run
+    metadata when the call happens inside a graph node; background jobs set the thread with usage_thread().
+    """
+
+    run_inline = True
+
+    def __init__(self, tracker: UsageTracker):
+        self.tracker = tracker
+        self._runs: Dict[UUID, dict] = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID,
+                            metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        metadata = metadata or {}
+        params = kwargs.get("invocation_params") or {}
+        with self._lock:
+            self._runs[run_id] = {
+                "start": time.perf_counter(),
+                "first_token": None,
+                "agent": metadata.get("langgraph_node") or "background",
+                "label": _CALL_LABEL.get(),
+                "thread_id": metadata.get("thread_id"),
+                "model": params.get("model") or params.get("model_name") or metadata.get("ls_model_name"),
+            }
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is not None and run["first_token"] is None:
+                run["first_token"] = time.perf_counter()
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        end = time.perf_counter()
+        input_tokens, output_tokens = self._token_counts(response)
+        model = (response.llm_output or {}).get("model_name") or run["model"]
+        self.tracker.record({
+            "timestamp": time.time(),
+            "thread_id": run["thread_id"],
+            "agent": run["agent"],
+            "label": run["label"],
+            "model": model,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "latency_s": round(end - run["start"], 4),
+            "ttft_s": round(run["first_token"] - run["start"], 4) if run["first_token"] else None,
+            "cost_usd": self.tracker.estimate_cost(model, input_tokens, output_tokens),
+        })
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            self._runs.pop(run_id, None)
+
+    @staticmethod
+    def _token_counts(response: LLMResult):
+        # Chat models report usage on the message; older integrations only in llm_output
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        return token_usage.get("prompt_tokens", 0), token_usage.get("completion_tokens", 0)
+
+
+# Process-wide tracker; attach USAGE_HANDLER to a model with track_usage()
+USAGE = UsageTracker()
+USAGE_HANDLER = UsageCallbackHandler(USAGE)
+atexit.register(USAGE.close)
+
+
+def track_usage(llm):
+    """
+    Attaches the usage handler to a chat model, so every call made with it (including structured-output
+    calls) is recorded. Returns the model for convenience.
+    """
+    llm.callbacks = list(llm.callbacks or []) + [USAGE_HANDLER]
+    return llm
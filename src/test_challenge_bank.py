@@ -0,0 +1,50 @@
+"""
+Checks of the challenge bank's theme extraction and theme matching (core/challenge_bank.py).
+Run from src/:
+    python -m pytest test_challenge_bank.py
+"""
+from core.challenge_bank import ChallengeBank, profile_from_survey
+from core.challenges import ChallengeTriplet
+from core.config import survey_results as default_survey_results
+
+
+def triplet(*words):
+    return ChallengeTriplet(triplet=list(words), pairings=[
+        {"words": list(words[:2]), "justification": f"{words[0]} and {words[1]} go together"},
+    ])
+
+
+def test_themes_come_from_survey_values():
+    band, themes = profile_from_survey("age: 8,\ninterests: space, cats,\nwants_to_be: astronaut,\n"
+                                       "favorite_color: blue,\nfavorite_food: pizza")
+    assert band == "7-8"
+    assert themes == ["space", "cats", "astronaut", "blue", "pizza"]
+
+
+def test_survey_key_names_are_not_themes():
+    for survey_data in (default_survey_results, str(default_survey_results)):
+        _, themes = profile_from_survey(survey_data)
+        assert "geology" in themes and "dinosaurs" in themes
+        assert not {"favorite", "color", "food", "animal", "book", "movie", "subject", "interests"} & set(themes)
+
+
+def test_name_and_unknown_age_are_not_themes():
+    band, themes = profile_from_survey("name: Sam, interests: dragons")
+    assert band == "any"
+    assert themes == ["dragons"]
+
+
+def test_take_requires_a_shared_theme(tmp_path):
+    bank = ChallengeBank(str(tmp_path / "bank.sqlite"))
+    _, dinosaur_themes = profile_from_survey(default_survey_results)
+    bank.add([triplet("fossil", "rock", "bone")], "7-8", dinosaur_themes)
+
+    _, space_themes = profile_from_survey("age: 8, interests: space, cats")
+    assert bank.take("triplet", "7-8", space_themes, 1) == []
+    assert bank.count("triplet", "7-8", space_themes) == 0
+    # The miss is recorded for the refill job, with the thread that missed
+    assert bank.misses() == [("triplet", "7-8", space_themes, None)]
+
+    served = bank.take("triplet", "7-8", dinosaur_themes, 1, thread_id="LQ-chat_test")
+    assert [c.triplet for c in served] == [["fossil", "rock", "bone"]]
+    assert bank.misses() == []
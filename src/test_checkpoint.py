@@ -0,0 +1,91 @@
+"""
+Checks of the SQLite checkpointer's prune and restore round-trips (core/checkpoint.py).
+Run from src/:
+    python -m pytest test_checkpoint.py
+"""
+import json
+import operator
+import time
+from typing import Annotated, List, TypedDict
+
+from langgraph.graph import END, START, StateGraph
+
+from core.checkpoint import SQLiteCheckpointSaver
+
+
+class CounterState(TypedDict):
+    count: int
+    log: Annotated[List[str], operator.add]
+
+
+def build_graph(saver: SQLiteCheckpointSaver):
+    def step(state: CounterState):
+        return {"count": state.get("count", 0) + 1, "log": [f"turn {state.get('count', 0) + 1}"]}
+
+    builder = StateGraph(CounterState)
+    builder.add_node("step", step)
+    builder.add_edge(START, "step")
+    builder.add_edge("step", END)
+    return builder.compile(checkpointer=saver)
+
+
+def config_for(thread_id: str):
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def test_state_survives_a_new_saver(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    graph = build_graph(SQLiteCheckpointSaver(path, keep_last=3))
+    for _ in range(5):
+        graph.invoke({"log": []}, config_for("t"))
+
+    # A fresh saver on the same file (e.g. after a restart) restores the latest state
+    restored = build_graph(SQLiteCheckpointSaver(path, keep_last=3)).get_state(config_for("t"))
+    assert restored.values["count"] == 5
+    assert restored.values["log"] == [f"turn {n}" for n in range(1, 6)]
+
+
+def test_prune_keeps_the_last_checkpoints_and_their_blobs(tmp_path):
+    saver = SQLiteCheckpointSaver(str(tmp_path / "checkpoints.sqlite"), keep_last=3)
+    graph = build_graph(saver)
+    for _ in range(5):
+        graph.invoke({"log": []}, config_for("t"))
+
+    assert len(list(saver.list(config_for("t")))) == 3
+    # Every blob left is referenced by a kept checkpoint, and every kept checkpoint has its blobs
+    referenced = set()
+    for (versions,) in saver.conn.execute("SELECT channel_versions FROM checkpoints WHERE thread_id = 't'"):
+        referenced.update(json.loads(versions).items())
+    stored = set(saver.conn.execute("SELECT channel, version FROM blobs WHERE thread_id = 't'").fetchall())
+    assert stored == referenced
+    # The oldest kept checkpoint still restores, from blobs possibly written several turns before it
+    oldest = list(saver.list(config_for("t")))[-1]
+    assert graph.get_state(oldest.config).values["count"] in (4, 5)
+
+
+def test_delete_thread_leaves_other_threads(tmp_path):
+    saver = SQLiteCheckpointSaver(str(tmp_path / "checkpoints.sqlite"), keep_last=3)
+    graph = build_graph(saver)
+    graph.invoke({"log": []}, config_for("a"))
+    graph.invoke({"log": []}, config_for("b"))
+
+    saver.delete_thread("a")
+    assert saver.get_tuple(config_for("a")) is None
+    for table in ("checkpoints", "blobs", "writes", "threads"):
+        assert saver.conn.execute(f"SELECT COUNT(*) FROM {table} WHERE thread_id = 'a'").fetchone()[0] == 0
+    assert graph.get_state(config_for("b")).values["count"] == 1
+
+
+def test_idle_threads_expire(tmp_path):
+    saver = SQLiteCheckpointSaver(str(tmp_path / "checkpoints.sqlite"), keep_last=3, retention=60)
+    graph = build_graph(saver)
+    graph.invoke({"log": []}, config_for("old"))
+    with saver.lock:
+        saver.conn.execute("UPDATE threads SET updated_at = ? WHERE thread_id = 'old'", (time.time() - 120,))
+        saver.conn.commit()
+    saver._expired_at = 0.0
+
+    # The next write to any thread deletes the idle one
+    graph.invoke({"log": []}, config_for("new"))
+    assert saver.get_tuple(config_for("old")) is None
+    assert graph.get_state(config_for("new")).values["count"] == 1
@@ -0,0 +1,81 @@
+"""
+Checks of the background artifact store (core/prefetch.py).
+Run from src/:
+    python -m pytest test_prefetch.py
+"""
+import threading
+
+from core.prefetch import PrefetchStore
+
+
+def wait_idle(store: PrefetchStore):
+    # Returns once every job queued so far has run (the stores here have a single worker)
+    store._executor.submit(lambda: None).result(5)
+
+
+def test_failed_job_leaves_nothing_behind():
+    store = PrefetchStore(max_workers=1)
+
+    def failing():
+        raise RuntimeError("model call failed")
+
+    assert store.submit("t", 1, failing)
+    wait_idle(store)
+    assert not store.has("t")
+    assert store.pop("t", "summary", timeout=0) is None
+    # The next turn retries, even with the same version
+    assert store.submit("t", 1, lambda: {"summary": "ok"})
+    wait_idle(store)
+    assert store.pop("t", "summary", timeout=1) == "ok"
+    assert not store.has("t")
+
+
+def test_failed_job_keeps_previous_artifacts():
+    store = PrefetchStore(max_workers=1)
+    store.submit("t", 1, lambda: {"survey_data": "v1"})
+    wait_idle(store)
+    store.submit("t", 2, lambda: 1 / 0)
+    wait_idle(store)
+    assert store.has("t")
+    assert store.pop("t", "survey_data", timeout=0) == "v1"
+
+
+def test_artifacts_are_served_as_they_are_ready():
+    store = PrefetchStore(max_workers=1)
+    release = threading.Event()
+
+    def job():
+        yield "survey_data", "data"
+        release.wait(5)
+        yield "challenges", ["triplet"]
+
+    store.submit("t", 1, job)
+    # The survey data does not wait for the challenges
+    assert store.pop("t", "survey_data", timeout=5) == "data"
+    assert store.pop("t", "challenges", timeout=0) is None
+    release.set()
+    assert store.pop("t", "challenges", timeout=5) == ["triplet"]
+    assert not store.has("t")
+
+
+def test_submissions_during_a_job_are_debounced():
+    store = PrefetchStore(max_workers=1)
+    release = threading.Event()
+    runs = []
+
+    def job(version):
+        def run():
+            runs.append(version)
+            release.wait(5)
+            return {"survey_data": version}
+        return run
+
+    for version in (3, 4, 5):
+        assert store.submit("t", version, job(version))
+    assert not store.submit("t", 5, job(5))
+    release.set()
+    wait_idle(store)
+    wait_idle(store)
+    # Only the first and the latest submissions ran
+    assert runs == [3, 5]
+    assert store.pop("t", "survey_data", min_version=5, timeout=0) == 5
@@ -0,0 +1,49 @@
+"""
+Checks of the local assessment pre-scorer (core/prescoring.py).
+Run from src/:
+    python -m pytest test_prescoring.py
+"""
+import pytest
+
+from core.prescoring import justification_similarity, lemma
+from core.config import Config
+
+
+@pytest.mark.parametrize("word, expected", [
+    ("bones", "bone"), ("flies", "fly"), ("gives", "give"), ("boxes", "box"),
+    ("pies", "pie"), ("ties", "tie"), ("news", "news"), ("glass", "glass"),
+    ("running", "run"), ("swimming", "swim"), ("jumping", "jump"), ("adding", "add"), ("falling", "fall"),
+    ("baked", "bake"), ("stopped", "stop"), ("cried", "cry"), ("agreed", "agree"), ("played", "play"),
+])
+def test_lemma(word, expected):
+    assert lemma(word) == expected
+
+
+def pair_lemmas(*words):
+    return [lemma(word) for word in words]
+
+
+@pytest.mark.parametrize("answer", [
+    "dogs hate bones",
+    "dogs do not like bones",
+    "dogs don't chew bones",
+    "dogs never chew bones",
+])
+def test_contradicting_justifications_are_not_similar(answer):
+    # Left to the model, never settled as correct
+    for expected in ("dogs like bones", "dogs chew bones"):
+        assert justification_similarity(answer, expected, pair_lemmas("dog", "bone")) < Config.PRESCORE_MIN_SIMILARITY
+
+
+def test_no_content_words_is_not_similar():
+    # Nothing beyond the paired words and stopwords: the surface match says nothing about meaning
+    assert justification_similarity("dogs like bones", "dogs like bones", pair_lemmas("dog", "bone")) == 0.0
+
+
+def test_matching_justification_is_similar():
+    similarity = justification_similarity("dogs chew on bones", "a dog chews bones", pair_lemmas("dog", "bone"))
+    assert similarity >= Config.PRESCORE_MIN_SIMILARITY
+
+
+def test_unrelated_justification_is_not_similar():
+    assert justification_similarity("dogs bury bones", "dogs chew bones", pair_lemmas("dog", "bone")) == 0.0